@@ -0,0 +1,231 @@
+import base64
+import binascii
+import json
+import math
+from functools import wraps
+from django.conf import settings
+from django.db.models import F
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from .matching import find_matches, index_ready, product_index
+from .models import Product
+from .search_cache import cached_search
+from .sites import SITES
+
+SEARCH_FIELDS = ('name', 'price', 'site', 'url', 'group', 'group_size')
+PRODUCT_FIELDS = ('id', 'name', 'url', 'site', 'image_url', 'latest_price', 'lowest_price')
+# Product fields that are annotations rather than columns
+PRICE_FIELDS = ('latest_price', 'lowest_price')
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Unavailable(Exception):
+    """
+    A temporary condition; answered with a 503 asking the client to retry
+    """
+    retry_after = 5
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, binascii.Error):
+        raise BadRequest("Invalid cursor")
+
+
+def is_number(value):
+    # JSON true/false decode to bools, which are ints to Python; json.loads
+    # also accepts NaN and Infinity, which compare false with everything
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def parse_fields(request, allowed):
+    """
+    The `fields` parameter (comma separated) as a tuple, defaulting to every allowed field
+    """
+    fields = [f for f in request.GET.get('fields', '').split(',') if f]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(fields) or allowed
+
+
+def parse_sites(request):
+    """
+    Sites from `site` parameters (repeated or comma separated), matched case-insensitively
+    """
+    names = {name.lower(): name for name in SITES}
+    sites = []
+    for value in request.GET.getlist('site'):
+        for site in filter(None, value.split(',')):
+            if site.lower() not in names:
+                raise BadRequest(f"Unknown site: {site}")
+            sites.append(names[site.lower()])
+    return sites
+
+
+def parse_price(request, name):
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+    # float() accepts "nan" and "inf", which would filter out everything or nothing
+    if not math.isfinite(price):
+        raise BadRequest(f"{name} must be a finite number")
+    return price
+
+
+def parse_limit(request):
+    default = getattr(settings, 'SAVED_PRODUCTS_PAGE_SIZE', 50)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    return max(1, min(limit, getattr(settings, 'API_MAX_PAGE_SIZE', 200)))
+
+
+def api_view(view):
+    """
+    Wrap a GET view returning a dict as JSON, turning BadRequest into a 400
+    and Unavailable into a 503
+    """
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return JsonResponse(view(request, *args, **kwargs))
+        except BadRequest as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        except Unavailable as e:
+            response = JsonResponse({'status': 'unavailable', 'message': str(e)}, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+    return wrapper
+
+
+@api_view
+def search(request):
+    """
+    Live search results as JSON, through the same cached pipeline as the home page.
+
+    Parameters: q (required), site, min_price, max_price, fields, limit and
+    cursor (the next_cursor of the previous page). Results are ordered by
+    price, then URL.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        raise BadRequest("Missing search query")
+    fields = parse_fields(request, SEARCH_FIELDS)
+    sites = parse_sites(request)
+    min_price = parse_price(request, 'min_price')
+    max_price = parse_price(request, 'max_price')
+    limit = parse_limit(request)
+
+    results = [
+        r for r in cached_search(query)
+        if (not sites or r['site'] in sites)
+        and (min_price is None or r['price'] >= min_price)
+        and (max_price is None or r['price'] <= max_price)
+    ]
+    results.sort(key=lambda r: (r['price'], r['url']))
+    cursor = request.GET.get('cursor')
+    if cursor:
+        after = decode_cursor(cursor)
+        if not (
+            isinstance(after, list) and len(after) == 2
+            and is_number(after[0]) and isinstance(after[1], str)
+        ):
+            raise BadRequest("Invalid cursor")
+        after = tuple(after)
+        results = [r for r in results if (r['price'], r['url']) > after]
+
+    page = results[:limit]
+    next_cursor = encode_cursor([page[-1]['price'], page[-1]['url']]) if len(results) > limit else None
+    return {
+        'results': [{field: r.get(field) for field in fields} for r in page],
+        'next_cursor': next_cursor,
+    }
+
+
+@api_view
+def products(request):
+    """
+    Saved products as JSON, newest first.
+
+    Parameters: site, min_price and max_price (on the latest price), fields,
+    limit and cursor. Prices come from PriceStats, which is only joined
+    when a price is requested or filtered on.
+    """
+    fields = parse_fields(request, PRODUCT_FIELDS)
+    sites = parse_sites(request)
+    min_price = parse_price(request, 'min_price')
+    max_price = parse_price(request, 'max_price')
+    limit = parse_limit(request)
+
+    columns = [f for f in fields if f not in PRICE_FIELDS]
+    queryset = Product.objects.order_by('-id').only('id', *columns)
+    if sites:
+        queryset = queryset.filter(site__in=sites)
+    if 'latest_price' in fields:
+        queryset = queryset.annotate(latest_price=F('price_stats__current_price'))
+    if 'lowest_price' in fields:
+        queryset = queryset.annotate(lowest_price=F('price_stats__min_365'))
+    if min_price is not None:
+        queryset = queryset.filter(price_stats__current_price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price_stats__current_price__lte=max_price)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        before = decode_cursor(cursor)
+        if not isinstance(before, int) or isinstance(before, bool):
+            raise BadRequest("Invalid cursor")
+        queryset = queryset.filter(id__lt=before)
+
+    page = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1].id) if len(page) > limit else None
+    return {
+        'results': [{field: getattr(product, field) for field in fields} for product in page[:limit]],
+        'next_cursor': next_cursor,
+    }
+
+
+@api_view
+def product_matches(request, product_id):
+    """
+    Saved products on other sites that look like the same item, with their
+    current prices, best match first. Answers 503 while the match index is
+    first being built, rather than an empty list.
+    """
+    product = get_object_or_404(Product, id=product_id)
+    limit = parse_limit(request)
+    product_index()
+    if not index_ready():
+        raise Unavailable("The product index is still being built")
+    matches = find_matches(product, limit=limit)
+    others = Product.objects.annotate(latest_price=F('price_stats__current_price')).in_bulk([pid for pid, _ in matches])
+    return {
+        'product': {'id': product.id, 'name': product.name, 'site': product.site},
+        'matches': [
+            {
+                'id': pid,
+                'name': others[pid].name,
+                'site': others[pid].site,
+                'url': others[pid].url,
+                'latest_price': others[pid].latest_price,
+                'score': round(score, 3),
+            }
+            for pid, score in matches
+            if pid in others
+        ],
+    }
@@ -0,0 +1,189 @@
+import hashlib
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from django.db import connection
+from .sites import SITES
+
+# Synthetic retailer pages used by the parser benchmark and adapter tests,
+# written by testdata/generate_pages.py
+FIXTURE_PAGES_DIR = Path(__file__).resolve().parent / 'testdata' / 'pages'
+
+
+def load_page(name):
+    """
+    Raw bytes of a fixture page, e.g. load_page('amazon_product')
+    """
+    return (FIXTURE_PAGES_DIR / f'{name}.html').read_bytes()
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Run the enclosed block against a throwaway test database so benchmarks never touch real data
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def measure(func, repeat=20, warmup=1, setup=None):
+    """
+    Call func repeatedly and return latency statistics in milliseconds;
+    `setup`, if given, runs untimed before every call
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+class StubSiteServer:
+    """
+    Local HTTP server standing in for the retailer sites, answering with the
+    fixture pages: /<site>/search?q=... gets the site's search page and
+    any other /<site>/... path its product page.
+
+    Every response waits `latency` seconds plus up to `jitter` more, and a
+    share `error_rate` of them fail with `error_status` instead. With
+    `validators`, pages carry an ETag and Last-Modified and a matching
+    If-None-Match or If-Modified-Since gets a 304.
+    """
+
+    # Last-Modified of every fixture page when `validators` is on
+    LAST_MODIFIED = 'Mon, 05 Jan 2026 00:00:00 GMT'
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, seed=42, validators=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.validators = validators
+        self.pages = {}
+        for adapter in SITES.values():
+            for kind in ('product', 'search'):
+                page = FIXTURE_PAGES_DIR / f'{adapter.name.lower()}_{kind}.html'
+                if page.exists():
+                    self.pages[(adapter.name.lower(), kind)] = page.read_bytes()
+        self.requests = 0
+        self.request_headers = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def product_url(self, site, n):
+        return f'{self.url}/{site.lower()}/product/{n}'
+
+    def search_url(self, site):
+        return f'{self.url}/{site.lower()}/search?q={{query}}'
+
+    def etag(self, page):
+        return '"%s"' % hashlib.sha256(page).hexdigest()[:16]
+
+    def page(self, path):
+        """
+        The fixture page a request path is answered with, or None
+        """
+        parts = path.lstrip('/').split('/')
+        kind = 'search' if len(parts) > 1 and parts[1].startswith('search') else 'product'
+        return self.pages.get((parts[0], kind))
+
+    def respond(self, path, headers=None):
+        """
+        (status, body) for a request path and its headers, after the injected latency
+        """
+        headers = headers or {}
+        with self.lock:
+            self.requests += 1
+            self.request_headers.append(dict(headers.items()))
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            return self.error_status, b'Injected error'
+        page = self.page(path)
+        if page is None:
+            return 404, b'Not Found'
+        if self.validators and (
+            headers.get('If-None-Match') == self.etag(page)
+            or headers.get('If-Modified-Since') == self.LAST_MODIFIED
+        ):
+            return 304, b''
+        return 200, page
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body = stub.respond(self.path, self.headers)
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if stub.validators and status in (200, 304):
+                    self.send_header('ETag', stub.etag(stub.page(self.path)))
+                    self.send_header('Last-Modified', stub.LAST_MODIFIED)
+                if status in (429, 503):
+                    self.send_header('Retry-After', '3')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextmanager
+def stub_sites(server):
+    """
+    Point every adapter's live search at the stub server for the enclosed block
+    """
+    original = {adapter: adapter.search_url for adapter in SITES.values()}
+    try:
+        for adapter in SITES.values():
+            if adapter.searchable:
+                adapter.search_url = server.search_url(adapter.name)
+        yield server
+    finally:
+        for adapter, search_url in original.items():
+            adapter.search_url = search_url
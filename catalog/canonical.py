@@ -0,0 +1,23 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+
+def canonical_url(url):
+    """
+    Normalize a product URL so trivially different spellings compare equal
+    (scheme/host case, default ports, fragments and trailing slashes)
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not (scheme, parts.port) in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+def url_digest(url):
+    """
+    SHA-256 hex digest of the canonical URL, used as the indexed lookup key for products
+    """
+    return hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
@@ -0,0 +1,122 @@
+import threading
+import time
+from django.conf import settings
+
+# Responses that mean a site is refusing us rather than a one-off error
+BLOCKED_STATUSES = {403, 429, 503}
+CAPTCHA_MARKERS = (b'/errors/validatecaptcha', b'type the characters you see', b'are you a human')
+
+
+class SiteUnavailable(Exception):
+    """
+    Raised instead of making a request to a site whose circuit is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for one site.
+
+    Closed: requests go through. After `threshold` consecutive failures, or
+    one blocked/captcha response, it opens and requests are refused for
+    `cooldown` seconds. Then it is half-open: a single probe request is let
+    through, which closes the circuit if it succeeds and reopens it with a
+    doubled cooldown (up to `max_cooldown`) if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, cooldown=60, max_cooldown=1800):
+        self.threshold = max(1, threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def _cooled_down(self, now):
+        return self.state == self.OPEN and now - self.opened_at >= self.cooldown
+
+    def available(self):
+        """
+        Whether a request would be let through right now, without claiming it
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN:
+                return not self.probing
+            return self._cooled_down(time.monotonic())
+
+    def allow(self):
+        """
+        Claim permission for one request; in half-open state only one probe is allowed
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self._cooled_down(time.monotonic()):
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.probing = False
+
+    def record_failure(self, blocked=False):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                # The probe failed: back off further before the next one
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self.state == self.CLOSED and (blocked or self.failures >= self.threshold):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def site_breaker(site):
+    """
+    Return the shared circuit breaker for a site, configured from the SCRAPE_BREAKER_* settings
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(site)
+        if breaker is None:
+            breaker = _breakers[site] = CircuitBreaker(
+                threshold=getattr(settings, 'SCRAPE_BREAKER_THRESHOLD', 5),
+                cooldown=getattr(settings, 'SCRAPE_BREAKER_COOLDOWN', 60),
+                max_cooldown=getattr(settings, 'SCRAPE_BREAKER_MAX_COOLDOWN', 1800),
+            )
+        return breaker
+
+
+def site_available(site):
+    return site_breaker(site).available()
+
+
+def is_blocked(response):
+    """
+    Whether a response is the site turning us away (rate limited, blocked or a captcha page)
+    """
+    if response.status_code in BLOCKED_STATUSES:
+        return True
+    head = response.content[:20000].lower()
+    return any(marker in head for marker in CAPTCHA_MARKERS)
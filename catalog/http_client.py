@@ -0,0 +1,128 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from .health import SiteUnavailable, is_blocked, site_breaker
+from .metrics import increment, observe_stage
+
+try:
+    import brotli  # noqa: F401 - lets urllib3 decode "br" responses
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# Statuses worth retrying: transient server errors. 429 and 503 mean the
+# site is turning us away (health.BLOCKED_STATUSES), so they go straight to
+# the circuit breaker instead of being retried.
+RETRY_STATUSES = (500, 502, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def build_session():
+    """
+    Create a keep-alive session with a bounded connection pool and retry/backoff
+    """
+    retry = Retry(
+        total=getattr(settings, 'SCRAPE_RETRIES', 2),
+        connect=getattr(settings, 'SCRAPE_RETRIES', 2),
+        read=1,
+        backoff_factor=getattr(settings, 'SCRAPE_RETRY_BACKOFF', 0.5),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        # A Retry-After of hours would otherwise hold the worker that long
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=getattr(settings, 'SCRAPE_POOL_SIZE', 10),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(site):
+    """
+    Return the shared session for a site, creating it on first use
+    """
+    with _sessions_lock:
+        session = _sessions.get(site)
+        if session is None:
+            session = _sessions[site] = build_session()
+        return session
+
+
+def fetch(url, site, timeout=10, headers=None, page='product'):
+    """
+    GET a page through the site's pooled session.
+
+    The outcome is recorded on the site's circuit breaker; while the circuit
+    is open this raises SiteUnavailable without making a request. Time to
+    the response headers and to the end of the body are recorded as the
+    'connect' and 'download' stages of a `page` fetch.
+    """
+    breaker = site_breaker(site)
+    if not breaker.allow():
+        raise SiteUnavailable(f"{site} is unavailable (circuit open)")
+    start = time.perf_counter()
+    try:
+        # Streamed so the body is read separately from connecting
+        response = get_session(site).get(url, headers=headers, timeout=timeout, stream=True)
+        headers_at = time.perf_counter()
+        observe_stage('connect', site, headers_at - start, page)
+        response.content
+        observe_stage('download', site, time.perf_counter() - headers_at, page)
+    except Exception:
+        increment('scrape_responses_total', site=site, status='error')
+        breaker.record_failure()
+        raise
+    record_metrics(site, response)
+    record_response(breaker, response)
+    return response
+
+
+def record_metrics(site, response):
+    """
+    Count a response (from requests or httpx) and its body size
+    """
+    increment('scrape_responses_total', site=site, status=response.status_code)
+    increment('scrape_response_bytes_total', len(response.content), site=site)
+
+
+def record_response(breaker, response):
+    """
+    Record a response (from requests or httpx) on a site's circuit breaker
+    """
+    if is_blocked(response):
+        breaker.record_failure(blocked=True)
+    elif response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def close_sessions():
+    """
+    Close every pooled session (e.g. at the end of a management command)
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,270 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db import IntegrityError
+from django.urls import reverse
+from .http_client import get_session
+from .models import CachedImage, Product
+
+try:
+    from PIL import Image, ImageOps
+    HAVE_PIL = True
+except ImportError:
+    HAVE_PIL = False
+
+# Cached file names: <content hash>-<thumbnail size>.<extension>
+FILE_NAME = re.compile(r'^([0-9a-f]{64})-([0-9]+)\.(jpg|png|gif|webp)$')
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+
+# Shown by the product image endpoint until the image is cached
+PLACEHOLDER = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="160" height="160" viewBox="0 0 160 160">'
+    b'<rect width="160" height="160" fill="#eee"/></svg>'
+)
+
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def cache_dir():
+    return Path(getattr(settings, 'IMAGE_CACHE_DIR', settings.BASE_DIR / 'image_cache'))
+
+
+def thumbnail_size():
+    return getattr(settings, 'IMAGE_THUMBNAIL_SIZE', 160)
+
+
+def image_url_hash(url):
+    # Not canonical_url: image URLs often carry meaningful query strings
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def file_name(content_hash, content_type):
+    """
+    Cache file name for an image: thumbnails are JPEG, originals (without
+    Pillow) keep their own format
+    """
+    ext = 'jpg' if HAVE_PIL else EXTENSIONS.get(content_type, 'jpg')
+    return f'{content_hash}-{thumbnail_size()}.{ext}'
+
+
+def file_path(name):
+    return cache_dir() / name[:2] / name
+
+
+def download_image(url):
+    """
+    Fetch an image, returning (bytes, content type), or None if it isn't
+    an http(s) image of at most IMAGE_MAX_BYTES.
+
+    Deliberately not through http_client.fetch: images come from the
+    retailers' CDN hosts, not the shop pages the site rate limits and
+    circuit breakers protect, and a failing image host shouldn't open a
+    site's circuit and stop its price refreshes. An image URL is fetched
+    once, after a successful refresh, and again only if it was pruned.
+    """
+    if urlsplit(url).scheme not in ('http', 'https'):
+        return None
+    max_bytes = getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+    try:
+        with get_session('images').get(url, timeout=10, stream=True) as response:
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if response.status_code != 200 or content_type not in EXTENSIONS:
+                return None
+            content = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                content += chunk
+                if len(content) > max_bytes:
+                    return None
+        return bytes(content), content_type
+    except Exception as e:
+        print(f"Image fetch error for {url}: {e}")
+        return None
+
+
+def make_thumbnail(content):
+    """
+    JPEG thumbnail no larger than IMAGE_THUMBNAIL_SIZE on either side
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    image.thumbnail((thumbnail_size(), thumbnail_size()))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue()
+
+
+def write_file(path, content):
+    """
+    Write atomically, so concurrent readers never see half a file
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def cached_name(url):
+    """
+    File name of the image at `url` if it's in the cache, without fetching it
+    """
+    entry = CachedImage.objects.filter(url_hash=image_url_hash(url)).first()
+    if entry is not None:
+        name = file_name(entry.content_hash, entry.content_type)
+        if file_path(name).exists():
+            return name
+    return None
+
+
+def cache_image(url):
+    """
+    Make sure the image at `url` is in the cache and return its file name,
+    or None if it can't be fetched. Each URL is downloaded once; an image
+    already cached under another URL isn't stored again. Without Pillow the
+    original image is cached instead of a thumbnail.
+    """
+    name = cached_name(url)
+    if name is not None:
+        return name
+    downloaded = download_image(url)
+    if downloaded is None:
+        return None
+    content, content_type = downloaded
+    content_hash = hashlib.sha256(content).hexdigest()
+    name = file_name(content_hash, content_type)
+    path = file_path(name)
+    if not path.exists():
+        try:
+            write_file(path, make_thumbnail(content) if HAVE_PIL else content)
+        except Exception as e:
+            print(f"Image thumbnail error for {url}: {e}")
+            return None
+        prune_if_due()
+    try:
+        CachedImage.objects.update_or_create(
+            url_hash=image_url_hash(url),
+            defaults={'url': url, 'content_hash': content_hash, 'content_type': content_type},
+        )
+    except IntegrityError:
+        # Another process cached the same URL at the same moment
+        pass
+    return name
+
+
+def cache_product_images(product_ids, workers=4):
+    """
+    Fetch the images of these products that aren't cached yet, `workers` at
+    a time; returns how many were added. scrape_prices calls this after
+    each pass, so pages never download images while serving a request.
+    """
+    urls = {
+        image_url_hash(url): url
+        for url in Product.objects.filter(id__in=list(product_ids)).exclude(image_url__isnull=True)
+        .exclude(image_url='').values_list('image_url', flat=True)
+    }
+    cached = {
+        entry.url_hash for entry in CachedImage.objects.filter(url_hash__in=list(urls))
+        if file_path(file_name(entry.content_hash, entry.content_type)).exists()
+    }
+    missing = [url for url_hash, url in urls.items() if url_hash not in cached]
+    if workers <= 1:
+        return sum(cache_image(url) is not None for url in missing)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image') as executor:
+        return sum(name is not None for name in executor.map(cache_image, missing))
+
+
+def open_cached(name):
+    """
+    Open a cached file for serving and mark it recently used; None if it
+    isn't cached
+    """
+    if not FILE_NAME.match(name):
+        return None
+    path = file_path(name)
+    # Serving counts as a use for LRU eviction; refresh the mtime at most hourly
+    now = time.time()
+    try:
+        if now - path.stat().st_mtime > getattr(settings, 'IMAGE_CACHE_TOUCH_INTERVAL', 3600):
+            os.utime(path, (now, now))
+        return path.open('rb')
+    except FileNotFoundError:
+        return None
+
+
+def content_type_for(name):
+    return CONTENT_TYPES[name.rsplit('.', 1)[1]]
+
+
+def thumbnail_urls(products):
+    """
+    Map product id to the URL of its image thumbnail: the cached file when
+    it's known, else the product's image endpoint, which redirects there
+    once scrape_prices has cached it. One query.
+    """
+    hashes = {product.id: image_url_hash(product.image_url) for product in products if product.image_url}
+    cached = {
+        entry.url_hash: file_name(entry.content_hash, entry.content_type)
+        for entry in CachedImage.objects.filter(url_hash__in=set(hashes.values()))
+    }
+    return {
+        product_id: (
+            reverse('cached_image', args=[cached[url_hash]]) if url_hash in cached
+            else reverse('product_image', args=[product_id])
+        )
+        for product_id, url_hash in hashes.items()
+    }
+
+
+def prune_image_cache(max_bytes=None):
+    """
+    Delete the least recently used cache files, and the CachedImage rows
+    pointing at them, until the cache is within 90% of
+    IMAGE_CACHE_MAX_BYTES; returns (files deleted, bytes left). The images
+    are fetched again on the next refresh of their products.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 500 * 1024 * 1024)
+    files = []
+    for path in cache_dir().glob('*/*'):
+        if FILE_NAME.match(path.name):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    deleted = []
+    if total > max_bytes:
+        files.sort()
+        for _, size, path in files:
+            if total <= max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            deleted.append(FILE_NAME.match(path.name).group(1))
+        CachedImage.objects.filter(content_hash__in=deleted).delete()
+    return len(deleted), total
+
+
+def prune_if_due():
+    """
+    Prune the cache at most every IMAGE_CACHE_PRUNE_INTERVAL seconds per process
+    """
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < getattr(settings, 'IMAGE_CACHE_PRUNE_INTERVAL', 300):
+            return
+        _last_prune = time.monotonic()
+    prune_image_cache()
@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from .canonical import url_digest
+from .models import Product, PriceHistory
+from .matching import index_products
+from .metrics import timed
+from .stats import record_prices
+from .utils import store_changes_only
+
+# Product fields refreshed from every successful page fetch
+PAGE_FIELDS = ['name', 'image_url', 'etag', 'last_modified', 'content_hash']
+
+
+class PriceIngestor:
+    """
+    Buffers scrape results and writes them in batches: one lookup, one
+    bulk_create/bulk_update for products and one bulk_create for price
+    history per batch, instead of ~3 round-trips per product.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.touched = {}
+
+    def add(self, url, site, name, price, image, etag='', last_modified='', content_hash=''):
+        """
+        Queue one scrape result; returns the rows written if this filled a batch
+        """
+        # A URL scraped twice in one batch keeps only its latest result
+        self.pending[url_digest(url)] = (url, site, price, {
+            'name': name,
+            'image_url': image,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+        })
+        return self.flush_if_full()
+
+    def touch(self, product, etag=None, last_modified=None):
+        """
+        Queue a product whose page hasn't changed since the last fetch: its
+        current price row is marked as seen again, and new validators saved
+        """
+        validators = {}
+        if etag is not None and etag != product.etag:
+            validators['etag'] = etag
+        if last_modified is not None and last_modified != product.last_modified:
+            validators['last_modified'] = last_modified
+        self.touched[product.id] = (product, validators)
+        return self.flush_if_full()
+
+    def flush_if_full(self):
+        if len(self.pending) + len(self.touched) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Write everything buffered and return a list of (product, price) for new prices
+        """
+        written = []
+        if not (self.pending or self.touched):
+            return written
+        with timed('db_write', 'all', 'batch'), transaction.atomic():
+            if self.pending:
+                batch, self.pending = self.pending, {}
+                written = self.write_prices(batch)
+            if self.touched:
+                touched, self.touched = self.touched, {}
+                self.write_touches(touched)
+        return written
+
+    def write_prices(self, batch):
+        products = Product.objects.in_bulk(list(batch), field_name='url_hash')
+
+        new_products = [
+            Product(url=url, url_hash=digest, site=site, **fields)
+            for digest, (url, site, price, fields) in batch.items()
+            if digest not in products
+        ]
+        if new_products:
+            Product.objects.bulk_create(new_products)
+            # Not every backend returns primary keys from bulk_create
+            products.update(Product.objects.in_bulk([p.url_hash for p in new_products], field_name='url_hash'))
+
+        changed = []
+        for digest, (url, site, price, fields) in batch.items():
+            product = products[digest]
+            if any(getattr(product, field) != value for field, value in fields.items()):
+                for field, value in fields.items():
+                    setattr(product, field, value)
+                changed.append(product)
+        if changed:
+            Product.objects.bulk_update(changed, PAGE_FIELDS)
+        # bulk_create/bulk_update don't send the signals that keep the match index current
+        index_products([products[digest] for digest in batch])
+
+        now = timezone.now()
+        latest = self.latest_prices([p.id for p in products.values()]) if store_changes_only() else {}
+        unchanged = []
+        new_rows = []
+        observations = {}
+        for digest, (url, site, price, fields) in batch.items():
+            product = products[digest]
+            row = latest.get(product.id)
+            if row is not None and row.price == price:
+                unchanged.append(row.id)
+            else:
+                new_rows.append(PriceHistory(product=product, price=price, last_seen_at=now))
+            observations[product.id] = price
+        if unchanged:
+            PriceHistory.objects.filter(id__in=unchanged).update(last_seen_at=now)
+        PriceHistory.objects.bulk_create(new_rows)
+        record_prices(observations, now=now)
+
+        return [(products[digest], row[2]) for digest, row in batch.items()]
+
+    def write_touches(self, touched):
+        now = timezone.now()
+        latest = self.latest_prices(list(touched))
+        if latest:
+            PriceHistory.objects.filter(id__in=[row.id for row in latest.values()]).update(last_seen_at=now)
+            record_prices({product_id: row.price for product_id, row in latest.items()}, now=now)
+
+        changed = []
+        for product, validators in touched.values():
+            if validators:
+                for field, value in validators.items():
+                    setattr(product, field, value)
+                changed.append(product)
+        if changed:
+            Product.objects.bulk_update(changed, ['etag', 'last_modified'])
+
+    def latest_prices(self, product_ids):
+        """
+        Map product id to its most recent PriceHistory row, in one query
+        """
+        latest_ids = (
+            PriceHistory.objects.filter(product=OuterRef('pk'))
+            .order_by('-checked_at', '-id')
+            .values('id')[:1]
+        )
+        rows = PriceHistory.objects.filter(
+            id__in=Product.objects.filter(id__in=product_ids).values(latest_id=Subquery(latest_ids))
+        )
+        return {row.product_id: row for row in rows}
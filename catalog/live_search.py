@@ -0,0 +1,246 @@
+import asyncio
+import json
+import time
+import weakref
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .health import SiteUnavailable, site_available, site_breaker
+from .http_client import DEFAULT_HEADERS, record_metrics, record_response
+from .local_search import local_results, merge_results, sites_to_scrape
+from .metrics import increment, observe_stage
+from .scraper import SEARCH_SITES, SEARCH_TIMEOUT, extract_search_page, finish_results, search_site
+from .search_cache import (
+    claim_search, get_search_cache, lock_timeout, normalize_query, release_search, results_ttl, search_cache_key,
+    search_lock_key, wait_timeout,
+)
+from .sites import get_adapter
+
+try:
+    import httpx
+    HAVE_HTTPX = True
+except ImportError:
+    HAVE_HTTPX = False
+
+# One pooled client per event loop (an httpx client can't be shared between loops)
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Return the shared httpx client for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=getattr(settings, 'SCRAPE_POOL_SIZE', 10) * len(SEARCH_SITES)),
+        )
+    return client
+
+
+async def search_site_async(site, search_term, timeout=SEARCH_TIMEOUT):
+    """
+    Search one site without blocking the event loop.
+
+    Fetches with httpx when it's installed (falling back to the pooled
+    requests session in a thread), and parses the page in a thread.
+    """
+    if not HAVE_HTTPX:
+        return await asyncio.to_thread(search_site, site, search_term, timeout)
+
+    adapter = get_adapter(site)
+    breaker = site_breaker(site)
+    if not breaker.allow():
+        raise SiteUnavailable(f"{site} is unavailable (circuit open)")
+    probe = breaker.state == breaker.HALF_OPEN
+    print(f"Scraping {site}...")
+    client = get_async_client()
+    request = client.build_request('GET', adapter.search_page_url(search_term), timeout=timeout)
+    start = time.perf_counter()
+    try:
+        response = await client.send(request, stream=True)
+        headers_at = time.perf_counter()
+        observe_stage('connect', site, headers_at - start, 'search')
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        observe_stage('download', site, time.perf_counter() - headers_at, 'search')
+    except asyncio.CancelledError:
+        # Missed the deadline or the browser went away. Like the threaded
+        # search, that isn't held against the site, except that a half-open
+        # probe has to finish one way or the other.
+        increment('scrape_results_total', site=site, page='search', status='cancelled')
+        if probe:
+            breaker.record_failure()
+        raise
+    except Exception:
+        increment('scrape_responses_total', site=site, status='error')
+        increment('scrape_results_total', site=site, page='search', status='failed')
+        breaker.record_failure()
+        raise
+    record_metrics(site, response)
+    record_response(breaker, response)
+    results = await asyncio.to_thread(extract_search_page, adapter, response.content)
+    print(f"Found {len(results)} {site} products")
+    increment('scrape_results_total', site=site, page='search', status='found' if results else 'empty')
+    return results
+
+
+async def stream_search(search_term, deadline=None, sites=None):
+    """
+    Search every available site (or those named in `sites`) concurrently,
+    yielding (site, results) as each one answers. Sites still running after
+    `deadline` seconds are cancelled.
+    """
+    if deadline is None:
+        deadline = getattr(settings, 'SEARCH_DEADLINE', 10)
+    timeout = min(SEARCH_TIMEOUT, deadline)
+    tasks = {
+        asyncio.ensure_future(search_site_async(site, search_term, timeout)): site
+        for site, _ in SEARCH_SITES
+        if (sites is None or site in sites) and site_available(site)
+    }
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=end - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                site = tasks[task]
+                try:
+                    results = task.result()
+                except Exception as e:
+                    print(f"{site} search failed: {e}")
+                    continue
+                yield site, results
+    finally:
+        for task in pending:
+            print(f"{tasks[task]} search missed the {deadline}s deadline")
+            task.cancel()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def search_events(query):
+    """
+    Server-Sent Events for a live search: a 'results' event with fresh
+    saved products, one with each live site's results as it answers, then
+    'done' with the full sorted list (served straight from the search cache
+    when it's there). Sites covered by saved products aren't scraped.
+
+    Concurrent identical searches are coalesced as in cached_search: one
+    stream scrapes, and the others wait for its results to reach the cache
+    and send only 'done'.
+    """
+    query = normalize_query(query)
+    cache = get_search_cache()
+    key = search_cache_key(query)
+    # Sent straight away so the browser knows the search has started
+    yield ": searching\n\n"
+
+    cached = await cache.aget(key)
+    if cached is not None:
+        yield sse('done', {'results': cached, 'partial': False})
+        return
+
+    event, leader = claim_search(key)
+    if not leader:
+        await wait_for_search(event, wait_timeout())
+        cached = await cache.aget(key)
+        if cached is not None:
+            yield sse('done', {'results': cached, 'partial': False})
+            return
+        # The leader failed or timed out; scrape on our own
+        async for chunk in scrape_events(query, cache, key):
+            yield chunk
+        return
+
+    try:
+        locked = await cache.aadd(search_lock_key(key), 1, timeout=lock_timeout())
+        if not locked:
+            cached = await poll_cache(cache, key, wait_timeout())
+            if cached is not None:
+                yield sse('done', {'results': cached, 'partial': False})
+                return
+        try:
+            async for chunk in scrape_events(query, cache, key):
+                yield chunk
+        finally:
+            if locked:
+                await cache.adelete(search_lock_key(key))
+    finally:
+        release_search(key, event)
+
+
+async def scrape_events(query, cache, key):
+    """
+    The events of a search that isn't cached: saved products, then live
+    sites, then 'done'; the results are stored in the cache under `key`
+    """
+    local = []
+    sites = None
+    finished_sites = []
+    if getattr(settings, 'LOCAL_SEARCH', True):
+        local = await sync_to_async(local_results)(query)
+        sites = sites_to_scrape(local)
+        finished_sites = [site for site, _ in SEARCH_SITES if site not in sites]
+        if local:
+            yield sse('results', {'site': 'saved products', 'results': local})
+
+    live = []
+    if sites is None or sites:
+        async for site, site_results in stream_search(query, sites=sites):
+            live.extend(site_results)
+            finished_sites.append(site)
+            yield sse('results', {'site': site, 'results': site_results})
+
+    results = finish_results(query, merge_results(local, live))
+    await cache.aset(key, results, timeout=results_ttl(finished_sites))
+    yield sse('done', {'results': results, 'partial': len(finished_sites) < len(SEARCH_SITES)})
+
+
+async def wait_for_search(event, timeout):
+    """
+    Wait up to `timeout` seconds for another request's search (its
+    SearchDone event) to finish, without holding a thread
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def finished():
+        if not done.done():
+            done.set_result(None)
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(finished)
+        except RuntimeError:
+            pass  # This request's loop has already closed
+
+    event.add_callback(notify)
+    try:
+        await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def poll_cache(cache, key, timeout):
+    """
+    Wait up to `timeout` seconds for another process to cache results under `key`
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while loop.time() < end:
+        results = await cache.aget(key)
+        if results is not None:
+            return results
+        await asyncio.sleep(0.1)
+    return None
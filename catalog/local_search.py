@@ -0,0 +1,137 @@
+import logging
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from .matching import product_index
+from .models import Product
+from .scraper import SEARCH_SITES, search_all_sites
+from .sites import get_adapter
+
+logger = logging.getLogger(__name__)
+
+# Words for a MySQL boolean-mode query; everything else (operators, quotes) is dropped
+FULLTEXT_WORD = re.compile(r'\w+')
+# InnoDB's default FULLTEXT stopwords (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD)
+FULLTEXT_STOPWORDS = frozenset({
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when',
+    'where', 'who', 'will', 'with', 'und', 'www',
+})
+
+
+def fulltext_words(query):
+    """
+    Split the words of `query` into (indexed, short): words the FULLTEXT
+    index holds, and words shorter than FULLTEXT_MIN_TOKEN_SIZE (InnoDB's
+    innodb_ft_min_token_size) that it doesn't. Stopwords are dropped. Only
+    indexed words can be required in boolean mode; requiring any other
+    word would match nothing.
+    """
+    minimum = getattr(settings, 'FULLTEXT_MIN_TOKEN_SIZE', 3)
+    indexed, short = [], []
+    for word in FULLTEXT_WORD.findall(query.lower()):
+        if word not in FULLTEXT_STOPWORDS:
+            (indexed if len(word) >= minimum else short).append(word)
+    return indexed, short
+
+
+def search_saved_products(query, limit=None):
+    """
+    Saved products whose names contain every word of `query`, most
+    relevant first, with their PriceStats loaded.
+
+    Uses the FULLTEXT index on Product.name under MySQL, and the
+    in-process title index (catalog.matching) on other databases, which
+    may still be filling up just after the process starts. Words too short
+    for the FULLTEXT index are checked against the matched names here, and
+    a query made only of such words goes to the in-process index.
+    """
+    if limit is None:
+        limit = getattr(settings, 'LOCAL_SEARCH_LIMIT', 50)
+    products = Product.objects.select_related('price_stats')
+    indexed, short = fulltext_words(query) if connection.vendor == 'mysql' else ([], [])
+    if indexed:
+        relevance = RawSQL(
+            'MATCH (catalog_product.name) AGAINST (%s IN BOOLEAN MODE)',
+            [' '.join(f'+{word}' for word in indexed)],
+        )
+        matches = products.annotate(relevance=relevance).filter(relevance__gt=0).order_by('-relevance')
+        if not short:
+            return list(matches[:limit])
+        found = []
+        for product in matches.iterator(chunk_size=limit):
+            if set(short) <= set(FULLTEXT_WORD.findall(product.name.lower())):
+                found.append(product)
+                if len(found) == limit:
+                    break
+        return found
+    ids = product_index().search(query, limit=limit)
+    found = products.in_bulk(ids)
+    return [found[product_id] for product_id in ids if product_id in found]
+
+
+def local_results(query, now=None):
+    """
+    Search results built from saved products whose price was confirmed by a
+    scrape within LOCAL_SEARCH_MAX_AGE seconds, at most each site's search
+    limit per site. Stale and never-priced matches are left out.
+    """
+    now = now or timezone.now()
+    fresh_since = now - timedelta(seconds=getattr(settings, 'LOCAL_SEARCH_MAX_AGE', 6 * 3600))
+    results = []
+    per_site = {}
+    for product in search_saved_products(query):
+        stats = getattr(product, 'price_stats', None)
+        if stats is None or stats.last_seen_at is None or stats.last_seen_at < fresh_since:
+            continue
+        adapter = get_adapter(product.site)
+        if adapter and per_site.get(product.site, 0) >= adapter.search_limit:
+            continue
+        per_site[product.site] = per_site.get(product.site, 0) + 1
+        results.append({
+            'name': product.name,
+            'price': stats.current_price,
+            'site': product.site,
+            'url': product.url,
+        })
+    return results
+
+
+def sites_to_scrape(results):
+    """
+    Live-searchable sites without at least LOCAL_SEARCH_MIN_RESULTS fresh local results
+    """
+    minimum = getattr(settings, 'LOCAL_SEARCH_MIN_RESULTS', 3)
+    counts = {}
+    for result in results:
+        counts[result['site']] = counts.get(result['site'], 0) + 1
+    return [site for site, _ in SEARCH_SITES if counts.get(site, 0) < minimum]
+
+
+def merge_results(local, live):
+    """
+    Local results plus live ones, a live result replacing a local one for the same URL
+    """
+    live_urls = {result['url'] for result in live}
+    return [result for result in local if result['url'] not in live_urls] + list(live)
+
+
+def search_with_local(query, deadline=None):
+    """
+    Answer a search from fresh saved products where they cover a site, and
+    scrape only the other sites live. Returns (results, finished_sites) like
+    search_all_sites, counting sites answered locally as finished.
+    """
+    if not getattr(settings, 'LOCAL_SEARCH', True):
+        return search_all_sites(query, deadline=deadline)
+    local = local_results(query)
+    sites = sites_to_scrape(local)
+    finished_sites = [site for site, _ in SEARCH_SITES if site not in sites]
+    if not sites:
+        logger.info("Answered %r from saved products", query)
+        return local, finished_sites
+    live, live_sites = search_all_sites(query, deadline=deadline, sites=sites)
+    return merge_results(local, live), finished_sites + live_sites
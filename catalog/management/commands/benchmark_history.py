@@ -0,0 +1,135 @@
+import json
+import random
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from catalog.benchmarks import benchmark_database, measure
+from catalog.canonical import url_digest
+from catalog.models import Product, PriceHistory, PriceAlert
+
+
+class Command(BaseCommand):
+    help = "Benchmark price history access paths with and without the composite indexes (uses a throwaway test database)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Price history rows to generate.")
+        parser.add_argument("--products", type=int, default=1000, help="Products to spread the rows over.")
+        parser.add_argument("--repeat", type=int, default=50, help="Timed runs per query.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file as JSON.")
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        with benchmark_database():
+            self.populate(options["products"], options["rows"])
+            product_ids = list(Product.objects.values_list("id", flat=True))
+            urls = list(Product.objects.values_list("url", flat=True))
+
+            results = {"rows": options["rows"], "products": options["products"], "vendor": connection.vendor}
+            results["indexed"] = self.run_queries(product_ids, urls, options["repeat"], indexed=True)
+            self.drop_indexes()
+            results["unindexed"] = self.run_queries(product_ids, urls, options["repeat"], indexed=False)
+            self.restore_indexes()
+
+        self.report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def populate(self, product_count, row_count):
+        self.stdout.write(f"Generating {product_count} products and {row_count} price history rows...")
+        products = []
+        for i in range(product_count):
+            url = f"https://www.amazon.in/dp/BENCH{i:06d}"
+            products.append(Product(name=f"Benchmark product {i}", url=url, url_hash=url_digest(url), site="Amazon"))
+        Product.objects.bulk_create(products, batch_size=1000)
+        product_ids = list(Product.objects.values_list("id", flat=True))
+
+        # Raw inserts: checked_at is auto_now_add, which bulk_create would overwrite
+        now = timezone.now()
+        sql = (
+            f"INSERT INTO {PriceHistory._meta.db_table} (product_id, price, checked_at, last_seen_at) "
+            f"VALUES (%s, %s, %s, %s)"
+        )
+        batch = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            for i in range(row_count):
+                checked_at = now - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+                batch.append((random.choice(product_ids), round(random.uniform(100, 100000), 2), checked_at, checked_at))
+                if len(batch) == 10000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+        from django.contrib.auth.models import User
+        user = User.objects.create_user("benchmark", "benchmark@example.com", "benchmark")
+        PriceAlert.objects.bulk_create(
+            [PriceAlert(user=user, product_id=pid, target_price=500, notified=bool(i % 3)) for i, pid in enumerate(product_ids)],
+            batch_size=1000,
+        )
+
+    def queries(self, indexed):
+        year_ago = timezone.now() - timedelta(days=365)
+        return {
+            "latest_price": lambda pid, url: PriceHistory.objects.filter(product_id=pid).order_by("-checked_at")[:1],
+            "lowest_365_days": lambda pid, url: (
+                PriceHistory.objects.filter(product_id=pid, last_seen_at__gte=year_ago)
+                .order_by().values("product").annotate(min_price=Min("price"))
+            ),
+            "pending_alerts": lambda pid, url: PriceAlert.objects.filter(product_id=pid, notified=False),
+            # Before the migration the only way in was the unindexed url column
+            "product_by_url": (
+                (lambda pid, url: Product.objects.filter(url_hash=url_digest(url)))
+                if indexed else
+                (lambda pid, url: Product.objects.filter(url=url))
+            ),
+        }
+
+    def run_queries(self, product_ids, urls, repeat, indexed):
+        label = "indexed" if indexed else "unindexed"
+        results = {}
+        for name, build in self.queries(indexed).items():
+            plan = build(product_ids[0], urls[0]).explain()
+
+            def run():
+                i = random.randrange(len(product_ids))
+                list(build(product_ids[i], urls[i]))
+
+            results[name] = {"plan": plan, **measure(run, repeat=repeat)}
+            self.stdout.write(f"[{label}] {name}: median {results[name]['median_ms']} ms")
+        return results
+
+    def index_targets(self):
+        return [
+            (PriceHistory, index) for index in PriceHistory._meta.indexes
+        ] + [
+            (PriceAlert, index) for index in PriceAlert._meta.indexes
+        ]
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, index in self.index_targets():
+                editor.remove_index(model, index)
+
+    def restore_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, index in self.index_targets():
+                editor.add_index(model, index)
+
+    def report(self, results):
+        self.stdout.write("")
+        self.stdout.write(f"{'query':<18}{'unindexed ms':>14}{'indexed ms':>12}{'speedup':>10}")
+        for name, indexed in results["indexed"].items():
+            unindexed = results["unindexed"][name]
+            speedup = unindexed["median_ms"] / indexed["median_ms"] if indexed["median_ms"] else float("inf")
+            self.stdout.write(f"{name:<18}{unindexed['median_ms']:>14}{indexed['median_ms']:>12}{speedup:>9.1f}x")
+        self.stdout.write(
+            "\n'unindexed' drops only the composite indexes: price history keeps the index on its "
+            "product_id foreign key, as before they were added, so it is not a full table scan."
+        )
+        for label in ("unindexed", "indexed"):
+            self.stdout.write(f"\nQuery plans ({label}):")
+            for name, data in results[label].items():
+                self.stdout.write(f"  {name}:\n    " + data["plan"].replace("\n", "\n    "))
@@ -0,0 +1,64 @@
+import json
+import tracemalloc
+from django.core.management.base import BaseCommand
+from catalog.benchmarks import load_page, measure
+from catalog.parsing import available_backends, parse_html
+from catalog.sites import SITES
+
+# Fixture page -> elements its adapter needs (the strainer selectors)
+PAGES = {}
+for adapter in SITES.values():
+    PAGES[f'{adapter.name.lower()}_product'] = adapter.product_parts
+    if adapter.searchable:
+        PAGES[f'{adapter.name.lower()}_search'] = adapter.search_parts
+
+
+class Command(BaseCommand):
+    help = "Compare HTML parse time and memory per parser backend on the synthetic fixture pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Timed parses per page and backend.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file as JSON.")
+
+    def handle(self, *args, **options):
+        modes = []
+        for backend in available_backends():
+            modes.append((backend, False))
+            if backend != "selectolax":
+                modes.append((backend, True))
+
+        results = []
+        for page, parts in PAGES.items():
+            content = load_page(page)
+            for backend, strained in modes:
+                only = parts if strained else None
+                timing = measure(lambda: parse_html(content, only=only, backend=backend), repeat=options["repeat"])
+                results.append({
+                    "page": page,
+                    "bytes": len(content),
+                    "backend": backend,
+                    "strained": strained,
+                    "peak_kb": self.peak_memory_kb(content, only, backend),
+                    **timing,
+                })
+
+        self.stdout.write(f"{'page':<18}{'backend':<13}{'strained':<10}{'median ms':>10}{'p95 ms':>9}{'peak KB':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['page']:<18}{row['backend']:<13}{str(row['strained']):<10}"
+                f"{row['median_ms']:>10}{row['p95_ms']:>9}{row['peak_kb']:>9}"
+            )
+        self.stdout.write("Peak KB is Python heap only (tracemalloc); C parsers' own buffers are not included.")
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def peak_memory_kb(self, content, only, backend):
+        tracemalloc.start()
+        try:
+            document = parse_html(content, only=only, backend=backend)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        del document
+        return round(peak / 1024)
@@ -0,0 +1,234 @@
+import io
+import json
+import platform
+import subprocess
+from contextlib import redirect_stdout
+from itertools import count
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from catalog import health, throttle
+from catalog.benchmarks import StubSiteServer, benchmark_database, measure, stub_sites
+from catalog.canonical import url_digest
+from catalog.http_client import close_sessions
+from catalog.models import PriceHistory, PriceStats, Product
+from catalog.scraper import search_and_scrape
+from catalog.sites import SITES
+from catalog.utils import update_product_price
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark live search, single-product updates, a full scrape_prices run and home page rendering "
+        "against a local stub of the retailer sites (uses a throwaway test database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000", help="Saved product counts to render the home page at.")
+        parser.add_argument("--scrape-products", type=int, default=200, help="Products refreshed by the scrape_prices run.")
+        parser.add_argument("--workers", type=int, default=8, help="Workers for the scrape_prices run.")
+        parser.add_argument("--repeat", type=int, default=10, help="Timed runs per benchmark (3 at most for scrape_prices).")
+        parser.add_argument("--latency-ms", type=float, default=50.0, help="Delay the stub server adds to every response.")
+        parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random delay of up to this much per response.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub responses (0..1) that fail with HTTP 500.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file as JSON.")
+        parser.add_argument("--compare", help="Earlier --json output to compare medians against.")
+        parser.add_argument(
+            "--tolerance", type=float, default=20.0,
+            help="With --compare, fail if a median got more than this many percent slower.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options["sizes"].split(",") if size)
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        server = StubSiteServer(
+            latency=options["latency_ms"] / 1000,
+            jitter=options["jitter_ms"] / 1000,
+            error_rate=options["error_rate"],
+        )
+        # No rate limits and no circuit breakers: measure the code, not the politeness
+        benchmark_settings = override_settings(
+            SCRAPE_RATE_LIMITS={},
+            SCRAPE_DEFAULT_RATE_LIMIT=(1_000_000, 1_000_000),
+            SCRAPE_BREAKER_THRESHOLD=1_000_000,
+            # The fixture pages link real retailer images
+            IMAGE_CACHE_ON_REFRESH=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        self.results = []
+        with benchmark_database(), server, stub_sites(server), benchmark_settings:
+            self.reset_clients()
+            try:
+                self.bench_search(options["repeat"])
+                self.bench_update_product(server, options["repeat"])
+                self.bench_scrape_prices(server, options["scrape_products"], options["workers"], min(options["repeat"], 3))
+                for size in sizes:
+                    self.bench_home(server, size, options["repeat"])
+            finally:
+                self.reset_clients()
+
+        report = {"meta": self.meta(options, server), "results": self.results}
+        self.report()
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+        if options["compare"]:
+            self.compare(options["compare"], options["tolerance"])
+
+    def reset_clients(self):
+        # Shared sessions, rate limiters and breakers pick up the settings in force when created
+        close_sessions()
+        throttle._buckets.clear()
+        health._breakers.clear()
+
+    def record(self, benchmark, timing, **extra):
+        row = {"benchmark": benchmark, **extra, **timing}
+        self.results.append(row)
+        self.stdout.write(f"  median {row['median_ms']} ms, p95 {row['p95_ms']} ms")
+
+    def bench_search(self, repeat):
+        self.stdout.write("Live search (search_and_scrape)...")
+        with redirect_stdout(io.StringIO()):
+            timing = measure(lambda: search_and_scrape("phone"), repeat=repeat)
+        self.record("search_and_scrape", timing)
+
+    def bench_update_product(self, server, repeat):
+        self.stdout.write("Single product update (update_product_price)...")
+        numbers = count()
+        with redirect_stdout(io.StringIO()):
+            timing = measure(lambda: update_product_price(server.product_url("Amazon", next(numbers)), "Amazon"), repeat=repeat)
+        self.record("update_product_price", timing)
+
+    def bench_scrape_prices(self, server, product_count, workers, repeat):
+        """
+        Time full scrape_prices runs twice: with the saved validators and
+        fragment hashes cleared before each run, so every page is parsed and
+        extracted, then as repeat runs where every page comes back unchanged
+        """
+        sites = list(SITES)
+        urls = [server.product_url(sites[i % len(sites)], f"scrape-{i}") for i in range(product_count)]
+        Product.objects.bulk_create([
+            Product(name=f"Benchmark product {i}", url=url, url_hash=url_digest(url), site=sites[i % len(sites)])
+            for i, url in enumerate(urls)
+        ])
+        product_count = Product.objects.count()
+
+        def scrape():
+            call_command("scrape_prices", workers=workers, stdout=io.StringIO())
+
+        def forget_pages():
+            Product.objects.update(etag="", last_modified="", content_hash="")
+
+        runs = (
+            ("scrape_prices", forget_pages, "every page parsed"),
+            ("scrape_prices_unchanged", None, "every page unchanged since the last run"),
+        )
+        for benchmark, setup, description in runs:
+            self.stdout.write(
+                f"Full scrape_prices run over {product_count} products with {workers} workers, {description}..."
+            )
+            requests_before = server.requests
+            timing = measure(scrape, repeat=repeat, warmup=0, setup=setup)
+            requests = (server.requests - requests_before) / repeat
+            self.record(
+                benchmark, timing, products=product_count, workers=workers,
+                products_per_second=round(product_count / (timing["median_ms"] / 1000), 1),
+                requests_per_run=round(requests),
+            )
+
+    def bench_home(self, server, size, repeat):
+        self.populate(server, size)
+        self.stdout.write(f"Home page with {size} saved products...")
+        client = Client()
+        url = reverse("home")
+
+        def render():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f"Home page returned HTTP {response.status_code}")
+
+        self.record("home", measure(render, repeat=repeat), products=size)
+
+    def populate(self, server, size):
+        """
+        Top the saved products up to `size`, each with one price and its PriceStats
+        """
+        missing = size - Product.objects.count()
+        if missing <= 0:
+            return
+        self.stdout.write(f"Generating {missing} products...")
+        now = timezone.now()
+        start = Product.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        for offset in range(0, missing, 5000):
+            batch = range(start + offset, start + min(offset + 5000, missing))
+            urls = [server.product_url("Amazon", f"home-{i}") for i in batch]
+            Product.objects.bulk_create([
+                Product(name=f"Benchmark product {i}", url=url, url_hash=url_digest(url), site="Amazon")
+                for i, url in zip(batch, urls)
+            ])
+            products = Product.objects.in_bulk([url_digest(url) for url in urls], field_name="url_hash")
+            prices = {product.id: float(100 + product.id % 1000) for product in products.values()}
+            PriceHistory.objects.bulk_create([
+                PriceHistory(product_id=product_id, price=price, last_seen_at=now)
+                for product_id, price in prices.items()
+            ])
+            PriceStats.objects.bulk_create([
+                PriceStats(
+                    product_id=product_id, current_price=price, last_changed_at=now, last_seen_at=now,
+                    min_365=price, min_365_seen_at=now, min_30=price, min_30_seen_at=now,
+                )
+                for product_id, price in prices.items()
+            ])
+
+    def meta(self, options, server):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except OSError:
+            commit = ""
+        return {
+            "timestamp": timezone.now().isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "vendor": connection.vendor,
+            "latency_ms": options["latency_ms"],
+            "jitter_ms": options["jitter_ms"],
+            "error_rate": options["error_rate"],
+            "stub_requests": server.requests,
+        }
+
+    def report(self):
+        self.stdout.write(f"{'benchmark':<26}{'products':>10}{'median ms':>12}{'p95 ms':>10}{'max ms':>10}")
+        for row in self.results:
+            self.stdout.write(
+                f"{row['benchmark']:<26}{row.get('products', ''):>10}"
+                f"{row['median_ms']:>12}{row['p95_ms']:>10}{row['max_ms']:>10}"
+            )
+
+    def compare(self, path, tolerance):
+        """
+        Compare medians with an earlier run, failing on regressions beyond `tolerance` percent
+        """
+        with open(path) as f:
+            baseline = {(row["benchmark"], row.get("products")): row for row in json.load(f)["results"]}
+        regressions = []
+        for row in self.results:
+            before = baseline.get((row["benchmark"], row.get("products")))
+            if before is None or not before["median_ms"]:
+                continue
+            change = (row["median_ms"] - before["median_ms"]) / before["median_ms"] * 100
+            name = row["benchmark"] if "products" not in row else f"{row['benchmark']} ({row['products']} products)"
+            self.stdout.write(f"{name}: {change:+.1f}% vs baseline")
+            if change > tolerance:
+                regressions.append(f"{name} {change:+.1f}%")
+        if regressions:
+            raise CommandError(f"Slower than {path} by more than {tolerance:g}%: {', '.join(regressions)}")
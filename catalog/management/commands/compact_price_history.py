@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.models import Product, PriceHistory
+
+
+class Command(BaseCommand):
+    help = "Collapse runs of unchanged prices in price history into single rows (change-only storage)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed without changing anything.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        total_rows = 0
+        total_removed = 0
+        for product_id in Product.objects.values_list("id", flat=True).iterator():
+            rows, removed = self.compact_product(product_id, dry_run)
+            total_rows += rows
+            total_removed += removed
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total_removed} of {total_rows} price history rows."))
+
+    @transaction.atomic
+    def compact_product(self, product_id, dry_run):
+        """
+        Keep the first row of each run of equal prices, stretched to the run's last sighting
+        """
+        rows = list(
+            PriceHistory.objects.filter(product_id=product_id)
+            .order_by("checked_at", "id")
+            .only("id", "price", "checked_at", "last_seen_at")
+        )
+        current = None
+        stretched = {}
+        remove = []
+        for row in rows:
+            if current is not None and current.price == row.price:
+                if row.last_seen_at > current.last_seen_at:
+                    current.last_seen_at = row.last_seen_at
+                    stretched[current.id] = current
+                remove.append(row.id)
+            else:
+                current = row
+
+        if remove and not dry_run:
+            PriceHistory.objects.bulk_update(list(stretched.values()), ["last_seen_at"], batch_size=500)
+            for i in range(0, len(remove), 500):
+                PriceHistory.objects.filter(id__in=remove[i:i + 500]).delete()
+        return len(rows), len(remove)
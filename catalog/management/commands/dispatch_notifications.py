@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog.notifications import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued notification emails from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Emails sent per mail connection.")
+        parser.add_argument("--loop", action="store_true", help="Keep running and poll the outbox for new emails.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to wait between polls when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = dispatch_outbox(batch_size=options["batch_size"])
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed."))
+            if not options["loop"]:
+                break
+            if not sent and not failed:
+                time.sleep(options["interval"])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from catalog.images import prune_image_cache
+
+
+class Command(BaseCommand):
+    help = "Evict the least recently served product images until the cache is within IMAGE_CACHE_MAX_BYTES."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-mb", type=float, help="Size limit to prune to, instead of IMAGE_CACHE_MAX_BYTES.")
+
+    def handle(self, *args, **options):
+        max_bytes = int(options["max_mb"] * 1024 * 1024) if options["max_mb"] is not None else None
+        deleted, remaining = prune_image_cache(max_bytes)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} cached image(s); {remaining / (1024 * 1024):.1f} MB left."
+        ))
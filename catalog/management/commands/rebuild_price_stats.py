@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from catalog.stats import rebuild_price_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-product price statistics (PriceStats) from price history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int, help="Only rebuild these products.")
+
+    def handle(self, *args, **options):
+        count = rebuild_price_stats(options["product_ids"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt price statistics for {count} product(s)."))
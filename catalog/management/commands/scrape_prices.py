@@ -1,18 +1,208 @@
-from django.core.management.base import BaseCommand
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, zip_longest
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from catalog.health import site_available
+from catalog.http_client import close_sessions
+from catalog.images import cache_product_images
+from catalog.ingest import PriceIngestor
+from catalog.metrics import profile_report, write_textfile
 from catalog.models import Product
-from catalog.utils import update_product_price, check_price_alert
+from catalog.scheduling import (
+    claim_all_products, claim_due_products, in_shard, next_due_at, parse_shard, schedule_products,
+)
+from catalog.pipeline import refresh_pipelined, start_parse_pool
+from catalog.scraper import fetch_page, refresh_page
+from catalog.throttle import site_bucket
+from catalog.utils import evaluate_price_alerts
+
+
+def refresh_product(product):
+    """
+    Scrape one product under its site's rate limit, conditionally on the
+    validators and fragment hash saved from its last fetch. Products on a
+    site whose circuit breaker is open come back 'skipped' straight away.
+    """
+    if site_available(product.site):
+        site_bucket(product.site).acquire()
+    return refresh_page(product.url, product.site, product.etag, product.last_modified, product.content_hash)
+
+
+def fetch_product(product):
+    """
+    The download half of refresh_product, for --parse-processes
+    """
+    if site_available(product.site):
+        site_bucket(product.site).acquire()
+    return fetch_page(product.url, product.site, product.etag, product.last_modified, product.content_hash)
+
+
+def interleave_by_site(products):
+    """
+    Order products round-robin across sites so that workers waiting on one
+    site's rate limit don't starve the others
+    """
+    by_site = {}
+    for product in products:
+        by_site.setdefault(product.site, []).append(product)
+    return [p for p in chain.from_iterable(zip_longest(*by_site.values())) if p is not None]
+
 
 class Command(BaseCommand):
-    help = "Scrape current prices for all products and update database."
-
-    def handle(self, *args, **kwargs):
-        products = Product.objects.all()
-        for product in products:
-            self.stdout.write(f"Scraping {product.site}: {product.name}")
-            updated_product, new_price = update_product_price(product.url, product.site)
-            if updated_product and new_price:
-                self.stdout.write(self.style.SUCCESS(f"Updated {product.name} ({product.site}) to price ₹{new_price}"))
-                check_price_alert(updated_product, new_price)
+    help = "Scrape current prices for all products (or only due ones) and update database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Number of products to scrape concurrently (per-site rate limits still apply).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=getattr(settings, "INGEST_BATCH_SIZE", 500),
+            help="Scrape results written to the database per transaction.",
+        )
+        parser.add_argument(
+            "--due", action="store_true",
+            help="Only refresh products whose scheduled next check is due, claiming them so several processes can run at once.",
+        )
+        parser.add_argument(
+            "--daemon", action="store_true",
+            help="Keep running, refreshing products as their next check falls due.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=getattr(settings, "REFRESH_BATCH_SIZE", 200),
+            help="Due products refreshed per pass with --due/--daemon.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=60.0,
+            help="Longest time --daemon sleeps between passes, in seconds.",
+        )
+        parser.add_argument(
+            "--parse-processes", type=int, default=getattr(settings, "PARSE_PROCESSES", 0),
+            help="Parse pages in this many worker processes while --workers threads download (0 parses in the download threads).",
+        )
+        parser.add_argument(
+            "--shard",
+            help="Only refresh shard i of N (products whose id is i modulo N), e.g. --shard 0/4.",
+        )
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="Print per-site timings of each scrape stage (connect, download, parse, extract, db_write) at the end.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.shard = parse_shard(options["shard"]) if options["shard"] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.workers = max(1, options["workers"])
+        self.ingestor = PriceIngestor(batch_size=max(1, options["batch_size"]))
+        self.parse_processes = max(0, options["parse_processes"])
+        self.parse_pool = start_parse_pool(self.parse_processes) if self.parse_processes else None
+        self.parse_queue_size = getattr(settings, "PARSE_QUEUE_SIZE", None) or 2 * self.parse_processes
+        started = time.perf_counter()
+        try:
+            if options["daemon"]:
+                self.run_daemon(max(1, options["limit"]), options["interval"])
+            elif options["due"]:
+                self.refresh(*claim_due_products(max(1, options["limit"]), shard=self.shard))
             else:
-                self.stdout.write(self.style.WARNING(f"Failed to update {product.name} ({product.site})"))
+                owner, products = claim_all_products(shard=self.shard)
+                leased = in_shard(Product.objects.all(), self.shard).count() - len(products)
+                if leased:
+                    self.stdout.write(self.style.WARNING(
+                        f"Skipping {leased} product(s) leased by another scrape_prices process."
+                    ))
+                self.refresh(owner, products)
+        finally:
+            close_sessions()
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown(cancel_futures=True)
+            if options["profile"]:
+                self.stdout.write(f"Profile ({time.perf_counter() - started:.1f}s wall clock):")
+                for line in profile_report():
+                    self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS("Price scraping finished."))
+
+    def run_daemon(self, limit, interval):
+        """
+        Refresh due products as they fall due, sleeping in between
+        """
+        self.stdout.write(f"Refreshing due products every {interval:g}s at most (Ctrl+C to stop)...")
+        try:
+            while True:
+                if self.refresh(*claim_due_products(limit, shard=self.shard)) < limit:
+                    due_at = next_due_at(self.shard)
+                    wait = interval if due_at is None else (due_at - timezone.now()).total_seconds()
+                    time.sleep(min(max(wait, 0), interval))
+        except KeyboardInterrupt:
+            pass
+
+    def refresh(self, owner, products):
+        """
+        Scrape products, write their prices and schedule their next check,
+        releasing the lease of claim `owner`; returns the number refreshed
+        """
+        products = list(products)
+        self.outcomes = {}
+        if self.parse_pool is not None and products:
+            self.stdout.write(
+                f"Scraping {len(products)} product(s) with {self.workers} download workers "
+                f"and {self.parse_processes} parse processes..."
+            )
+            pipeline = refresh_pipelined(
+                interleave_by_site(products), fetch_product, self.workers, self.parse_pool, self.parse_queue_size,
+            )
+            for product, result in pipeline:
+                self.collect(product, result)
+        elif self.workers == 1:
+            for product in products:
+                self.stdout.write(f"Scraping {product.site}: {product.name}")
+                self.collect(product, refresh_product(product))
+        elif products:
+            self.stdout.write(f"Scraping {len(products)} product(s) with {self.workers} workers...")
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scrape") as executor:
+                futures = {
+                    executor.submit(refresh_product, product): product
+                    for product in interleave_by_site(products)
+                }
+                for future in as_completed(futures):
+                    product = futures[future]
+                    try:
+                        self.collect(product, future.result())
+                    except Exception as e:
+                        self.outcomes[product.id] = False
+                        self.stdout.write(self.style.ERROR(f"Error updating {product.name} ({product.site}): {e}"))
+        self.ingestor.flush()
+        schedule_products(self.outcomes, owner=owner)
+        if getattr(settings, "IMAGE_CACHE_ON_REFRESH", True):
+            cached = cache_product_images([pid for pid, ok in self.outcomes.items() if ok], self.workers)
+            if cached:
+                self.stdout.write(f"Cached {cached} product image(s).")
+        metrics_file = getattr(settings, "SCRAPE_METRICS_FILE", None)
+        if metrics_file:
+            write_textfile(metrics_file)
+        queued = evaluate_price_alerts()
+        if queued:
+            self.stdout.write(self.style.SUCCESS(f"Queued {queued} price alert email(s)."))
+        return len(products)
+
+    def collect(self, product, result):
+        # None: not attempted, so it doesn't count towards the product's failures
+        self.outcomes[product.id] = None if result.status == "skipped" else result.status != "failed"
+        if result.status == "skipped":
+            self.stdout.write(self.style.WARNING(f"Skipped {product.name} ({product.site}): site unavailable"))
+            return
+        if result.status == "failed":
+            self.stdout.write(self.style.WARNING(f"Failed to update {product.name} ({product.site})"))
+            return
+        if result.status in ("not_modified", "unchanged"):
+            self.stdout.write(f"No change for {product.name} ({product.site})")
+            self.ingestor.touch(product, result.etag, result.last_modified)
+            return
+        self.stdout.write(self.style.SUCCESS(f"Updated {product.name} ({product.site}) to price ₹{result.price}"))
+        self.ingestor.add(
+            product.url, product.site, result.name, result.price, result.image,
+            result.etag, result.last_modified, result.content_hash,
+        )
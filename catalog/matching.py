@@ -0,0 +1,289 @@
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import chain
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Runs of letters or of digits, so "iPhone15" and "iPhone 15" split alike
+TOKEN_PATTERN = re.compile(r'[a-z]+|[0-9]+')
+# Words that say nothing about which product a title is
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'by', 'for', 'in', 'of', 'on', 'the', 'to', 'with',
+    'new', 'latest', 'pack', 'combo', 'set', 'original', 'genuine', 'free', 'sample', 'product',
+})
+# A word directly followed by a number ("M34", "iPhone 15", "Nord CE-3"),
+# where the number isn't a quantity ("128 GB")
+MODEL_PATTERN = re.compile(
+    r'\b([a-z]+)[ -]?([0-9]+)\b(?!\s*(?:gb|tb|mb|mah|w|hz|inch|inches|cm|mm|ml|kg|g)\b)'
+)
+# Words that can precede a number without it being a model number ("RAM 8", "Size 10")
+NOT_MODEL_PREFIXES = frozenset({'ram', 'rom', 'storage', 'size', 'pack', 'of', 'pcs', 'x', 'v'})
+
+
+def normalize_title(title):
+    """
+    Lower-case, accent-free words of a product title, with letters and
+    digits split apart
+    """
+    title = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii')
+    return [word for word in TOKEN_PATTERN.findall(title.lower()) if word not in STOPWORDS]
+
+
+def title_tokens(title):
+    """
+    Index terms for a title: its words plus each pair of adjacent words
+    joined, so "128 GB" and "128GB" both give "128", "gb" and "128gb"
+    """
+    words = normalize_title(title)
+    return frozenset(words + [a + b for a, b in zip(words, words[1:])])
+
+
+def model_numbers(title):
+    """
+    Word-then-number pairs that look like model numbers ("m34", "iphone15")
+    """
+    title = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii').lower()
+    return frozenset(
+        word + number for word, number in MODEL_PATTERN.findall(title)
+        if word not in NOT_MODEL_PREFIXES
+    )
+
+
+class ProductIndex:
+    """
+    Inverted index from title tokens to product ids, for finding the same
+    item listed under slightly different titles (usually on other sites).
+
+    Titles are compared by IDF-weighted cosine similarity. A title scoring
+    at least t must share at least t² of the query's weight, so candidates
+    only come from the postings of the query's rarest tokens up to that
+    point (prefix filtering): a lookup touches a few short lists instead of
+    every product. Two titles that both carry model numbers must share one.
+    """
+
+    def __init__(self, max_postings=1000, max_candidates=30):
+        self.max_postings = max_postings
+        self.max_candidates = max_candidates
+        self.postings = defaultdict(set)
+        self.tokens = {}
+        self.models = {}
+        self.sites = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def add(self, product_id, title, site=''):
+        tokens = title_tokens(title)
+        with self.lock:
+            self.remove(product_id)
+            self.tokens[product_id] = tokens
+            self.models[product_id] = model_numbers(title)
+            self.sites[product_id] = site
+            for token in tokens:
+                self.postings[token].add(product_id)
+
+    def remove(self, product_id):
+        with self.lock:
+            tokens = self.tokens.pop(product_id, None)
+            self.models.pop(product_id, None)
+            self.sites.pop(product_id, None)
+            for token in tokens or ():
+                posting = self.postings[token]
+                posting.discard(product_id)
+                if not posting:
+                    del self.postings[token]
+
+    def match(self, title, threshold=None, limit=5, exclude_site=None, exclude_id=None):
+        """
+        Indexed products whose titles match `title`, as (product_id, score)
+        pairs, best first
+        """
+        if threshold is None:
+            threshold = getattr(settings, 'MATCH_THRESHOLD', 0.6)
+        tokens = title_tokens(title)
+        models = model_numbers(title)
+        with self.lock:
+            total = len(self.tokens) + 1
+            weights = {}
+
+            def weight(token):
+                # Squared IDF, memoized for this lookup
+                w = weights.get(token)
+                if w is None:
+                    w = weights[token] = (math.log(total / (len(self.postings.get(token, ())) + 1)) + 1) ** 2
+                return w
+
+            query_norm = sum(weight(t) for t in tokens)
+            # Rarest tokens first, until the rest couldn't reach the threshold
+            # on their own; very common tokens are never probed
+            probes = []
+            remaining = query_norm
+            for token in sorted(tokens, key=weight, reverse=True):
+                if remaining < threshold ** 2 * query_norm:
+                    break
+                remaining -= weight(token)
+                if 0 < len(self.postings.get(token, ())) <= self.max_postings:
+                    probes.append(token)
+            # Products sharing the most probe tokens are the candidates
+            counts = Counter(chain.from_iterable(self.postings[t] for t in probes))
+            matches = []
+            for product_id, _ in counts.most_common(self.max_candidates):
+                if product_id == exclude_id or (exclude_site and self.sites[product_id] == exclude_site):
+                    continue
+                other_models = self.models[product_id]
+                if models and other_models and not models & other_models:
+                    continue
+                other = self.tokens[product_id]
+                shared = sum(weight(t) for t in tokens & other)
+                score = shared / math.sqrt(query_norm * sum(weight(t) for t in other))
+                if score >= threshold:
+                    matches.append((product_id, score))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches[:limit]
+
+    def search(self, query, limit=50):
+        """
+        Indexed products whose titles contain every word of `query`, as
+        product ids, best first (titles with fewer other words rank higher)
+        """
+        words = set(normalize_title(query))
+        if not words:
+            return []
+        with self.lock:
+            postings = sorted((self.postings.get(word, set()) for word in words), key=len)
+            # Intersect from the shortest posting list so the work stays small
+            found = set(postings[0])
+            for posting in postings[1:]:
+                if not found:
+                    break
+                found &= posting
+            total = len(self.tokens) + 1
+            scores = {
+                product_id: sum(
+                    (math.log(total / (len(self.postings[token]) + 1)) + 1) ** 2
+                    for token in self.tokens[product_id] if token not in words
+                )
+                for product_id in found
+            }
+        return sorted(scores, key=scores.get)[:limit]
+
+
+_index = None
+_index_built_at = 0.0
+# The index being built in the background, if any
+_building = None
+_index_lock = threading.Lock()
+
+
+def product_index():
+    """
+    The process-wide index over saved products. Callers never wait for a
+    build: the first use publishes an empty index and fills it in a
+    background thread, and once the index is older than MATCH_INDEX_MAX_AGE
+    seconds a fresh one (picking up changes made by other processes) is
+    built in the background and swapped in when complete. Saves in this
+    process update it as they happen.
+    """
+    global _index, _building
+    max_age = getattr(settings, 'MATCH_INDEX_MAX_AGE', 3600)
+    with _index_lock:
+        if _building is None and (_index is None or time.monotonic() - _index_built_at > max_age):
+            _building = ProductIndex()
+            if _index is None:
+                _index = _building
+            threading.Thread(target=build_index, args=(_building,), name='product-index', daemon=True).start()
+        return _index
+
+
+def index_ready():
+    """
+    Whether product_index() is complete: False while the first build of
+    this process is still running and the published index is partial
+    """
+    with _index_lock:
+        return _index is not None and _index is not _building
+
+
+def build_index(index):
+    """
+    Fill `index` with every saved product, then make it the current index
+    """
+    global _index, _index_built_at, _building
+    from .models import Product
+    try:
+        for product_id, name, site in Product.objects.values_list('id', 'name', 'site').iterator(chunk_size=5000):
+            index.add(product_id, name, site)
+    except Exception:
+        logger.exception("Building the product index failed")
+        with _index_lock:
+            _building = None
+        return
+    finally:
+        # This thread's own database connection
+        connection.close()
+    with _index_lock:
+        _index, _index_built_at, _building = index, time.monotonic(), None
+    logger.info("Indexed %d saved products", len(index))
+
+
+def live_indexes():
+    """
+    The current index and the one being built, so saves reach both
+    """
+    with _index_lock:
+        indexes = [] if _index is None else [_index]
+        if _building is not None and _building is not _index:
+            indexes.append(_building)
+        return indexes
+
+
+def index_products(products):
+    """
+    Add or refresh products in the index (and any being built), if this process has one
+    """
+    for index in live_indexes():
+        for product in products:
+            index.add(product.id, product.name, product.site)
+
+
+def unindex_product(product_id):
+    for index in live_indexes():
+        index.remove(product_id)
+
+
+def find_matches(product, limit=5):
+    """
+    Saved products on other sites that look like the same item, as (product_id, score) pairs
+    """
+    return product_index().match(product.name, limit=limit, exclude_site=product.site, exclude_id=product.id)
+
+
+def group_results(results):
+    """
+    Tag search results that are the same item on different sites with a
+    shared 'group' number (the position of the cheapest in the group) and
+    the group's size; results are expected sorted by price
+    """
+    index = ProductIndex()
+    for i, result in enumerate(results):
+        index.add(i, result['name'], result['site'])
+    groups = {}
+    for i, result in enumerate(results):
+        group = groups.setdefault(i, i)
+        for j, _ in index.match(result['name'], exclude_site=result['site']):
+            groups.setdefault(j, group)
+    sizes = defaultdict(int)
+    for group in groups.values():
+        sizes[group] += 1
+    for i, result in enumerate(results):
+        result['group'] = groups[i]
+        result['group_size'] = sizes[groups[i]]
+    return results
@@ -0,0 +1,205 @@
+import bisect
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Scrape stages, in pipeline order:
+#   connect  - DNS, connect, TLS and waiting for the response headers
+#   download - reading the response body
+#   parse    - building the document from the page
+#   extract  - reading fields (and the fragment hash) from the document
+#   db_write - writing a batch of scrape results (site "all", page "batch")
+STAGES = ('connect', 'download', 'parse', 'extract', 'db_write')
+
+HELP = {
+    'scrape_stage_seconds': 'Time spent in each scrape stage',
+    'scrape_responses_total': 'HTTP responses received, by status code',
+    'scrape_response_bytes_total': 'Response body bytes downloaded',
+    'scrape_results_total': 'Page scrapes by outcome',
+}
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in the Prometheus style, plus the
+    largest value seen (for --profile reports)
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating inside its bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets + (self.max,), self.counts):
+            if count and seen + count >= rank:
+                return lower + (min(upper, self.max) - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+
+class Registry:
+    """
+    Process-wide counters and histograms, keyed by metric name and a
+    sorted tuple of (label, value) pairs
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        """
+        The registry in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for upper, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", f"{upper:g}"),))} {cumulative}')
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+registry = Registry()
+
+
+def metrics_enabled():
+    return getattr(settings, 'SCRAPE_METRICS', True)
+
+
+def increment(name, value=1, **labels):
+    if metrics_enabled():
+        registry.increment(name, value, **labels)
+
+
+def observe_stage(stage, site, seconds, page='product'):
+    if metrics_enabled():
+        registry.observe('scrape_stage_seconds', seconds, site=site, page=page, stage=stage)
+
+
+@contextmanager
+def timed(stage, site, page='product'):
+    """
+    Record how long the enclosed block takes as one scrape stage, even if it raises
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, site, time.perf_counter() - start, page)
+
+
+def write_textfile(path):
+    """
+    Write the registry to `path` atomically, for node_exporter's textfile
+    collector to pick up metrics from management commands
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(registry.render())
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def profile_report():
+    """
+    Per-site stage timings and outcome counts as text lines, for `scrape_prices --profile`
+    """
+    with registry.lock:
+        histograms = [
+            (dict(labels), histogram) for (name, labels), histogram in registry.histograms.items()
+            if name == 'scrape_stage_seconds'
+        ]
+        counters = [(name, dict(labels), value) for (name, labels), value in sorted(registry.counters.items())]
+    histograms.sort(key=lambda item: (item[0]['site'], item[0]['page'], STAGES.index(item[0]['stage'])))
+    lines = [f"{'site':<10} {'page':<8} {'stage':<9} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    for labels, h in histograms:
+        lines.append(
+            f"{labels['site']:<10} {labels['page']:<8} {labels['stage']:<9} {h.count:>6} "
+            f"{h.sum / h.count * 1000:>9.1f} {h.quantile(0.5) * 1000:>9.1f} "
+            f"{h.quantile(0.95) * 1000:>9.1f} {h.max * 1000:>9.1f}"
+        )
+    for name, labels, value in counters:
+        detail = ' '.join(f'{key}={labels[key]}' for key in sorted(labels))
+        lines.append(f"{name} {detail}: {value}")
+    return lines
+
+
+def stage_timings():
+    """
+    Seconds recorded per (site, page, stage) by this process, for a worker
+    process to hand back to its parent
+    """
+    timings = []
+    with registry.lock:
+        for (name, labels), histogram in registry.histograms.items():
+            if name == 'scrape_stage_seconds':
+                labels = dict(labels)
+                timings.append((labels['site'], labels['page'], labels['stage'], histogram.sum))
+    return timings
@@ -0,0 +1,66 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+
+def canonical_url(url):
+    # Frozen copy of catalog.canonical.canonical_url as of this migration
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not (scheme, parts.port) in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+def fill_url_hashes(apps, schema_editor):
+    """
+    Hash every product URL and merge products that share a canonical URL,
+    keeping the oldest row and moving history and alerts onto it
+    """
+    Product = apps.get_model('catalog', 'Product')
+    PriceHistory = apps.get_model('catalog', 'PriceHistory')
+    PriceAlert = apps.get_model('catalog', 'PriceAlert')
+
+    keepers = {}
+    for product in Product.objects.order_by('id').iterator():
+        digest = hashlib.sha256(canonical_url(product.url).encode('utf-8')).hexdigest()
+        keeper_id = keepers.get(digest)
+        if keeper_id is None:
+            keepers[digest] = product.id
+            Product.objects.filter(id=product.id).update(url_hash=digest)
+        else:
+            PriceHistory.objects.filter(product_id=product.id).update(product_id=keeper_id)
+            PriceAlert.objects.filter(product_id=product.id).update(product_id=keeper_id)
+            Product.objects.filter(id=product.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='url_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_url_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='url_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['product', 'checked_at'], name='pricehistory_product_checked'),
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['product', 'notified'], name='pricealert_product_notified'),
+        ),
+    ]
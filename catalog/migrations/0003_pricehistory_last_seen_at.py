@@ -0,0 +1,32 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_last_seen_at(apps, schema_editor):
+    PriceHistory = apps.get_model('catalog', 'PriceHistory')
+    PriceHistory.objects.update(last_seen_at=models.F('checked_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_product_url_hash_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricehistory',
+            name='last_seen_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_last_seen_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['product', 'last_seen_at'], name='pricehistory_product_seen'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 09:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_product_page_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='next_check_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
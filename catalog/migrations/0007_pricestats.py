@@ -0,0 +1,61 @@
+# Generated by Django 5.1 on 2026-10-18 10:20
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_price_stats(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    PriceHistory = apps.get_model('catalog', 'PriceHistory')
+    PriceStats = apps.get_model('catalog', 'PriceStats')
+    now = timezone.now()
+    stats = []
+    for product_id in Product.objects.values_list('id', flat=True).iterator():
+        rows = list(PriceHistory.objects.filter(product_id=product_id).order_by('checked_at', 'id'))
+        if not rows:
+            continue
+        row = PriceStats(
+            product_id=product_id,
+            current_price=rows[-1].price,
+            last_changed_at=rows[-1].checked_at,
+            price_sum=sum(r.price for r in rows),
+            price_count=len(rows),
+        )
+        for field, days in (('min_365', 365), ('min_30', 30)):
+            recent = [r for r in rows if r.last_seen_at >= now - timedelta(days=days)]
+            if recent:
+                low = min(r.price for r in recent)
+                setattr(row, field, low)
+                setattr(row, f'{field}_seen_at', max(r.last_seen_at for r in recent if r.price == low))
+        stats.append(row)
+        if len(stats) >= 1000:
+            PriceStats.objects.bulk_create(stats)
+            stats = []
+    PriceStats.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_refresh_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='price_stats', serialize=False, to='catalog.product')),
+                ('current_price', models.FloatField()),
+                ('last_changed_at', models.DateTimeField()),
+                ('min_365', models.FloatField(null=True)),
+                ('min_365_seen_at', models.DateTimeField(null=True)),
+                ('min_30', models.FloatField(null=True)),
+                ('min_30_seen_at', models.DateTimeField(null=True)),
+                ('price_sum', models.FloatField(default=0)),
+                ('price_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_price_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+def fill_last_seen_at(apps, schema_editor):
+    PriceStats = apps.get_model('catalog', 'PriceStats')
+    PriceHistory = apps.get_model('catalog', 'PriceHistory')
+    latest = PriceHistory.objects.filter(product=models.OuterRef('product')).order_by('-checked_at', '-id')
+    PriceStats.objects.update(last_seen_at=models.Subquery(latest.values('last_seen_at')[:1]))
+
+
+def add_fulltext_index(apps, schema_editor):
+    # Used by catalog.local_search on MySQL; other databases use an in-process index
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX product_name_fulltext ON catalog_product (name)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX product_name_fulltext ON catalog_product')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_pricestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricestats',
+            name='last_seen_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_last_seen_at, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_local_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='lease_owner',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_product_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('url', models.URLField(max_length=1000)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('content_type', models.CharField(max_length=50)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    The average becomes time-weighted. Run `manage.py rebuild_price_stats`
+    after migrating to fill the new fields from price history.
+    """
+
+    dependencies = [
+        ('catalog', '0010_cachedimage'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='pricestats',
+            name='price_count',
+        ),
+        migrations.RemoveField(
+            model_name='pricestats',
+            name='price_sum',
+        ),
+        migrations.AddField(
+            model_name='pricestats',
+            name='price_time_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pricestats',
+            name='priced_seconds',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_pricestats_time_weighted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='lease_owner',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -2,17 +2,83 @@ from django.db import models
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .canonical import url_digest
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
     url = models.URLField()
+    # SHA-256 of the canonical URL; unique so lookups by URL hit one index entry
+    url_hash = models.CharField(max_length=64, unique=True, editable=False)
     site = models.CharField(max_length=50)
     image_url = models.URLField(blank=True, null=True)
+    # Validators from the last product page fetch, sent back as a conditional GET
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    # SHA-256 of the page fragment the site adapter extracts from
+    content_hash = models.CharField(max_length=64, blank=True)
+    # Refresh schedule (catalog.scheduling); scrape_prices --daemon checks
+    # products in next_check_at order
+    next_check_at = models.DateTimeField(default=timezone.now, db_index=True)
+    failure_count = models.PositiveIntegerField(default=0)
+    # Claim token of the scrape_prices process currently refreshing the
+    # product; its lease runs until next_check_at
+    lease_owner = models.CharField(max_length=32, blank=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.url_hash = url_digest(self.url)
+        super().save(*args, **kwargs)
 
 class PriceHistory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     price = models.FloatField()
     checked_at = models.DateTimeField(auto_now_add=True)
+    # Last time this price was seen; with change-only storage a row covers
+    # every scrape from checked_at to last_seen_at at the same price
+    last_seen_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'checked_at'], name='pricehistory_product_checked'),
+            models.Index(fields=['product', 'last_seen_at'], name='pricehistory_product_seen'),
+        ]
+
+class PriceStats(models.Model):
+    """
+    Price summary per product, kept up to date on every price write
+    (catalog.stats) so pages and alert checks read one row instead of
+    aggregating price history. Rebuild with `manage.py rebuild_price_stats`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='price_stats')
+    current_price = models.FloatField()
+    last_changed_at = models.DateTimeField()
+    # Last time the current price was confirmed by a scrape
+    last_seen_at = models.DateTimeField(null=True)
+    # Rolling-window lows, with the last time that low was seen: once that
+    # falls out of the window the low has to be recomputed from history.
+    # NULL when no price was seen within the window.
+    min_365 = models.FloatField(null=True)
+    min_365_seen_at = models.DateTimeField(null=True)
+    min_30 = models.FloatField(null=True)
+    min_30_seen_at = models.DateTimeField(null=True)
+    # Time-weighted average: each price counts for as long as it held, from
+    # when it was first seen until a different price was. These cover the
+    # earlier prices, up to last_changed_at (sum of price * seconds, and
+    # seconds), so they don't depend on how history rows are stored.
+    price_time_sum = models.FloatField(default=0)
+    priced_seconds = models.FloatField(default=0)
+
+    @property
+    def avg_price(self):
+        """
+        Average price over the product's history, weighted by how long each price held
+        """
+        current = ((self.last_seen_at or self.last_changed_at) - self.last_changed_at).total_seconds()
+        seconds = self.priced_seconds + current
+        if seconds <= 0:
+            return self.current_price
+        return (self.price_time_sum + self.current_price * current) / seconds
+
 
 class PriceAlert(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -20,3 +86,52 @@ class PriceAlert(models.Model):
     target_price = models.FloatField()
     notified = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'notified'], name='pricealert_product_notified'),
+        ]
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox for notification emails, sent in the background by dispatch_notifications
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    # Identifies the notification (e.g. "price-alert:42") so it's only queued once
+    dedupe_key = models.CharField(max_length=191, unique=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to_email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Token of the dispatcher that last claimed the email (catalog.notifications.claim_due_emails)
+    lease_owner = models.CharField(max_length=32, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outboundemail_due'),
+        ]
+
+
+class CachedImage(models.Model):
+    """
+    A product image fetched into the local image cache (catalog.images).
+    Files on disk are named by content hash, so image URLs that serve the
+    same picture share one thumbnail.
+    """
+    # SHA-256 of the image URL
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.URLField(max_length=1000)
+    # SHA-256 of the original image bytes
+    content_hash = models.CharField(max_length=64, db_index=True)
+    content_type = models.CharField(max_length=50)
+    fetched_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,95 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+def queue_emails(emails):
+    """
+    Queue many OutboundEmail objects in one INSERT, skipping dedupe keys already queued
+    """
+    OutboundEmail.objects.bulk_create(emails, ignore_conflicts=True)
+
+
+def due_email_ids(batch_size, now):
+    """
+    Ids of up to batch_size due emails, oldest first
+    """
+    due = OutboundEmail.objects.filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True)
+    return list(due.values_list('id', flat=True)[:batch_size])
+
+
+def claim_due_emails(batch_size):
+    """
+    Claim up to batch_size due emails for this dispatcher.
+
+    Claimed rows get their next_attempt_at pushed out by a lease and are
+    tagged with a fresh lease_owner token, so another dispatcher won't pick
+    them up, and a dispatcher that dies mid-batch only delays them until the
+    lease expires. The claiming UPDATE re-checks that each row is still due,
+    and only the rows it updated are returned, so two dispatchers never
+    claim the same email even without SKIP LOCKED.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE_SECONDS', 300))
+    owner = uuid.uuid4().hex
+    with transaction.atomic():
+        OutboundEmail.objects.filter(
+            id__in=due_email_ids(batch_size, now), status=OutboundEmail.PENDING, next_attempt_at__lte=now,
+        ).update(next_attempt_at=now + lease, lease_owner=owner)
+    return list(OutboundEmail.objects.filter(lease_owner=owner).order_by('id'))
+
+
+def dispatch_outbox(batch_size=100):
+    """
+    Send due outbox emails over a single mail connection.
+
+    Failures are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS,
+    after which the email is marked failed. Returns (sent, failed).
+    """
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception as e:
+        for email in emails:
+            record_failure(email, e)
+        return 0, len(emails)
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, [email.to_email], connection=mail_connection)
+            try:
+                mail_connection.send_messages([message])
+            except Exception as e:
+                record_failure(email, e)
+                failed += 1
+                continue
+            # Marked straight away, so a crash later in the batch can't get it sent twice
+            OutboundEmail.objects.filter(id=email.id).update(status=OutboundEmail.SENT, sent_at=timezone.now())
+            sent += 1
+    finally:
+        mail_connection.close()
+    return sent, failed
+
+
+def record_failure(email, error):
+    """
+    Schedule a retry with exponential backoff, or give up after OUTBOX_MAX_ATTEMPTS
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = OutboundEmail.FAILED
+    else:
+        backoff = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 60)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=backoff * 2 ** (email.attempts - 1))
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
@@ -0,0 +1,174 @@
+import re
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
+
+try:
+    import lxml  # noqa: F401
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    HAVE_SELECTOLAX = True
+except ImportError:
+    HAVE_SELECTOLAX = False
+
+
+# Fastest first; 'auto' picks the first one that is installed
+BACKEND_PREFERENCE = ['selectolax', 'lxml', 'html.parser']
+
+
+def available_backends():
+    installed = {'selectolax': HAVE_SELECTOLAX, 'lxml': HAVE_LXML, 'html.parser': True}
+    return [backend for backend in BACKEND_PREFERENCE if installed[backend]]
+
+
+def get_backend(backend=None):
+    """
+    Resolve a backend name (or the HTML_PARSER setting) to an installed backend
+    """
+    backend = backend or getattr(settings, 'HTML_PARSER', 'auto')
+    if backend == 'auto':
+        return available_backends()[0]
+    if backend not in available_backends():
+        raise ValueError(f"HTML parser backend {backend!r} is not installed")
+    return backend
+
+
+def parse_html(content, only=None, backend=None):
+    """
+    Parse a page with the configured backend.
+
+    `only` is a list of simple CSS selectors (e.g. "span#productTitle");
+    for BeautifulSoup backends just the elements matching them, with their
+    subtrees, are built. selectolax parses the whole page in C, which is
+    cheaper than filtering, so it ignores `only`.
+
+    The result supports the subset of the BeautifulSoup API the scrapers
+    use: select_one(), select(), get() and get_text().
+    """
+    backend = get_backend(backend)
+    if backend == 'selectolax':
+        return LexborNode(LexborHTMLParser(content).root)
+    if only and getattr(settings, 'HTML_PARSER_STRAIN', True):
+        return BeautifulSoup(content, backend, parse_only=SelectorStrainer(only))
+    return BeautifulSoup(content, backend)
+
+
+class LexborNode:
+    """
+    Wraps a selectolax node in the BeautifulSoup methods used by the scrapers
+    """
+
+    def __init__(self, node):
+        self.node = node
+
+    def select_one(self, selector):
+        node = self.node.css_first(selector)
+        return LexborNode(node) if node is not None else None
+
+    def select(self, selector):
+        return [LexborNode(node) for node in self.node.css(selector)]
+
+    def get(self, name, default=None):
+        value = self.node.attributes.get(name)
+        return default if value is None else value
+
+    def get_text(self):
+        return self.node.text(deep=True)
+
+    def __str__(self):
+        return self.node.html or ''
+
+
+class Selector:
+    """
+    A CSS selector compiled once, usable on documents from any backend
+    """
+
+    def __init__(self, css):
+        self.css = css
+        self.compiled = soupsieve.compile(css)
+
+    def __repr__(self):
+        return f'Selector({self.css!r})'
+
+    def select_one(self, node):
+        if isinstance(node, LexborNode):
+            return node.select_one(self.css)
+        return self.compiled.select_one(node)
+
+    def select(self, node, limit=0):
+        if isinstance(node, LexborNode):
+            nodes = node.select(self.css)
+            return nodes[:limit] if limit else nodes
+        return self.compiled.select(node, limit=limit)
+
+
+SIMPLE_SELECTOR = re.compile(
+    r'^(?P<tag>[a-zA-Z][\w-]*)?'
+    r'(?P<id>#[\w-]+)?'
+    r'(?P<classes>(?:\.[\w-]+)*)'
+    r'(?:\[(?P<attr>[\w-]+)(?:=["\']?(?P<value>[^"\'\]]*)["\']?)?\])?$'
+)
+
+
+class SelectorStrainer(SoupStrainer):
+    """
+    SoupStrainer that keeps elements matching any of a list of simple CSS
+    selectors (tag, #id, .class and [attr] / [attr=value] parts).
+
+    Beautiful Soup asks the strainer about each start tag while parsing:
+    through search_tag() before 4.13 and allow_tag_creation() since, so
+    both are implemented.
+    """
+
+    def __init__(self, selectors):
+        super().__init__()
+        self.rules = [self.compile(selector) for selector in selectors]
+
+    @staticmethod
+    def compile(selector):
+        match = SIMPLE_SELECTOR.match(selector.strip())
+        if not match:
+            raise ValueError(f"Unsupported strainer selector: {selector!r}")
+        return (
+            match.group('tag'),
+            match.group('id')[1:] if match.group('id') else None,
+            set(match.group('classes').split('.')[1:]),
+            match.group('attr'),
+            match.group('value'),
+        )
+
+    def wants(self, name, attrs):
+        attrs = attrs or {}
+        for tag, id_, classes, attr, value in self.rules:
+            if tag and tag != name:
+                continue
+            if id_ and attrs.get('id') != id_:
+                continue
+            if classes:
+                tag_classes = attrs.get('class') or ''
+                if isinstance(tag_classes, str):
+                    tag_classes = tag_classes.split()
+                if not classes.issubset(tag_classes):
+                    continue
+            if attr and (attr not in attrs or (value is not None and attrs[attr] != value)):
+                continue
+            return True
+        return False
+
+    # Beautiful Soup < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if isinstance(markup_name, str):
+            return self.wants(markup_name, markup_attrs)
+        return super().search_tag(markup_name, markup_attrs)
+
+    # Beautiful Soup >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.wants(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
@@ -0,0 +1,92 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from .metrics import increment, observe_stage, registry, stage_timings
+from .scraper import FetchedPage, RefreshResult, parse_page
+
+
+def init_parse_worker():
+    # Worker processes are spawned fresh, so set Django up from DJANGO_SETTINGS_MODULE
+    import django
+    django.setup()
+
+
+def parse_in_worker(fetched):
+    """
+    parse_page in a pool process; returns the result and the stage timings
+    it recorded, which the parent's metrics wouldn't otherwise see
+    """
+    registry.reset()
+    return parse_page(*fetched), stage_timings()
+
+
+def failed_result(product):
+    return RefreshResult('failed', '', None, '', product.etag, product.last_modified, product.content_hash)
+
+
+def start_parse_pool(processes):
+    """
+    Process pool for the parse stage. Workers are spawned rather than forked,
+    since forking a process that already runs fetch threads isn't safe.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_parse_worker,
+    )
+
+
+def refresh_pipelined(products, fetch, fetch_workers, parse_pool, queue_size):
+    """
+    Refresh products in two stages, yielding (product, RefreshResult) as each finishes.
+
+    `fetch_workers` threads download pages with `fetch(product)` (which
+    returns what fetch_page does), and `parse_pool` parses them in other
+    processes, so parsing isn't held to one core by the GIL. Only the raw
+    body bytes cross to the pool. At most `queue_size` pages wait for or sit
+    in the pool; past that, fetchers block until the parsers catch up, so a
+    slow parse stage throttles downloads instead of piling pages up in
+    memory.
+    """
+    products = list(products)
+    slots = threading.BoundedSemaphore(max(1, queue_size))
+    done = queue.Queue()
+
+    def fetch_stage(product):
+        try:
+            fetched = fetch(product)
+        except Exception as e:
+            print(f"{product.site} scrape error: {e}")
+            fetched = failed_result(product)
+        if not isinstance(fetched, FetchedPage):
+            done.put((product, fetched))
+            return
+        slots.acquire()
+        try:
+            future = parse_pool.submit(parse_in_worker, fetched)
+        except Exception as e:
+            slots.release()
+            print(f"{product.site} parse error: {e}")
+            done.put((product, failed_result(product)))
+            return
+        future.add_done_callback(lambda f: (slots.release(), done.put((product, f))))
+
+    with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch') as executor:
+        for product in products:
+            executor.submit(fetch_stage, product)
+        for _ in products:
+            product, outcome = done.get()
+            if isinstance(outcome, Future):
+                try:
+                    result, timings = outcome.result()
+                except Exception as e:
+                    print(f"{product.site} parse error: {e}")
+                    result = failed_result(product)
+                else:
+                    for site, page, stage, seconds in timings:
+                        observe_stage(stage, site, seconds, page)
+            else:
+                result = outcome
+            increment('scrape_results_total', site=product.site, page='product', status=result.status)
+            yield product, result
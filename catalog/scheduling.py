@@ -0,0 +1,183 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+from .models import PriceAlert, PriceHistory, Product
+
+
+def setting_seconds(name, default):
+    return timedelta(seconds=getattr(settings, name, default))
+
+
+def refresh_interval(has_alert, recent_changes, failure_count):
+    """
+    How long to wait before checking a product again.
+
+    Starts from REFRESH_INTERVAL, is divided by REFRESH_ALERT_FACTOR for
+    products with an active alert and by one plus the number of price
+    changes in the last REFRESH_VOLATILITY_WINDOW seconds, then doubles with
+    every consecutive failure, so a failing product backs off from its own
+    interval. Clamped to REFRESH_MIN_INTERVAL .. REFRESH_MAX_INTERVAL.
+    """
+    interval = setting_seconds('REFRESH_INTERVAL', 24 * 3600)
+    minimum = setting_seconds('REFRESH_MIN_INTERVAL', 15 * 60)
+    maximum = setting_seconds('REFRESH_MAX_INTERVAL', 7 * 24 * 3600)
+    if has_alert:
+        interval /= getattr(settings, 'REFRESH_ALERT_FACTOR', 8)
+    interval /= 1 + recent_changes
+    interval = max(minimum, interval)
+    if failure_count:
+        interval *= 2 ** min(failure_count, 16)
+    return min(interval, maximum)
+
+
+# Product fields a refresh needs
+REFRESH_FIELDS = ('id', 'name', 'url', 'site', 'etag', 'last_modified', 'content_hash', 'failure_count', 'lease_owner')
+
+
+def parse_shard(value):
+    """
+    Parse a "--shard i/N" value into (i, N), with 0 <= i < N
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, not {value!r}")
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}")
+    return index, count
+
+
+def in_shard(products, shard):
+    """
+    Restrict a Product queryset to shard (i, N): the products whose id is i modulo N
+    """
+    if shard is None:
+        return products
+    index, count = shard
+    return products.alias(shard=F('id') % count).filter(shard=index)
+
+
+def due_products(limit=None, now=None, shard=None):
+    """
+    Products whose next check is due, most overdue first
+    """
+    products = in_shard(Product.objects.filter(next_check_at__lte=now or timezone.now()), shard)
+    products = products.order_by('next_check_at', 'id').only(*REFRESH_FIELDS)
+    return products[:limit] if limit else products
+
+
+def claim_due_products(limit, now=None, shard=None):
+    """
+    Claim up to `limit` due products for this process, so that concurrent
+    scrape_prices processes (on any number of machines) refresh disjoint sets.
+
+    A claim moves next_check_at forward by REFRESH_LEASE seconds and tags the
+    rows with a fresh lease_owner token; schedule_products releases them. If
+    the process dies first, the products fall due again when the lease runs
+    out and another process claims them. Rows are locked with SKIP LOCKED
+    where the database supports it, and the claiming UPDATE re-checks that
+    each row is still due, so two processes never claim the same product.
+    Returns (owner, products).
+    """
+    now = now or timezone.now()
+    owner = uuid.uuid4().hex
+    with transaction.atomic():
+        candidates = due_products(limit, now, shard)
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True))
+        Product.objects.filter(id__in=ids, next_check_at__lte=now).update(
+            next_check_at=now + setting_seconds('REFRESH_LEASE', 15 * 60),
+            lease_owner=owner,
+        )
+    return owner, list(Product.objects.filter(lease_owner=owner).order_by('id').only(*REFRESH_FIELDS))
+
+
+def claim_all_products(now=None, shard=None):
+    """
+    Claim every product for a full scrape_prices run, except those another
+    process holds under an unexpired lease: a --due process refreshing them
+    keeps them, and they're left out of this run. The claim is the same
+    REFRESH_LEASE as claim_due_products, so those processes don't pick up
+    products this run is about to refresh either. Returns (owner, products).
+    """
+    now = now or timezone.now()
+    owner = uuid.uuid4().hex
+    unleased = in_shard(Product.objects.filter(Q(lease_owner='') | Q(next_check_at__lte=now)), shard)
+    unleased.update(next_check_at=now + setting_seconds('REFRESH_LEASE', 15 * 60), lease_owner=owner)
+    return owner, list(Product.objects.filter(lease_owner=owner).order_by('id').only(*REFRESH_FIELDS))
+
+
+def next_due_at(shard=None):
+    """
+    When the next product falls due, or None if there are no products
+    """
+    product = in_shard(Product.objects.all(), shard).order_by('next_check_at').only('next_check_at').first()
+    return product.next_check_at if product else None
+
+
+def price_changes_since(products, since):
+    """
+    Map product id to how many times its price changed since `since`.
+
+    Counts transitions between consecutive history rows, starting from the
+    last price before the window (the products' `price_before`
+    annotation), so it's the same whether history stores every scrape or
+    only changes (PRICE_HISTORY_MODE).
+    """
+    previous = {product.id: product.price_before for product in products}
+    changes = dict.fromkeys(previous, 0)
+    history = (
+        PriceHistory.objects.filter(product_id__in=list(previous), checked_at__gte=since)
+        .order_by('product_id', 'checked_at', 'id')
+        .values_list('product_id', 'price')
+    )
+    for product_id, price in history.iterator():
+        if previous[product_id] is not None and price != previous[product_id]:
+            changes[product_id] += 1
+        previous[product_id] = price
+    return changes
+
+
+def schedule_products(outcomes, now=None, owner=None):
+    """
+    Set next_check_at for refreshed products from their alerts, recent
+    volatility and failure history, releasing their lease.
+
+    `outcomes` maps product id to whether the refresh succeeded, or None if
+    it was skipped (site circuit open); skipped products are retried after
+    REFRESH_MIN_INTERVAL without counting as a failure. Alerts and price
+    changes for the whole batch are read in two queries, and the new
+    schedule written with one bulk_update. With an `owner` token, products
+    whose lease has since passed to another process are left to it.
+    """
+    if not outcomes:
+        return
+    now = now or timezone.now()
+    since = now - setting_seconds('REFRESH_VOLATILITY_WINDOW', 7 * 24 * 3600)
+    products = Product.objects.filter(id__in=list(outcomes))
+    if owner is not None:
+        products = products.filter(lease_owner=owner)
+    products = list(products.only('id', 'failure_count').annotate(
+        has_alert=Exists(PriceAlert.objects.filter(product=OuterRef('pk'), notified=False)),
+        price_before=Subquery(
+            PriceHistory.objects.filter(product=OuterRef('pk'), checked_at__lt=since)
+            .order_by('-checked_at').values('price')[:1]
+        ),
+    ))
+    changes = price_changes_since(products, since)
+    for product in products:
+        product.lease_owner = ''
+        if outcomes[product.id] is None:
+            product.next_check_at = now + setting_seconds('REFRESH_MIN_INTERVAL', 15 * 60)
+            continue
+        if outcomes[product.id]:
+            product.failure_count = 0
+        else:
+            product.failure_count += 1
+        interval = refresh_interval(product.has_alert, changes[product.id], product.failure_count)
+        product.next_check_at = now + interval
+    Product.objects.bulk_update(products, ['next_check_at', 'failure_count', 'lease_owner'])
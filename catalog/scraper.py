@@ -1,294 +1,242 @@
-import requests
-from bs4 import BeautifulSoup
+from collections import namedtuple
 from urllib.parse import quote
-import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from django.conf import settings
+from .health import SiteUnavailable, site_available
+from .http_client import fetch
+from .matching import group_results
+from .metrics import increment, timed
+from .sites import get_adapter, searchable_sites
 
 
-def scrape_amazon(url):
+def extract_product_page(adapter, content):
     """
-    Scrape a single Amazon product page
+    Parse and extract a product page, timing each stage; returns (name, price, image)
+    """
+    with timed('parse', adapter.name):
+        document = adapter.parse_product(content)
+    with timed('extract', adapter.name):
+        return adapter.extract_product_document(document)
+
+
+def extract_search_page(adapter, content):
+    """
+    Parse and extract a search results page, timing each stage
     """
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    with timed('parse', adapter.name, 'search'):
+        document = adapter.parse_search(content)
+    with timed('extract', adapter.name, 'search'):
+        return adapter.extract_search_document(document)
+
+
+def scrape_page(url, site):
+    """
+    Scrape a single product page through its site adapter; returns (name, price, image)
+    """
+    adapter = get_adapter(site)
+    if adapter is None:
+        return "", None, ""
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(r.content, "html.parser")
-        
-        # Extract price
-        price_tag = soup.find("span", {"class": "a-price-whole"})
-        if not price_tag:
-            price_tag = soup.find("span", {"class": "a-offscreen"})
-        
-        price = None
-        if price_tag:
-            price_text = price_tag.get_text().strip().replace('₹', '').replace(',', '').replace('.', '')
-            try:
-                price = float(price_text) / 100 if len(price_text) > 4 else float(price_text)
-            except:
-                price = None
-        
-        # Extract name
-        name_tag = soup.find("span", {"id": "productTitle"})
-        name = name_tag.get_text().strip() if name_tag else ""
-        
-        # Extract image
-        image_tag = soup.find("img", {"id": "landingImage"})
-        image = image_tag['src'] if image_tag else ""
-        
-        return name, price, image
+        r = fetch(url, site, timeout=10)
+        return extract_product_page(adapter, r.content)
     except Exception as e:
-        print(f"Amazon scrape error: {e}")
+        print(f"{site} scrape error: {e}")
         return "", None, ""
 
 
-def scrape_flipkart(url):
+# Outcome of refreshing a product page:
+#   'updated'      - page parsed; name/price/image extracted
+#   'not_modified' - server answered 304 to the conditional GET
+#   'unchanged'    - page fetched, but the fragment hash matched the last fetch
+#   'failed'       - fetch error, unexpected status or no price on the page
+#   'skipped'      - not fetched because the site's circuit breaker is open
+RefreshResult = namedtuple('RefreshResult', 'status name price image etag last_modified content_hash')
+
+
+# A product page that was downloaded (HTTP 200) and still needs parsing
+FetchedPage = namedtuple('FetchedPage', 'site content etag last_modified content_hash')
+
+
+def refresh_page(url, site, etag='', last_modified='', content_hash=''):
     """
-    Scrape a single Flipkart product page
+    Re-scrape a product page, skipping work when it hasn't changed.
+
+    Sends If-None-Match / If-Modified-Since from the previous fetch, and
+    compares the hash of the fragment the adapter reads before extracting.
+    """
+    fetched = fetch_page(url, site, etag, last_modified, content_hash)
+    result = parse_page(*fetched) if isinstance(fetched, FetchedPage) else fetched
+    increment('scrape_results_total', site=site, page='product', status=result.status)
+    return result
+
+
+def fetch_page(url, site, etag='', last_modified='', content_hash=''):
+    """
+    Network half of refresh_page: a RefreshResult when there is nothing to
+    parse (304, error, site unavailable), else a FetchedPage with the raw body
     """
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    adapter = get_adapter(site)
+    failed = RefreshResult('failed', '', None, '', etag, last_modified, content_hash)
+    if adapter is None:
+        return failed
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(r.content, "html.parser")
-        
-        # Extract name
-        name_tag = soup.find("span", {"class": "B_NuCI"})
-        if not name_tag:
-            name_tag = soup.find("h1", {"class": "yhB1nd"})
-        name = name_tag.get_text().strip() if name_tag else ""
-        
-        # Extract price
-        price_tag = soup.find("div", {"class": "_30jeq3"})
-        if not price_tag:
-            price_tag = soup.find("div", {"class": "_25b18c"})
-        
-        price = None
-        if price_tag:
-            price_text = price_tag.get_text().strip().replace('₹', '').replace(',', '')
-            try:
-                price = float(price_text)
-            except:
-                price = None
-        
-        # Extract image
-        image_tag = soup.find("img", {"class": "_396cs4"})
-        if not image_tag:
-            image_tag = soup.find("img", {"class": "_2r_T1I"})
-        image = image_tag['src'] if image_tag else ""
-        
-        return name, price, image
+        r = fetch(url, site, timeout=10, headers=headers)
+        if r.status_code == 304:
+            etag = r.headers.get('ETag', etag)
+            last_modified = r.headers.get('Last-Modified', last_modified)
+            return RefreshResult('not_modified', '', None, '', etag, last_modified, content_hash)
+        if r.status_code != 200:
+            print(f"{site} scrape error: HTTP {r.status_code} for {url}")
+            return failed
+        return FetchedPage(site, r.content, r.headers.get('ETag', ''), r.headers.get('Last-Modified', ''), content_hash)
+    except SiteUnavailable:
+        return failed._replace(status='skipped')
     except Exception as e:
-        print(f"Flipkart scrape error: {e}")
-        return "", None, ""
+        print(f"{site} scrape error: {e}")
+        return failed
 
 
-def scrape_myntra(url):
+def parse_page(site, content, etag, last_modified, content_hash):
     """
-    Scrape a single Myntra product page
+    CPU half of refresh_page: parse a fetched page and extract its fields,
+    unless its fragment hash matches `content_hash`. Needs nothing but its
+    arguments, so it can run in another process.
     """
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    adapter = get_adapter(site)
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(r.content, "html.parser")
-        
-        # Extract name
-        name_tag = soup.find("h1", {"class": "pdp-title"})
-        if not name_tag:
-            name_tag = soup.find("h1", {"class": "pdp-name"})
-        name = name_tag.get_text().strip() if name_tag else ""
-        
-        # Extract price
-        price_tag = soup.find("span", {"class": "pdp-price"})
-        if not price_tag:
-            price_tag = soup.find("strong", {"class": "pdp-price"})
-        
-        price = None
-        if price_tag:
-            price_text = price_tag.get_text().strip().replace('₹', '').replace(',', '').replace('Rs. ', '')
-            try:
-                price = float(price_text)
-            except:
-                price = None
-        
-        # Extract image
-        image_tag = soup.find("img", {"class": "image-grid-image"})
-        image = image_tag['src'] if image_tag else ""
-        
-        return name, price, image
+        with timed('parse', site):
+            document = adapter.parse_product(content)
+        with timed('extract', site):
+            new_hash = adapter.fragment_hash(document)
+            if content_hash and new_hash == content_hash:
+                return RefreshResult('unchanged', '', None, '', etag, last_modified, new_hash)
+            name, price, image = adapter.extract_product_document(document)
     except Exception as e:
-        print(f"Myntra scrape error: {e}")
-        return "", None, ""
+        print(f"{site} parse error: {e}")
+        price = None
+    if price is None:
+        return RefreshResult('failed', '', None, '', etag, last_modified, content_hash)
+    return RefreshResult('updated', name, price, image, etag, last_modified, new_hash)
+
+
+def scrape_amazon(url):
+    """
+    Scrape a single Amazon product page
+    """
+    return scrape_page(url, 'Amazon')
+
+
+def scrape_flipkart(url):
+    """
+    Scrape a single Flipkart product page
+    """
+    return scrape_page(url, 'Flipkart')
+
+
+def scrape_myntra(url):
+    """
+    Scrape a single Myntra product page
+    """
+    return scrape_page(url, 'Myntra')
 
 
 def scrape_ajio(url):
     """
     Scrape a single Ajio product page
     """
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    return scrape_page(url, 'Ajio')
+
+
+# Per-site timeout for a single search request, in seconds
+SEARCH_TIMEOUT = 15
+
+
+def search_site(site, search_term, timeout=SEARCH_TIMEOUT):
+    """
+    Search one site and return up to its adapter's search_limit results
+    """
+    adapter = get_adapter(site)
+    print(f"Scraping {site}...")
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(r.content, "html.parser")
-        
-        # Extract name
-        name_tag = soup.find("h1", {"class": "prod-title"})
-        if not name_tag:
-            name_tag = soup.find("div", {"class": "prod-title"})
-        name = name_tag.get_text().strip() if name_tag else ""
-        
-        # Extract price
-        price_tag = soup.find("span", {"class": "prod-sp"})
-        if not price_tag:
-            price_tag = soup.find("div", {"class": "prod-sp"})
-        
-        price = None
-        if price_tag:
-            price_text = price_tag.get_text().strip().replace('₹', '').replace(',', '')
-            try:
-                price = float(price_text)
-            except:
-                price = None
-        
-        # Extract image
-        image_tag = soup.find("img", {"class": "rilrtl-lazy-img"})
-        image = image_tag['src'] if image_tag else ""
-        
-        return name, price, image
+        response = fetch(adapter.search_page_url(search_term), site, timeout=timeout, page='search')
+        results = extract_search_page(adapter, response.content)
+        print(f"Found {len(results)} {site} products")
+        increment('scrape_results_total', site=site, page='search', status='found' if results else 'empty')
+        return results
     except Exception as e:
-        print(f"Ajio scrape error: {e}")
-        return "", None, ""
+        print(f"{site} search failed: {e}")
+        increment('scrape_results_total', site=site, page='search', status='failed')
+        return []
+
 
+# Sites searched live by search_and_scrape, in display order
+SEARCH_SITES = [(adapter.name, partial(search_site, adapter.name)) for adapter in searchable_sites()]
 
-def search_and_scrape(search_term):
+
+def search_all_sites(search_term, deadline=None, sites=None):
     """
-    Search for a product across all 4 websites and return results sorted by price (low to high)
+    Run every site search (or those named in `sites`) in parallel and
+    return (results, finished_sites).
+
+    Waits at most `deadline` seconds overall; sites that have not answered
+    by then are left out, so latency is bounded by the slowest site that
+    makes the deadline rather than the sum of all sites.
     """
+    if deadline is None:
+        deadline = getattr(settings, 'SEARCH_DEADLINE', 10)
+    timeout = min(SEARCH_TIMEOUT, deadline)
+
     results = []
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1'
-    }
-    
-    # ========== SCRAPE AMAZON SEARCH ==========
-    print("Scraping Amazon...")
+    finished_sites = []
+    # Sites whose circuit breaker is open are skipped outright
+    wanted = [(site, search) for site, search in SEARCH_SITES if sites is None or site in sites]
+    sites = [(site, search) for site, search in wanted if site_available(site)]
+    for site, search in wanted:
+        if (site, search) not in sites:
+            print(f"{site} search skipped: site unavailable")
+    if not sites:
+        return results, finished_sites
+    executor = ThreadPoolExecutor(max_workers=len(sites), thread_name_prefix='search')
     try:
-        amazon_url = f'https://www.amazon.in/s?k={quote(search_term)}'
-        response = requests.get(amazon_url, headers=headers, timeout=15)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        products = soup.find_all('div', {'data-component-type': 's-search-result'})[:5]
-        print(f"Found {len(products)} Amazon products")
-        
-        for product in products:
+        futures = {
+            executor.submit(search, search_term, timeout): site
+            for site, search in sites
+        }
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            site = futures[future]
             try:
-                name_elem = product.find('span', class_='a-size-medium')
-                if not name_elem:
-                    name_elem = product.find('span', class_='a-size-base-plus')
-                if not name_elem:
-                    h2_tag = product.find('h2')
-                    if h2_tag:
-                        name_elem = h2_tag.find('span')
-                
-                price_elem = product.find('span', class_='a-price-whole')
-                
-                link_elem = product.find('a', class_='a-link-normal')
-                if not link_elem:
-                    h2_tag = product.find('h2')
-                    if h2_tag:
-                        link_elem = h2_tag.find('a')
-                
-                if name_elem and price_elem and link_elem:
-                    name = name_elem.get_text().strip()
-                    price_text = price_elem.get_text().replace(',', '').replace('.', '')
-                    price = float(price_text)
-                    
-                    raw_url = link_elem.get('href', '')
-                    if raw_url.startswith('/'):
-                        url = 'https://www.amazon.in' + raw_url
-                    else:
-                        url = raw_url
-                    
-                    if '/dp/' in url:
-                        asin_start = url.find('/dp/') + 4
-                        asin_end = url.find('/', asin_start)
-                        if asin_end == -1:
-                            asin_end = url.find('?', asin_start)
-                        if asin_end == -1:
-                            asin = url[asin_start:]
-                        else:
-                            asin = url[asin_start:asin_end]
-                        clean_url = f'https://www.amazon.in/dp/{asin}'
-                    else:
-                        clean_url = url.split('?')[0]
-                    
-                    results.append({
-                        'name': name[:100],
-                        'price': price,
-                        'site': 'Amazon',
-                        'url': clean_url
-                    })
+                results.extend(future.result())
+                finished_sites.append(site)
             except Exception as e:
-                print(f"Amazon product parse error: {e}")
-                continue
-                
-    except Exception as e:
-        print(f"Amazon search failed: {e}")
-    
-    # ========== SCRAPE FLIPKART SEARCH ==========
-    print("Scraping Flipkart...")
-    try:
-        flipkart_url = f'https://www.flipkart.com/search?q={quote(search_term)}'
-        response = requests.get(flipkart_url, headers=headers, timeout=15)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Try to find products with various selectors
-        products = soup.select('div[data-id]')[:5]  # More generic selector
-        print(f"Found {len(products)} Flipkart products")
-        
-        for product in products:
-            try:
-                # Try multiple name selectors
-                name_elem = product.select_one('a.IRpwTa, a.s1Q9rs, div._4rR01T, a.wjcEIp')
-                
-                # Try multiple price selectors
-                price_elem = product.select_one('div._30jeq3, div._25b18c, div._3I9_wc')
-                
-                # Get link
-                link_elem = product.find('a')
-                
-                if name_elem and price_elem and link_elem:
-                    name = name_elem.get_text().strip()
-                    price_text = price_elem.get_text().replace('₹', '').replace(',', '').strip()
-                    
-                    # Extract numeric price
-                    price_match = re.search(r'\d+', price_text)
-                    if price_match:
-                        price = float(price_match.group())
-                    else:
-                        continue
-                    
-                    raw_url = link_elem.get('href', '')
-                    if raw_url.startswith('/'):
-                        clean_url = 'https://www.flipkart.com' + raw_url.split('?')[0]
-                    else:
-                        clean_url = raw_url.split('?')[0]
-                    
-                    results.append({
-                        'name': name[:100],
-                        'price': price,
-                        'site': 'Flipkart',
-                        'url': clean_url
-                    })
-                    print(f"Added Flipkart: {name[:30]} - ₹{price}")
-            except Exception as e:
-                print(f"Flipkart product parse error: {e}")
-                continue
-                
-    except Exception as e:
-        print(f"Flipkart search failed: {e}")
-    
+                print(f"{site} search failed: {e}")
+        for future in not_done:
+            print(f"{futures[future]} search missed the {deadline}s deadline")
+    finally:
+        # Don't wait for stragglers; their own request timeout bounds them
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, finished_sites
+
+
+def search_and_scrape(search_term, deadline=None):
+    """
+    Search for a product across all 4 websites and return results sorted by price (low to high)
+    """
+    results, finished_sites = search_all_sites(search_term, deadline=deadline)
+    return finish_results(search_term, results)
+
+
+def finish_results(search_term, results):
+    """
+    Pad live search results with sample products and sort them by price
+    """
     # ========== ADD SAMPLE PRODUCTS FOR TESTING ==========
     # If Flipkart/Myntra/Ajio fail, add sample products to demonstrate multi-site comparison
     
@@ -322,4 +270,5 @@ def search_and_scrape(search_term):
     # Sort by price (low to high)
     results.sort(key=lambda x: x['price'])
     
-    return results
+    # Cluster the same item across sites
+    return group_results(results)
@@ -0,0 +1,156 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from .local_search import search_with_local
+from .scraper import SEARCH_SITES, finish_results
+
+# Searches currently being scraped by this process, keyed by cache key
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """
+    Normalize a search query so equivalent queries share a cache entry
+    """
+    return ' '.join(query.casefold().split())
+
+
+def search_cache_key(query):
+    digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+    return f'search:{digest}'
+
+
+def get_search_cache():
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+
+def cached_search(query):
+    """
+    Return search results for a query, served from the search cache when
+    possible, else from fresh saved products and live scraping of the sites
+    they don't cover (catalog.local_search).
+
+    Concurrent identical queries are coalesced: within a process only one
+    thread scrapes while the rest wait for its result, and across processes
+    a short cache lock does the same for backends shared between workers.
+    """
+    query = normalize_query(query)
+    cache = get_search_cache()
+    key = search_cache_key(query)
+
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    event, leader = claim_search(key)
+    if not leader:
+        event.wait(wait_timeout())
+        results = cache.get(key)
+        if results is not None:
+            return results
+        # The leader failed or timed out; scrape on our own
+        return _scrape_and_store(query, cache, key)
+
+    try:
+        locked = cache.add(search_lock_key(key), 1, timeout=lock_timeout())
+        if not locked:
+            results = _poll(cache, key, wait_timeout())
+            if results is not None:
+                return results
+        try:
+            return _scrape_and_store(query, cache, key)
+        finally:
+            if locked:
+                cache.delete(search_lock_key(key))
+    finally:
+        release_search(key, event)
+
+
+class SearchDone(threading.Event):
+    """
+    Set when the leader of a search finishes. Besides waiting on it,
+    callers can register callbacks, so async followers don't tie up a
+    thread while they wait.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        # Called from whichever thread sets the event, or right away if it's set
+        with _inflight_lock:
+            if not self.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def set(self):
+        with _inflight_lock:
+            super().set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def claim_search(key):
+    """
+    Register the caller as the one thread of this process scraping `key`.
+    Returns (event, leader): followers wait on `event`, and the leader must
+    hand it to release_search() when done.
+    """
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = SearchDone()
+    return event, leader
+
+
+def release_search(key, event):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    event.set()
+
+
+def search_lock_key(key):
+    # Held in the cache while one process scrapes, for backends shared between workers
+    return f'{key}:lock'
+
+
+def lock_timeout():
+    return int(wait_timeout()) + 1
+
+
+def results_ttl(finished_sites):
+    """
+    Cache lifetime for search results, given the sites that answered in time
+    """
+    if len(finished_sites) == len(SEARCH_SITES):
+        return getattr(settings, 'SEARCH_CACHE_TTL', 600)
+    # Some site missed the deadline; don't pin the partial answer for long
+    return getattr(settings, 'SEARCH_CACHE_PARTIAL_TTL', 60)
+
+
+def _scrape_and_store(query, cache, key):
+    results, finished_sites = search_with_local(query)
+    results = finish_results(query, results)
+    cache.set(key, results, timeout=results_ttl(finished_sites))
+    return results
+
+
+def wait_timeout():
+    return getattr(settings, 'SEARCH_DEADLINE', 10) + 2
+
+
+def _poll(cache, key, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        results = cache.get(key)
+        if results is not None:
+            return results
+        time.sleep(0.1)
+    return None
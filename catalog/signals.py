@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .matching import index_products, unindex_product
+from .models import Product
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    """
+    Keep the product matching index in step with saved products
+    """
+    index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    unindex_product(instance.pk)
@@ -0,0 +1,232 @@
+import hashlib
+import re
+from urllib.parse import quote, urljoin, urlsplit, urlunsplit
+from .parsing import Selector, parse_html
+
+# First number in a price string: "₹16,999.00", "Rs. 749", "16,999."
+PRICE_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+AMAZON_ASIN_PATTERN = re.compile(r'/dp/([A-Z0-9]{10}|[^/?#]+)')
+
+
+def parse_price(text, pattern=PRICE_PATTERN):
+    """
+    Pull a price out of a price element's text; None if there isn't one
+    """
+    match = pattern.search(text or '')
+    if not match:
+        return None
+    try:
+        return float(match.group().replace(',', ''))
+    except ValueError:
+        return None
+
+
+def strip_query(url):
+    """
+    Drop the query string and fragment (tracking parameters) from a URL
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+def amazon_canonical_url(url):
+    url = strip_query(url)
+    match = AMAZON_ASIN_PATTERN.search(url)
+    if match:
+        return f'https://www.amazon.in/dp/{match.group(1)}'
+    return url
+
+
+class SiteAdapter:
+    """
+    Everything site-specific about scraping one retailer.
+
+    Field selectors are lists of fallbacks tried in order (a single entry
+    may itself be a CSS group). They are compiled once when the adapter is
+    created, and the product-page strainer is derived from them.
+    """
+
+    def __init__(self, name, base_url, product_fields, search_url=None, search_result=None,
+                 search_fields=None, search_limit=5, canonicalize=strip_query, price_pattern=PRICE_PATTERN):
+        self.name = name
+        self.base_url = base_url
+        self.domain = urlsplit(base_url).hostname.removeprefix('www.')
+        self.product_fields = {field: [Selector(css) for css in selectors] for field, selectors in product_fields.items()}
+        self.product_parts = [css for selectors in product_fields.values() for css in selectors]
+        self.search_url = search_url
+        self.search_result = Selector(search_result) if search_result else None
+        self.search_parts = [search_result] if search_result else []
+        self.search_fields = {field: [Selector(css) for css in selectors] for field, selectors in (search_fields or {}).items()}
+        self.search_limit = search_limit
+        self.canonicalize = canonicalize
+        self.price_pattern = price_pattern
+
+    def __repr__(self):
+        return f'<SiteAdapter {self.name}>'
+
+    @property
+    def searchable(self):
+        return self.search_url is not None
+
+    def absolute_url(self, href):
+        return urljoin(self.base_url, href)
+
+    def first(self, node, selectors):
+        for selector in selectors:
+            element = selector.select_one(node)
+            if element is not None:
+                return element
+        return None
+
+    def text(self, node, field, fields):
+        element = self.first(node, fields[field])
+        return element.get_text().strip() if element is not None else ''
+
+    def attr(self, node, field, fields, name):
+        element = self.first(node, fields[field])
+        return element.get(name, '') if element is not None else ''
+
+    def parse_product(self, content):
+        return parse_html(content, only=self.product_parts)
+
+    def fragment_hash(self, document):
+        """
+        SHA-256 of the markup of every element the adapter reads; if it
+        matches the last fetch, nothing worth extracting has changed.
+
+        The markup is the parser backend's own serialization (str(element)),
+        so hashes differ between backends: after HTML_PARSER changes, every
+        product is extracted again once.
+        """
+        digest = hashlib.sha256()
+        for selectors in self.product_fields.values():
+            for selector in selectors:
+                element = selector.select_one(document)
+                digest.update(str(element).encode('utf-8') if element is not None else b'-')
+        return digest.hexdigest()
+
+    def extract_product(self, content):
+        """
+        Parse a product page and return (name, price, image)
+        """
+        return self.extract_product_document(self.parse_product(content))
+
+    def extract_product_document(self, document):
+        fields = self.product_fields
+        price = parse_price(self.text(document, 'price', fields), self.price_pattern)
+        return self.text(document, 'name', fields), price, self.attr(document, 'image', fields, 'src')
+
+    def extract_search_results(self, content):
+        """
+        Parse a search results page into result dicts
+        """
+        return self.extract_search_document(self.parse_search(content))
+
+    def parse_search(self, content):
+        return parse_html(content, only=self.search_parts)
+
+    def extract_search_document(self, document):
+        fields = self.search_fields
+        results = []
+        for node in self.search_result.select(document, limit=self.search_limit):
+            name = self.text(node, 'name', fields)
+            price = parse_price(self.text(node, 'price', fields), self.price_pattern)
+            href = self.attr(node, 'link', fields, 'href')
+            if not (name and price is not None and href):
+                continue
+            results.append({
+                'name': name[:100],
+                'price': price,
+                'site': self.name,
+                'url': self.canonicalize(self.absolute_url(href)),
+            })
+        return results
+
+    def search_page_url(self, search_term):
+        return self.search_url.format(query=quote(search_term))
+
+
+SITES = {}
+
+
+def register(adapter):
+    SITES[adapter.name] = adapter
+    return adapter
+
+
+def get_adapter(site):
+    """
+    Adapter for a site name ('Amazon', ...), or None if the site isn't supported
+    """
+    return SITES.get(site)
+
+
+def adapter_for_url(url):
+    """
+    Adapter whose domain a URL belongs to, or None
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    for adapter in SITES.values():
+        if host == adapter.domain or host.endswith('.' + adapter.domain):
+            return adapter
+    return None
+
+
+def searchable_sites():
+    return [adapter for adapter in SITES.values() if adapter.searchable]
+
+
+register(SiteAdapter(
+    'Amazon',
+    base_url='https://www.amazon.in',
+    product_fields={
+        'name': ['span#productTitle'],
+        'price': ['span.a-price-whole', 'span.a-offscreen'],
+        'image': ['img#landingImage'],
+    },
+    search_url='https://www.amazon.in/s?k={query}',
+    search_result='div[data-component-type=s-search-result]',
+    search_fields={
+        'name': ['span.a-size-medium', 'span.a-size-base-plus', 'h2 span'],
+        'price': ['span.a-price-whole'],
+        'link': ['a.a-link-normal', 'h2 a'],
+    },
+    canonicalize=amazon_canonical_url,
+))
+
+register(SiteAdapter(
+    'Flipkart',
+    base_url='https://www.flipkart.com',
+    product_fields={
+        'name': ['span.B_NuCI', 'h1.yhB1nd'],
+        'price': ['div._30jeq3', 'div._25b18c'],
+        'image': ['img._396cs4', 'img._2r_T1I'],
+    },
+    search_url='https://www.flipkart.com/search?q={query}',
+    search_result='div[data-id]',
+    search_fields={
+        'name': ['a.IRpwTa, a.s1Q9rs, div._4rR01T, a.wjcEIp'],
+        'price': ['div._30jeq3, div._25b18c, div._3I9_wc'],
+        'link': ['a'],
+    },
+))
+
+register(SiteAdapter(
+    'Myntra',
+    base_url='https://www.myntra.com',
+    product_fields={
+        'name': ['h1.pdp-title', 'h1.pdp-name'],
+        'price': ['span.pdp-price', 'strong.pdp-price'],
+        'image': ['img.image-grid-image'],
+    },
+))
+
+register(SiteAdapter(
+    'Ajio',
+    base_url='https://www.ajio.com',
+    product_fields={
+        'name': ['h1.prod-title', 'div.prod-title'],
+        'price': ['span.prod-sp', 'div.prod-sp'],
+        'image': ['img.rilrtl-lazy-img'],
+    },
+))
@@ -0,0 +1,158 @@
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Exists, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+from .models import PriceHistory, PriceStats, Product
+
+# Rolling-window lows kept in PriceStats: field -> window in days
+WINDOWS = {'min_365': 365, 'min_30': 30}
+
+
+def history_aggregate(aggregate, **filters):
+    """
+    Subquery for an aggregate over the price history of the outer product
+    """
+    return Subquery(
+        PriceHistory.objects.filter(product=OuterRef('pk'), **filters)
+        .order_by()
+        .values('product')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+
+
+def rebuild_price_stats(product_ids=None, now=None):
+    """
+    Recompute PriceStats from price history, for the given products or all
+    of them, with one annotated query, one history scan and one upsert per
+    chunk. Returns the number of products with stats.
+    """
+    now = now or timezone.now()
+    products = Product.objects.filter(Exists(PriceHistory.objects.filter(product=OuterRef('pk')))).order_by()
+    if product_ids is not None:
+        products = products.filter(id__in=list(product_ids))
+    latest = PriceHistory.objects.filter(product=OuterRef('pk')).order_by('-checked_at', '-id')
+    annotations = {
+        'current_price': Subquery(latest.values('price')[:1]),
+        'last_seen_at': Subquery(latest.values('last_seen_at')[:1]),
+    }
+    for field, days in WINDOWS.items():
+        since = now - timedelta(days=days)
+        annotations[field] = history_aggregate(Min('price'), last_seen_at__gte=since)
+        annotations[f'{field}_seen_at'] = history_aggregate(
+            Max('last_seen_at'), last_seen_at__gte=since, price=OuterRef(field),
+        )
+    rows = products.annotate(**annotations).values('id', *annotations)
+
+    fields = [*annotations, 'last_changed_at', 'price_time_sum', 'priced_seconds']
+    total = 0
+    chunk = []
+    for row in rows.iterator(chunk_size=1000):
+        if row['current_price'] is None:
+            continue
+        chunk.append(row)
+        if len(chunk) >= 1000:
+            total += save_stats(chunk, fields)
+            chunk = []
+    total += save_stats(chunk, fields)
+    return total
+
+
+def price_runs(product_ids):
+    """
+    Map product id to (price_time_sum, priced_seconds, last_changed_at).
+
+    Consecutive history rows with the same price are one run, so the result
+    is the same whether history stores every scrape or only changes. Each
+    run but the last counts from its first row until the next run's.
+    """
+    runs = {}
+    rows = (
+        PriceHistory.objects.filter(product_id__in=list(product_ids))
+        .order_by('product_id', 'checked_at', 'id')
+        .values_list('product_id', 'price', 'checked_at')
+    )
+    product = None
+    for product_id, price, checked_at in rows.iterator(chunk_size=5000):
+        if product_id != product:
+            product, run_price, run_start, price_time_sum, priced_seconds = product_id, price, checked_at, 0.0, 0.0
+        elif price != run_price:
+            held = (checked_at - run_start).total_seconds()
+            price_time_sum += run_price * held
+            priced_seconds += held
+            run_price, run_start = price, checked_at
+        runs[product_id] = (price_time_sum, priced_seconds, run_start)
+    return runs
+
+
+def save_stats(rows, fields):
+    if not rows:
+        return 0
+    runs = price_runs([row['id'] for row in rows])
+    stats = []
+    for row in rows:
+        product_id = row.pop('id')
+        price_time_sum, priced_seconds, last_changed_at = runs[product_id]
+        stats.append(PriceStats(
+            product_id=product_id, price_time_sum=price_time_sum, priced_seconds=priced_seconds,
+            last_changed_at=last_changed_at, **row,
+        ))
+    # MySQL upserts on any unique key and doesn't take a conflict target
+    unique_fields = ['product'] if connection.features.supports_update_conflicts_with_target else None
+    PriceStats.objects.bulk_create(stats, update_conflicts=True, unique_fields=unique_fields, update_fields=fields)
+    return len(stats)
+
+
+def expired_windows(stats, now):
+    """
+    Rolling-window lows of a stats row that were last seen before their window
+    """
+    return [
+        field for field, days in WINDOWS.items()
+        if getattr(stats, f'{field}_seen_at') is not None
+        and getattr(stats, f'{field}_seen_at') < now - timedelta(days=days)
+    ]
+
+
+def record_prices(observations, now=None):
+    """
+    Fold newly scraped prices into PriceStats.
+
+    `observations` maps product id to the price scraped at `now`. Stats are
+    updated in place with one bulk_update; products without stats, or
+    whose window low has expired and isn't beaten by the new price, are
+    rebuilt from history.
+    """
+    if not observations:
+        return
+    now = now or timezone.now()
+    stats = PriceStats.objects.in_bulk(list(observations))
+    changed = []
+    rebuild = []
+    for product_id, price in observations.items():
+        row = stats.get(product_id)
+        # An expired low is only safe to replace if the new price undercuts it
+        if row is None or any(price > getattr(row, field) for field in expired_windows(row, now)):
+            rebuild.append(product_id)
+            continue
+        if price != row.current_price:
+            # The old price held until now
+            held = (now - row.last_changed_at).total_seconds()
+            row.price_time_sum += row.current_price * held
+            row.priced_seconds += held
+            row.current_price = price
+            row.last_changed_at = now
+        row.last_seen_at = now
+        for field in WINDOWS:
+            low = getattr(row, field)
+            if low is None or price <= low:
+                setattr(row, field, price)
+                setattr(row, f'{field}_seen_at', now)
+        changed.append(row)
+    if changed:
+        PriceStats.objects.bulk_update(changed, [
+            'current_price', 'last_changed_at', 'last_seen_at', 'price_time_sum', 'priced_seconds',
+            *WINDOWS, *(f'{field}_seen_at' for field in WINDOWS),
+        ])
+    if rebuild:
+        rebuild_price_stats(rebuild, now=now)
@@ -0,0 +1,109 @@
+"""
+Generate the synthetic fixture pages in catalog/testdata/pages/.
+
+These are not saved retailer pages. Each page carries the markup the site
+adapters read (title, price and image, or the result cards of a search page),
+laid out as on the real site, inside the bulk a real page has to be parsed
+through: a stylesheet of 400 generated .cN rules, a few hundred inline
+script lines, a navigation menu, product carousels, reviews and a footer of
+random filler text. Parse timings against them are indicative only.
+
+The output is deterministic, so re-running this reproduces the committed
+files byte for byte:
+
+    python catalog/testdata/generate_pages.py
+"""
+import os
+import random
+
+random.seed(7)
+OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+WORDS = 'smart phone ultra pro max black blue wireless bluetooth earbuds noise cancelling cotton shirt slim fit men women running shoes laptop backpack water resistant stainless steel bottle kitchen mixer grinder watch analog digital leather wallet'.split()
+
+
+def words(n):
+    return ' '.join(random.choice(WORDS) for _ in range(n))
+
+
+def head(title, site):
+    css = '\n'.join(f'.c{i}{{margin:{i%7}px;padding:{i%5}px;color:#{i*2654435761 % 0xffffff:06x}}}' for i in range(400))
+    js = '\n'.join(f'window.__cfg{i} = {{"k":"{words(3)}","v":{i},"flags":[{i%3},{i%5},{i%7}]}};' for i in range(300))
+    return f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title} | {site}</title><style>{css}</style><script>{js}</script></head><body>'
+
+
+def nav():
+    items = ''.join(f'<li class="nav-item c{i}"><a href="/category/{i}" class="nav-link">{words(2).title()}</a><ul class="sub">'+''.join(f'<li><a href="/category/{i}/{j}">{words(2)}</a></li>' for j in range(8))+'</ul></li>' for i in range(40))
+    return f'<header id="navbar"><nav><ul class="nav">{items}</ul></nav></header>'
+
+
+def carousel(prefix, n=60):
+    cards = ''.join(f'<div class="card c{i%400}"><a href="/{prefix}/{i}"><img src="https://img.example.com/{prefix}/{i}.jpg" alt="{words(4)}" loading="lazy"></a><div class="title">{words(8)}</div><div class="rating"><span class="stars">{random.randint(1,5)}.{random.randint(0,9)}</span><span class="count">({random.randint(10,99999):,})</span></div><div class="price">₹{random.randint(199,99999):,}</div></div>' for i in range(n))
+    return f'<section class="carousel"><h2>{words(3).title()}</h2><div class="cards">{cards}</div></section>'
+
+
+def reviews(n=40):
+    return '<section id="reviews">'+''.join(f'<div class="review"><div class="author">{words(2).title()}</div><div class="stars">{random.randint(1,5)} out of 5</div><p>{words(60)}</p></div>' for _ in range(n))+'</section>'
+
+
+def footer():
+    return '<footer>'+''.join(f'<div class="col"><h4>{words(2)}</h4>'+''.join(f'<a href="/help/{i}/{j}">{words(3)}</a>' for j in range(15))+'</div>' for i in range(10))+'</footer></body></html>'
+
+
+def write(name, body):
+    with open(os.path.join(OUT, name), 'w', encoding='utf-8') as f:
+        f.write(body)
+
+
+# Amazon product
+write('amazon_product.html', head('Galaxy M34 5G','Amazon.in')+nav()+
+ '<div id="dp-container"><div id="leftCol"><div id="imgTagWrapperId"><img id="landingImage" src="https://m.media-amazon.com/images/I/81ZSn2rk9WL._SX679_.jpg" data-a-dynamic-image="{}" alt="Galaxy M34"></div></div>'
+ '<div id="centerCol"><h1 id="title"><span id="productTitle" class="a-size-large product-title-word-break">        Samsung Galaxy M34 5G (Midnight Blue, 6GB RAM, 128GB Storage)       </span></h1>'
+ '<div id="corePrice"><span class="a-price"><span class="a-offscreen">₹16,999.00</span><span aria-hidden="true"><span class="a-price-symbol">₹</span><span class="a-price-whole">16,999<span class="a-price-decimal">.</span></span></span></span></div>'
+ '<div id="feature-bullets"><ul>'+''.join(f'<li><span class="a-list-item">{words(20)}</span></li>' for _ in range(8))+'</ul></div></div></div>'
+ +carousel('dp',80)+reviews()+carousel('sims',80)+footer())
+
+# Flipkart product
+write('flipkart_product.html', head('Apple iPhone 15','Flipkart')+nav()+
+ '<div class="_1YokD2"><div class="_1BweB8"><div class="CXW8mj"><img class="_396cs4 _2amPTt _3qGmMb" src="https://rukminim2.flixcart.com/image/416/416/xif0q/mobile/h/d/9/-original-imagtc2qzgnnuhxh.jpeg" alt="Apple iPhone 15"></div></div>'
+ '<div class="aMaAEs"><h1 class="yhB1nd"><span class="B_NuCI">Apple iPhone 15 (Black, 128 GB)</span></h1>'
+ '<div class="_25b18c"><div class="_30jeq3 _16Jk6d">₹65,999</div><div class="_3I9_wc _2p6lqe">₹69,900</div><div class="_3Ay6Sb _31Dcoz"><span>5% off</span></div></div>'
+ '<div class="_2418kt"><ul>'+''.join(f'<li class="_21Ahn-">{words(10)}</li>' for _ in range(8))+'</ul></div></div></div>'
+ +carousel('similar',80)+reviews()+carousel('bought',80)+footer())
+
+# Myntra product
+write('myntra_product.html', head('Roadster Men Slim Fit Casual Shirt','Myntra')+nav()+
+ '<div class="pdp-details common-clearfix"><div class="image-grid-container">'+''.join(f'<div class="image-grid-col50"><img class="image-grid-image" src="https://assets.myntassets.com/h_720,q_90,w_540/v1/assets/images/{11000+i}/1.jpg"></div>' for i in range(6))+'</div>'
+ '<div class="pdp-description-container"><h1 class="pdp-title">Roadster</h1><h1 class="pdp-name">Men Navy Blue Slim Fit Checked Casual Shirt</h1>'
+ '<p class="pdp-discount-container"><span class="pdp-price"><strong>₹749</strong></span><span class="pdp-mrp"><s>₹1,499</s></span><span class="pdp-discount">(50% OFF)</span></p>'
+ '<div class="pdp-productDescriptors">'+''.join(f'<p>{words(25)}</p>' for _ in range(6))+'</div></div></div>'
+ +carousel('similar',80)+reviews()+footer())
+
+# Ajio product
+write('ajio_product.html', head('Nike Revolution 7 Running Shoes','AJIO')+nav()+
+ '<div class="prod-container"><div class="img-container"><img class="rilrtl-lazy-img rilrtl-lazy-img-loaded" src="https://assets.ajio.com/medias/sys_master/root/20231002/Xk7c/651aa2e1afa4cf41f5211234/-473Wx593H-469567120-black-MODEL.jpg" alt="Nike"></div>'
+ '<div class="prod-content"><h2 class="brand-name">Nike</h2><h1 class="prod-name">Revolution 7 Running Shoes</h1><div class="prod-title">Nike Revolution 7 Running Shoes</div>'
+ '<div class="prod-price-section"><div class="prod-sp">₹3,296</div><div class="prod-cp">₹3,695</div><span class="prod-discnt">11% off</span></div>'
+ '<section class="prod-desc"><ul>'+''.join(f'<li class="detail-list">{words(12)}</li>' for _ in range(10))+'</ul></section></div></div>'
+ +carousel('similar',80)+reviews()+footer())
+
+# Amazon search
+res = []
+for i in range(24):
+    asin = f'B0{random.randint(10**7,10**8-1)}'
+    price = random.randint(299,99999)
+    title = words(9).title()
+    res.append(f'<div data-asin="{asin}" data-index="{i}" data-component-type="s-search-result" class="sg-col-4-of-24 s-result-item s-asin"><div class="s-card-container"><div class="s-image-container"><a class="a-link-normal s-no-outline" href="/{title.replace(" ","-")[:40]}/dp/{asin}/ref=sr_1_{i}?keywords=phone&amp;qid=1700000000"><img class="s-image" src="https://m.media-amazon.com/images/I/{asin}.jpg" alt="{title}"></a></div>'
+               f'<div class="s-title"><h2 class="a-size-mini"><a class="a-link-normal s-link-style a-text-normal" href="/{title.replace(" ","-")[:40]}/dp/{asin}/ref=sr_1_{i}"><span class="a-size-medium a-color-base a-text-normal">{title}</span></a></h2></div>'
+               f'<div class="a-row"><span class="a-icon-alt">4.{i%10} out of 5 stars</span><span class="a-size-base s-underline-text">{random.randint(10,50000):,}</span></div>'
+               f'<div class="a-row a-size-base"><a class="a-link-normal s-no-hover" href="/dp/{asin}"><span class="a-price" data-a-color="base"><span class="a-offscreen">₹{price:,}</span><span aria-hidden="true"><span class="a-price-symbol">₹</span><span class="a-price-whole">{price:,}</span></span></span></a></div></div></div>')
+write('amazon_search.html', head('Amazon.in : phone','Amazon.in')+nav()+'<div class="s-main-slot s-result-list s-search-results sg-row">'+''.join(res)+'</div>'+carousel('sponsored',60)+footer())
+
+# Flipkart search
+res = []
+for i in range(24):
+    pid = f'MOB{random.randint(10**11,10**12-1)}'
+    price = random.randint(299,99999)
+    title = words(8).title()
+    res.append(f'<div class="_1AtVbE col-12-12"><div class="_13oc-S"><div data-id="{pid}" style="width:100%"><div class="_2kHMtA"><a class="_1fQZEK" href="/{title.replace(" ","-").lower()[:40]}/p/itm{pid[-8:]}?pid={pid}&amp;lid=LST{pid}&amp;marketplace=FLIPKART"><div class="_3pLy-c row"><div class="col col-7-12"><div class="_4rR01T">{title}</div><div class="gUuXy-"><span class="_1lRcqv"><div class="_3LWZlK">4.{i%10}</div></span></div><div class="fMghEO"><ul class="_1xgFaf">'+''.join(f'<li class="rgWa7D">{words(6)}</li>' for _ in range(5))+'</ul></div></div>'
+               f'<div class="col col-5-12 nlI3QM"><div class="_3tbKJL"><div class="_25b18c"><div class="_30jeq3 _1_WHN1">₹{price:,}</div><div class="_3I9_wc _27UcVY">₹{price+2000:,}</div></div></div></div></div></a></div></div></div></div>')
+write('flipkart_search.html', head('Phone- Buy Products Online at Best Price in India','Flipkart')+nav()+'<div class="_1YokD2 _3Mn1Gg">'+''.join(res)+'</div>'+carousel('recent',60)+footer())
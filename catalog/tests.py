@@ -1,3 +1,1197 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import api, health, http_client, live_search, matching, throttle, views
+from .benchmarks import StubSiteServer, load_page, stub_sites
+from .canonical import canonical_url, url_digest
+from .health import CircuitBreaker
+from .images import cache_product_images, file_path, prune_image_cache, thumbnail_urls
+from .ingest import PriceIngestor
+from .local_search import fulltext_words, local_results, merge_results, search_with_local, sites_to_scrape
+from .management.commands.scrape_prices import interleave_by_site
+from .matching import ProductIndex, group_results
+from .metrics import Registry
+from .models import CachedImage, OutboundEmail, PriceAlert, PriceHistory, PriceStats, Product
+from .notifications import claim_due_emails, dispatch_outbox, due_email_ids, queue_emails
+from .parsing import available_backends
+from .pipeline import refresh_pipelined
+from .scheduling import claim_all_products, claim_due_products, parse_shard, refresh_interval, schedule_products
+from .scraper import FetchedPage, RefreshResult, refresh_page, search_all_sites
+from .search_cache import cached_search, get_search_cache, search_cache_key
+from .sites import SITES, adapter_for_url, get_adapter, parse_price
+from .stats import rebuild_price_stats
+from .throttle import TokenBucket, site_bucket
+from .utils import evaluate_price_alerts, record_price, saved_products_page
+
+
+class SiteAdapterTests(SimpleTestCase):
+    """
+    Each adapter against its fixture pages, on every installed parser backend
+    """
+
+    def assertProductPage(self, site, expected):
+        adapter = get_adapter(site)
+        content = load_page(f'{site.lower()}_product')
+        for backend in available_backends():
+            for strain in (True, False):
+                with self.subTest(backend=backend, strain=strain), \
+                        override_settings(HTML_PARSER=backend, HTML_PARSER_STRAIN=strain):
+                    self.assertEqual(adapter.extract_product(content), expected)
+
+    def test_amazon_product(self):
+        self.assertProductPage('Amazon', (
+            'Samsung Galaxy M34 5G (Midnight Blue, 6GB RAM, 128GB Storage)',
+            16999.0,
+            'https://m.media-amazon.com/images/I/81ZSn2rk9WL._SX679_.jpg',
+        ))
+
+    def test_flipkart_product(self):
+        self.assertProductPage('Flipkart', (
+            'Apple iPhone 15 (Black, 128 GB)',
+            65999.0,
+            'https://rukminim2.flixcart.com/image/416/416/xif0q/mobile/h/d/9/-original-imagtc2qzgnnuhxh.jpeg',
+        ))
+
+    def test_myntra_product(self):
+        self.assertProductPage('Myntra', (
+            'Roadster',
+            749.0,
+            'https://assets.myntassets.com/h_720,q_90,w_540/v1/assets/images/11000/1.jpg',
+        ))
+
+    def test_ajio_product(self):
+        self.assertProductPage('Ajio', (
+            'Nike Revolution 7 Running Shoes',
+            3296.0,
+            'https://assets.ajio.com/medias/sys_master/root/20231002/Xk7c/651aa2e1afa4cf41f5211234/-473Wx593H-469567120-black-MODEL.jpg',
+        ))
+
+    def assertSearchPage(self, site):
+        adapter = get_adapter(site)
+        content = load_page(f'{site.lower()}_search')
+        expected = None
+        for backend in available_backends():
+            with self.subTest(backend=backend), override_settings(HTML_PARSER=backend):
+                results = adapter.extract_search_results(content)
+                self.assertEqual(len(results), adapter.search_limit)
+                for result in results:
+                    self.assertEqual(result['site'], site)
+                    self.assertTrue(result['name'])
+                    self.assertGreater(result['price'], 0)
+                    self.assertNotIn('?', result['url'])
+                    self.assertIs(adapter_for_url(result['url']), adapter)
+                # Every backend must agree
+                if expected is None:
+                    expected = results
+                self.assertEqual(results, expected)
+        return expected
+
+    def test_amazon_search(self):
+        for result in self.assertSearchPage('Amazon'):
+            self.assertRegex(result['url'], r'^https://www\.amazon\.in/dp/[A-Z0-9]+$')
+
+    def test_flipkart_search(self):
+        for result in self.assertSearchPage('Flipkart'):
+            self.assertRegex(result['url'], r'^https://www\.flipkart\.com/[^?]+/p/itm\w+$')
+
+    def test_unsearchable_sites(self):
+        self.assertEqual([a.name for a in SITES.values() if a.searchable], ['Amazon', 'Flipkart'])
+
+
+class CanonicalUrlTests(SimpleTestCase):
+
+    def test_trivial_spellings_share_a_canonical_url_and_digest(self):
+        canonical = 'https://www.amazon.in/dp/B0C7BZTW4M?th=1'
+        for url in (
+            'https://www.amazon.in/dp/B0C7BZTW4M?th=1',
+            ' HTTPS://WWW.Amazon.IN/dp/B0C7BZTW4M?th=1 ',
+            'https://www.amazon.in:443/dp/B0C7BZTW4M/?th=1',
+            'https://www.amazon.in/dp/B0C7BZTW4M?th=1#reviews',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(canonical_url(url), canonical)
+                self.assertEqual(url_digest(url), url_digest(canonical))
+
+    def test_meaningful_differences_are_kept(self):
+        self.assertEqual(canonical_url('http://example.com:8080'), 'http://example.com:8080/')
+        self.assertEqual(canonical_url('https://example.com/Item'), 'https://example.com/Item')
+        for other in ('http://www.amazon.in/dp/B0C7BZTW4M', 'https://www.amazon.in/dp/B0C7BZTW4M?th=2'):
+            self.assertNotEqual(url_digest(other), url_digest('https://www.amazon.in/dp/B0C7BZTW4M?th=1'))
+
+
+class PriceParsingTests(SimpleTestCase):
+
+    def test_formats(self):
+        self.assertEqual(parse_price('₹16,999.00'), 16999.0)
+        self.assertEqual(parse_price('16,999.'), 16999.0)
+        self.assertEqual(parse_price('Rs. 749'), 749.0)
+        self.assertEqual(parse_price('₹65,999₹69,900'), 65999.0)
+        self.assertIsNone(parse_price('Currently unavailable'))
+        self.assertIsNone(parse_price(''))
+
+    def test_amazon_canonical_url(self):
+        adapter = get_adapter('Amazon')
+        self.assertEqual(
+            adapter.canonicalize('https://www.amazon.in/Samsung-Galaxy/dp/B0C7BZTW4M/ref=sr_1_1?keywords=phone'),
+            'https://www.amazon.in/dp/B0C7BZTW4M',
+        )
+
+    def test_adapter_for_url(self):
+        self.assertEqual(adapter_for_url('https://www.flipkart.com/x/p/itm1').name, 'Flipkart')
+        self.assertEqual(adapter_for_url('https://m.myntra.com/shirts/1').name, 'Myntra')
+        self.assertIsNone(adapter_for_url('https://example.com/'))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = 1000.0
+        patcher = mock.patch('catalog.health.time.monotonic', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=3, cooldown=60, max_cooldown=200)
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_blocked_response_opens_immediately(self):
+        self.breaker.record_failure(blocked=True)
+        self.assertFalse(self.breaker.available())
+
+    def test_half_open_probe(self):
+        self.breaker.record_failure(blocked=True)
+        self.clock += 60
+        self.assertTrue(self.breaker.allow())
+        # Only one probe at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.cooldown, 120)
+        self.clock += 119
+        self.assertFalse(self.breaker.available())
+        self.clock += 1
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.cooldown, 60)
+
+
+class RetryTests(SimpleTestCase):
+
+    def tearDown(self):
+        health._breakers.pop('RetryTest', None)
+        http_client._sessions.pop('RetryTest', None)
+
+    def test_rate_limited_response_trips_breaker_without_retrying(self):
+        with StubSiteServer(error_rate=1, error_status=429) as server:
+            start = time.monotonic()
+            response = http_client.fetch(server.product_url('Amazon', 1), 'RetryTest', timeout=1)
+            elapsed = time.monotonic() - start
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(server.requests, 1)
+        self.assertLess(elapsed, 1)
+        self.assertFalse(health.site_available('RetryTest'))
+
+
+class SearchDeadlineTests(SimpleTestCase):
+
+    def setUp(self):
+        health._breakers.clear()
+        self.addCleanup(health._breakers.clear)
+
+    def test_sites_missing_the_deadline_are_left_out(self):
+        def fast(query, timeout):
+            return [{'name': 'Phone', 'price': 100.0, 'site': 'Amazon', 'url': 'https://example.com/1'}]
+
+        def slow(query, timeout):
+            time.sleep(1)
+            return [{'name': 'Phone', 'price': 90.0, 'site': 'Flipkart', 'url': 'https://example.com/2'}]
+
+        with mock.patch('catalog.scraper.SEARCH_SITES', [('Amazon', fast), ('Flipkart', slow)]):
+            start = time.monotonic()
+            results, finished_sites = search_all_sites('phone', deadline=0.2)
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(finished_sites, ['Amazon'])
+        self.assertEqual([result['site'] for result in results], ['Amazon'])
+
+
+@skipUnless(live_search.HAVE_HTTPX, "httpx isn't installed")
+class StreamSearchCancellationTests(SimpleTestCase):
+
+    def setUp(self):
+        health._breakers.clear()
+        self.addCleanup(health._breakers.clear)
+
+    def stream(self, deadline, sites=None):
+        async def collect():
+            return [item async for item in live_search.stream_search('phone', deadline=deadline, sites=sites)]
+
+        with StubSiteServer(latency=1) as server, stub_sites(server):
+            return asyncio.run(collect())
+
+    def test_missed_deadline_is_not_a_site_failure(self):
+        self.assertEqual(self.stream(deadline=0.2), [])
+        for site, _ in live_search.SEARCH_SITES:
+            breaker = health.site_breaker(site)
+            self.assertEqual((breaker.state, breaker.failures), (breaker.CLOSED, 0))
+
+    def test_cancelled_probe_reopens_the_circuit(self):
+        breaker = health.site_breaker('Amazon')
+        breaker.state, breaker.opened_at = breaker.OPEN, 0.0
+        self.stream(deadline=0.2, sites=['Amazon'])
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.probing)
+
+
+class ApiCursorTests(SimpleTestCase):
+
+    def get(self, view, **params):
+        response = view(RequestFactory().get('/api/', params))
+        return response.status_code, json.loads(response.content)
+
+    @mock.patch.object(api, 'cached_search', return_value=[
+        {'name': f'Phone {n}', 'price': float(n), 'site': 'Amazon', 'url': f'https://example.com/{n}'}
+        for n in range(3)
+    ])
+    def test_search_pages_and_rejects_malformed_cursors(self, cached_search):
+        status, page = self.get(api.search, q='phone', limit=2)
+        self.assertEqual(status, 200)
+        status, rest = self.get(api.search, q='phone', limit=2, cursor=page['next_cursor'])
+        self.assertEqual([r['name'] for r in rest['results']], ['Phone 2'])
+        for cursor in (['x', 1], [1.0, 2], [True, 'u'], [1.0], {'a': 1}, 'x'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(api.search, q='phone', cursor=api.encode_cursor(cursor))[0], 400)
+        self.assertEqual(self.get(api.search, q='phone', cursor='not base64!')[0], 400)
+
+    def test_products_rejects_malformed_cursors(self):
+        for cursor in ('x', 1.5, True, None, [1]):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(api.products, cursor=api.encode_cursor(cursor))[0], 400)
+
+    @mock.patch.object(api, 'cached_search', return_value=[])
+    def test_non_finite_prices_are_rejected(self, cached_search):
+        for value in ('nan', 'NaN', 'inf', '-Infinity', '1e400'):
+            for name in ('min_price', 'max_price'):
+                with self.subTest(name=name, value=value):
+                    status, body = self.get(api.search, q='phone', **{name: value})
+                    self.assertEqual((status, body['message']), (400, f'{name} must be a finite number'))
+                    self.assertEqual(self.get(api.products, **{name: value})[0], 400)
+        self.assertEqual(self.get(api.search, q='phone', cursor=api.encode_cursor([float('nan'), 'u']))[0], 400)
+        self.assertEqual(self.get(api.search, q='phone', min_price='10', max_price='1e3')[0], 200)
+
+
+@override_settings(LOCAL_SEARCH=False)
+class SearchStreamTests(SimpleTestCase):
+
+    def tearDown(self):
+        get_search_cache().delete(search_cache_key('stampede test'))
+
+    def test_concurrent_streams_scrape_once(self):
+        scrapes = []
+
+        async def fake_stream_search(query, sites=None):
+            scrapes.append(query)
+            await asyncio.sleep(0.2)
+            yield 'Amazon', [{'name': 'Phone', 'price': 100.0, 'site': 'Amazon', 'url': 'https://example.com/1'}]
+
+        async def collect():
+            return [chunk async for chunk in live_search.search_events('Stampede  test')]
+
+        async def both():
+            return await asyncio.gather(collect(), collect())
+
+        with mock.patch.object(live_search, 'stream_search', fake_stream_search):
+            streams = asyncio.run(both())
+        self.assertEqual(len(scrapes), 1)
+        done = [json.loads(stream[-1].split('data: ', 1)[1]) for stream in streams]
+        self.assertTrue(all(stream[-1].startswith('event: done') for stream in streams))
+        self.assertEqual(done[0]['results'], done[1]['results'])
+
+
+@override_settings(SEARCH_CACHE_TTL=600, SEARCH_CACHE_PARTIAL_TTL=60)
+class SearchCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(get_search_cache().delete, search_cache_key('coalesce test'))
+
+    def fake_search(self, finished_sites, delay=0.0):
+        def search(query):
+            time.sleep(delay)
+            return [
+                {'name': 'Phone', 'price': 100.0, 'site': 'Amazon', 'url': 'https://example.com/1'},
+                {'name': 'Phone', 'price': 90.0, 'site': 'Flipkart', 'url': 'https://example.com/2'},
+            ], finished_sites
+        return mock.patch('catalog.search_cache.search_with_local', side_effect=search)
+
+    def test_concurrent_searches_scrape_once(self):
+        with self.fake_search(['Amazon', 'Flipkart'], delay=0.3) as search, \
+                ThreadPoolExecutor(max_workers=6) as executor:
+            answers = list(executor.map(cached_search, ['Coalesce test', 'coalesce  TEST'] * 3))
+        self.assertEqual(search.call_count, 1)
+        self.assertTrue(all(answer == answers[0] for answer in answers))
+        self.assertEqual([result['price'] for result in answers[0][:2]], [90.0, 100.0])
+
+    def test_partial_results_are_cached_briefly(self):
+        cache = get_search_cache()
+        for finished_sites, ttl in ((['Amazon'], 60), (['Amazon', 'Flipkart'], 600)):
+            cache.delete(search_cache_key('coalesce test'))
+            with self.subTest(finished_sites=finished_sites), self.fake_search(finished_sites), \
+                    mock.patch.object(cache, 'set', wraps=cache.set) as store:
+                cached_search('coalesce test')
+                cached_search('coalesce test')
+            store.assert_called_once()
+            self.assertEqual(store.call_args.kwargs['timeout'], ttl)
+
+
+class ProductMatchingTests(SimpleTestCase):
+
+    def test_same_item_across_sites(self):
+        results = group_results([
+            {'name': 'SAMSUNG Galaxy M34 5G (Midnight Blue, 128 GB) (6 GB RAM)', 'site': 'Flipkart', 'price': 16499.0},
+            {'name': 'Samsung Galaxy M34 5G (Midnight Blue, 6GB RAM, 128GB Storage)', 'site': 'Amazon', 'price': 16999.0},
+            {'name': 'Apple iPhone 15 (Black, 128 GB)', 'site': 'Flipkart', 'price': 65999.0},
+            {'name': 'Apple iPhone15 128GB Black', 'site': 'Amazon', 'price': 66999.0},
+        ])
+        self.assertEqual([r['group'] for r in results], [0, 0, 2, 2])
+        self.assertEqual([r['group_size'] for r in results], [2, 2, 2, 2])
+
+    def test_model_numbers_must_agree(self):
+        index = ProductIndex()
+        index.add(1, 'SAMSUNG Galaxy M35 5G (Midnight Blue, 128 GB) (6 GB RAM)', 'Flipkart')
+        index.add(2, 'SAMSUNG Galaxy M34 5G (Midnight Blue, 128 GB) (6 GB RAM)', 'Flipkart')
+        matches = index.match('Samsung Galaxy M34 5G (Midnight Blue, 6GB RAM, 128GB Storage)')
+        self.assertEqual([product_id for product_id, score in matches], [2])
+
+    def test_remove(self):
+        index = ProductIndex()
+        index.add(1, 'Apple iPhone 15 (Black, 128 GB)')
+        index.remove(1)
+        self.assertEqual(index.match('Apple iPhone 15 (Black, 128 GB)'), [])
+        self.assertEqual(len(index.postings), 0)
+
+    def test_search_needs_every_word(self):
+        index = ProductIndex()
+        index.add(1, 'Apple iPhone 15 (Black, 128 GB) with MagSafe Case')
+        index.add(2, 'Apple iPhone 15 (Black, 128 GB)')
+        index.add(3, 'Apple iPhone 14 (Black, 128 GB)')
+        self.assertEqual(index.search('iphone 15 black'), [2, 1])
+        self.assertEqual(index.search('iphone 16'), [])
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_prometheus_text(self):
+        registry = Registry()
+        registry.increment('scrape_responses_total', site='Amazon', status=200)
+        registry.increment('scrape_responses_total', site='Amazon', status=200)
+        registry.observe('scrape_stage_seconds', 0.003, site='Amazon', page='product', stage='parse')
+        registry.observe('scrape_stage_seconds', 0.2, site='Amazon', page='product', stage='parse')
+        lines = registry.render().splitlines()
+        self.assertIn('scrape_responses_total{site="Amazon",status="200"} 2', lines)
+        labels = 'page="product",site="Amazon",stage="parse"'
+        self.assertIn(f'scrape_stage_seconds_bucket{{{labels},le="0.005"}} 1', lines)
+        self.assertIn(f'scrape_stage_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f'scrape_stage_seconds_count{{{labels}}} 2', lines)
+
+
+class MetricsAccessTests(SimpleTestCase):
+
+    def status(self, **headers):
+        request = RequestFactory().get('/metrics/', **headers)
+        request.user = AnonymousUser()
+        return views.metrics(request).status_code
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_closed_by_default_even_from_localhost(self):
+        self.assertEqual(self.status(REMOTE_ADDR='127.0.0.1'), 403)
+
+    @override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_token_or_allowed_address(self):
+        self.assertEqual(self.status(HTTP_AUTHORIZATION='Bearer s3cret'), 200)
+        self.assertEqual(self.status(HTTP_AUTHORIZATION='Bearer wrong'), 403)
+        self.assertEqual(self.status(REMOTE_ADDR='10.0.0.5'), 200)
+
+
+class StubSiteServerTests(SimpleTestCase):
+
+    def test_serves_fixture_pages_and_injected_errors(self):
+        self.assertEqual(StubSiteServer().respond('/amazon/product/1'), (200, load_page('amazon_product')))
+        self.assertEqual(StubSiteServer().respond('/flipkart/search?q=phone'), (200, load_page('flipkart_search')))
+        self.assertEqual(StubSiteServer().respond('/myntra/search?q=phone')[0], 404)
+        self.assertEqual(StubSiteServer(error_rate=1).respond('/amazon/product/1')[0], 500)
+
+
+class FakeClock:
+    """
+    Stands in for the time module: sleep() advances monotonic() instantly
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('catalog.throttle.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill_at_rate(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, True, False])
+        self.clock.now += 0.25
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now += 0.25
+        self.assertTrue(bucket.try_acquire())
+        # A long idle spell refills only up to the burst size
+        self.clock.now += 60
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, True, False])
+
+    def test_acquire_waits_for_the_next_token(self):
+        bucket = TokenBucket(rate=4, burst=1)
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.25, 0.25])
+        self.assertEqual(self.clock.now, 1000.5)
+
+    @override_settings(SCRAPE_RATE_LIMITS={'Amazon': (2.0, 4)}, SCRAPE_DEFAULT_RATE_LIMIT=(1.0, 1))
+    def test_site_buckets_are_configured_and_shared(self):
+        self.addCleanup(throttle._buckets.clear)
+        throttle._buckets.clear()
+        self.assertIs(site_bucket('Amazon'), site_bucket('Amazon'))
+        self.assertEqual((site_bucket('Amazon').rate, site_bucket('Amazon').capacity), (2.0, 4.0))
+        self.assertEqual((site_bucket('Myntra').rate, site_bucket('Myntra').capacity), (1.0, 1.0))
+
+
+class InterleaveBySiteTests(SimpleTestCase):
+
+    def test_round_robin_across_sites_keeping_each_sites_order(self):
+        products = [
+            Product(id=n, site=site)
+            for n, site in enumerate(['Amazon', 'Amazon', 'Amazon', 'Flipkart', 'Myntra', 'Myntra'])
+        ]
+        self.assertEqual([product.id for product in interleave_by_site(products)], [0, 3, 4, 1, 5, 2])
+        self.assertEqual(interleave_by_site([]), [])
+
+
+class ShardTests(SimpleTestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('0/4'), (0, 4))
+        self.assertEqual(parse_shard('3/4'), (3, 4))
+        for value in ('4/4', '-1/4', '1', 'a/b', '1/0'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_shard(value)
+
+
+@override_settings(
+    REFRESH_INTERVAL=24 * 3600, REFRESH_MIN_INTERVAL=15 * 60, REFRESH_MAX_INTERVAL=7 * 24 * 3600,
+    REFRESH_ALERT_FACTOR=8,
+)
+class RefreshIntervalTests(SimpleTestCase):
+
+    def test_intervals(self):
+        self.assertEqual(refresh_interval(False, 0, 0), timedelta(hours=24))
+        self.assertEqual(refresh_interval(True, 0, 0), timedelta(hours=3))
+        self.assertEqual(refresh_interval(True, 100, 0), timedelta(minutes=15))
+        self.assertEqual(refresh_interval(False, 0, 10), timedelta(days=7))
+
+    def test_failure_backs_off_from_the_products_own_interval(self):
+        self.assertEqual(refresh_interval(True, 0, 1), timedelta(hours=6))
+        self.assertEqual(refresh_interval(True, 100, 2), timedelta(hours=1))
+
+
+def make_product(n, **fields):
+    fields = {'name': f'Product {n}', 'url': f'https://www.amazon.in/dp/TEST{n}', 'site': 'Amazon', **fields}
+    return Product.objects.create(**fields)
+
+
+@override_settings(
+    REFRESH_INTERVAL=24 * 3600, REFRESH_MIN_INTERVAL=15 * 60, REFRESH_MAX_INTERVAL=7 * 24 * 3600,
+    REFRESH_ALERT_FACTOR=8, REFRESH_VOLATILITY_WINDOW=7 * 24 * 3600,
+)
+class ScheduleProductsTests(TestCase):
+
+    def add_history(self, product, prices, now):
+        for days_ago, price in prices:
+            row = PriceHistory.objects.create(product=product, price=price)
+            PriceHistory.objects.filter(id=row.id).update(checked_at=now - timedelta(days=days_ago))
+
+    def test_only_price_changes_shorten_the_interval(self):
+        now = timezone.now()
+        steady, moving = make_product(1), make_product(2)
+        # A row per scrape, as with PRICE_HISTORY_MODE = 'every'
+        self.add_history(steady, [(10, 100), (5, 100), (4, 100), (3, 100), (2, 100), (1, 100)], now)
+        # Changed from before the window, then twice within it
+        self.add_history(moving, [(10, 80), (5, 100), (4, 100), (3, 90), (2, 100)], now)
+        schedule_products({steady.id: True, moving.id: True}, now=now)
+        steady.refresh_from_db()
+        moving.refresh_from_db()
+        self.assertEqual(steady.next_check_at, now + timedelta(hours=24))
+        self.assertEqual(moving.next_check_at, now + timedelta(hours=6))
+
+
+class ProductIndexRefreshTests(TransactionTestCase):
+
+    def setUp(self):
+        matching._index, matching._index_built_at, matching._building = None, 0.0, None
+        self.addCleanup(setattr, matching, '_index', None)
+
+    def wait_until_built(self):
+        deadline = time.monotonic() + 5
+        while matching._building is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(matching._building)
+
+    def test_index_is_built_and_refreshed_in_the_background(self):
+        make_product(1)
+        release = threading.Event()
+        add = matching.ProductIndex.add
+
+        def blocked_add(index, *args):
+            release.wait(5)
+            add(index, *args)
+
+        with mock.patch.object(matching.ProductIndex, 'add', blocked_add):
+            index = matching.product_index()
+            self.assertEqual(len(index), 0)
+            release.set()
+            self.wait_until_built()
+        self.assertEqual(len(index), 1)
+
+        # Saved by another process: not in this one's index until it's rebuilt
+        Product.objects.bulk_create([Product(name='Product 2', url='https://www.amazon.in/dp/TEST2', url_hash='2' * 64, site='Amazon')])
+        matching._index_built_at = 0.0
+        self.assertIs(matching.product_index(), index)
+        self.wait_until_built()
+        self.assertEqual(len(matching.product_index()), 2)
+
+    def test_matches_api_answers_503_until_the_index_is_built(self):
+        phone = make_product(1, name='Samsung Galaxy M34 5G Blue')
+        other = make_product(2, name='Samsung Galaxy M34 5G (Blue)', site='Flipkart')
+        release = threading.Event()
+        add = matching.ProductIndex.add
+
+        def blocked_add(index, *args):
+            release.wait(5)
+            add(index, *args)
+
+        def get_matches():
+            return api.product_matches(RequestFactory().get('/api/'), product_id=phone.id)
+
+        with mock.patch.object(matching.ProductIndex, 'add', blocked_add):
+            response = get_matches()
+            self.assertEqual((response.status_code, response['Retry-After']), (503, '5'))
+            self.assertEqual(json.loads(response.content)['status'], 'unavailable')
+            release.set()
+            self.wait_until_built()
+        response = get_matches()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['id'] for match in json.loads(response.content)['matches']], [other.id])
+
+
+STATS_FIELDS = (
+    'current_price', 'last_changed_at', 'last_seen_at', 'min_30', 'min_30_seen_at', 'min_365', 'min_365_seen_at',
+    'price_time_sum', 'priced_seconds',
+)
+
+
+def stats_values(product):
+    return PriceStats.objects.filter(product=product).values(*STATS_FIELDS).get()
+
+
+def record_prices_at(product, prices):
+    """
+    Record (time, price) observations through record_price, at those times
+    """
+    for at, price in prices:
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            record_price(product, price)
+
+
+class PriceStatsTests(TestCase):
+
+    def test_average_is_the_same_in_every_storage_mode_and_after_compaction(self):
+        start = timezone.now() - timedelta(days=1)
+        prices = [(start + timedelta(hours=n), price) for n, price in enumerate([100, 100, 80, 120, 120, 90])]
+        stats = {}
+        for n, mode in enumerate(('every', 'changes')):
+            product = make_product(n)
+            with override_settings(PRICE_HISTORY_MODE=mode):
+                record_prices_at(product, prices)
+            stats[mode] = stats_values(product)
+            self.assertAlmostEqual(PriceStats.objects.get(product=product).avg_price, (200 + 80 + 240) / 5)
+            rebuild_price_stats([product.id])
+            self.assertEqual(stats_values(product), stats[mode])
+        self.assertEqual(PriceHistory.objects.filter(product__name='Product 0').count(), 6)
+        self.assertEqual(PriceHistory.objects.filter(product__name='Product 1').count(), 4)
+        self.assertEqual(stats['every'], stats['changes'])
+
+        call_command('compact_price_history', stdout=io.StringIO())
+        self.assertEqual(PriceHistory.objects.filter(product__name='Product 0').count(), 4)
+        rebuild_price_stats()
+        self.assertEqual(stats_values(Product.objects.get(name='Product 0')), stats['every'])
+
+    def test_prices_drop_out_of_the_window_low(self):
+        now = timezone.now()
+        product = make_product(1)
+        record_prices_at(product, [(now - timedelta(days=40), 50), (now - timedelta(days=20), 70), (now, 100)])
+        stats = PriceStats.objects.get(product=product)
+        self.assertEqual((stats.min_30, stats.min_365, stats.current_price), (70, 50, 100))
+
+        # The 30-day low of 70 expires; a higher price can't replace it incrementally
+        record_prices_at(product, [(now + timedelta(days=11), 90)])
+        incremental = stats_values(product)
+        self.assertEqual((incremental['min_30'], incremental['min_365']), (90, 50))
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=11)):
+            rebuild_price_stats([product.id])
+        self.assertEqual(stats_values(product), incremental)
+
+
+class PriceHistoryModeTests(TestCase):
+
+    def history(self, product):
+        return list(PriceHistory.objects.filter(product=product).order_by('checked_at', 'id').values_list('price', 'checked_at', 'last_seen_at'))
+
+    def test_changes_mode_extends_the_row_for_an_unchanged_price(self):
+        start = timezone.now()
+        product = make_product(1)
+        at = [start + timedelta(hours=n) for n in range(3)]
+        with override_settings(PRICE_HISTORY_MODE='changes'):
+            record_prices_at(product, [(at[0], 100), (at[1], 100), (at[2], 90)])
+        self.assertEqual(self.history(product), [(100, at[0], at[1]), (90, at[2], at[2])])
+
+    def test_every_mode_adds_a_row_per_scrape(self):
+        product = make_product(1)
+        with override_settings(PRICE_HISTORY_MODE='every'):
+            record_price(product, 100)
+            record_price(product, 100)
+        self.assertEqual(PriceHistory.objects.filter(product=product).count(), 2)
+
+    def test_compaction_keeps_run_boundaries(self):
+        start = timezone.now()
+        product = make_product(1)
+        at = [start + timedelta(hours=n) for n in range(6)]
+        with override_settings(PRICE_HISTORY_MODE='every'):
+            record_prices_at(product, zip(at, [100, 100, 80, 80, 80, 100]))
+        call_command('compact_price_history', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(PriceHistory.objects.count(), 6)
+        call_command('compact_price_history', stdout=io.StringIO())
+        # The price returning to 100 starts a new run rather than joining the first
+        self.assertEqual(self.history(product), [(100, at[0], at[1]), (80, at[2], at[4]), (100, at[5], at[5])])
+
+
+class PriceAlertTests(TestCase):
+
+    def test_triggered_alerts_are_queued_once(self):
+        now = timezone.now()
+        at_low, above_low = make_product(1), make_product(2)
+        record_prices_at(at_low, [(now - timedelta(days=2), 120), (now, 90)])
+        record_prices_at(above_low, [(now - timedelta(days=2), 80), (now, 150)])
+        users = [User.objects.create_user(f'user{n}', f'user{n}@example.com') for n in range(4)]
+        triggered = PriceAlert.objects.create(user=users[0], product=at_low, target_price=100)
+        PriceAlert.objects.create(user=users[1], product=at_low, target_price=80)
+        PriceAlert.objects.create(user=users[2], product=at_low, target_price=200, notified=True)
+        # Under the target, but not the lowest price in a year
+        PriceAlert.objects.create(user=users[3], product=above_low, target_price=200)
+
+        self.assertEqual(evaluate_price_alerts(), 1)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to_email, email.dedupe_key), ('user0@example.com', f'price-alert:{triggered.id}'))
+        self.assertEqual(set(PriceAlert.objects.filter(notified=True).values_list('user__username', flat=True)), {'user0', 'user2'})
+        self.assertEqual(evaluate_price_alerts(), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+
+def statements(queries, verb, table):
+    """
+    Captured SQL statements of one kind against one table
+    """
+    return [
+        q['sql'] for q in queries.captured_queries
+        if q['sql'].startswith(verb) and q['sql'].split()[2 if verb == 'INSERT' else 1].strip('"`') == table
+    ]
+
+
+@override_settings(PRICE_HISTORY_MODE='changes')
+class PriceIngestorTests(TestCase):
+
+    def url(self, n):
+        return f'https://www.amazon.in/dp/INGEST{n}'
+
+    def test_batch_is_written_when_full(self):
+        ingestor = PriceIngestor(batch_size=3)
+        self.assertEqual(ingestor.add(self.url(1), 'Amazon', 'Phone 1', 100.0, ''), [])
+        self.assertEqual(ingestor.add(self.url(2), 'Amazon', 'Phone 2', 200.0, ''), [])
+        self.assertEqual(Product.objects.count(), 0)
+        with CaptureQueriesContext(connection) as queries:
+            written = ingestor.add(self.url(3), 'Amazon', 'Phone 3', 300.0, '')
+        self.assertEqual(sorted(price for _, price in written), [100.0, 200.0, 300.0])
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(sorted(PriceHistory.objects.values_list('price', flat=True)), [100.0, 200.0, 300.0])
+        self.assertEqual(len(statements(queries, 'INSERT', 'catalog_pricehistory')), 1)
+        self.assertEqual(ingestor.flush(), [])
+
+    def test_unchanged_page_fields_skip_the_product_update(self):
+        ingestor = PriceIngestor()
+        ingestor.add(self.url(1), 'Amazon', 'Phone', 100.0, 'https://example.com/1.jpg', etag='"a"')
+        ingestor.flush()
+        ingestor.add(self.url(1), 'Amazon', 'Phone', 100.0, 'https://example.com/1.jpg', etag='"a"')
+        with CaptureQueriesContext(connection) as queries:
+            ingestor.flush()
+        self.assertEqual(statements(queries, 'UPDATE', 'catalog_product'), [])
+        # Same price: the row is extended rather than a new one added
+        self.assertEqual(PriceHistory.objects.count(), 1)
+
+        ingestor.add(self.url(1), 'Amazon', 'Phone (Blue)', 90.0, 'https://example.com/1.jpg', etag='"b"')
+        with CaptureQueriesContext(connection) as queries:
+            ingestor.flush()
+        self.assertEqual(len(statements(queries, 'UPDATE', 'catalog_product')), 1)
+        product = Product.objects.get()
+        self.assertEqual((product.name, product.etag), ('Phone (Blue)', '"b"'))
+        self.assertEqual(PriceHistory.objects.count(), 2)
+
+    def test_touch_marks_the_current_price_seen(self):
+        ingestor = PriceIngestor()
+        ingestor.add(self.url(1), 'Amazon', 'Phone', 100.0, '', etag='"a"')
+        ingestor.flush()
+        row = PriceHistory.objects.get()
+        product = Product.objects.get()
+        later = timezone.now() + timedelta(hours=1)
+        ingestor.touch(product, etag='"b"', last_modified='Wed, 21 Oct 2026 07:28:00 GMT')
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            ingestor.flush()
+        self.assertEqual(PriceHistory.objects.get().last_seen_at, later)
+        self.assertEqual(PriceHistory.objects.get().id, row.id)
+        product.refresh_from_db()
+        self.assertEqual((product.etag, product.last_modified), ('"b"', 'Wed, 21 Oct 2026 07:28:00 GMT'))
+        self.assertEqual(PriceStats.objects.get(product=product).last_seen_at, later)
+
+
+@override_settings(LOCAL_SEARCH=True, LOCAL_SEARCH_MAX_AGE=6 * 3600, LOCAL_SEARCH_MIN_RESULTS=3)
+class LocalSearchTests(TestCase):
+
+    def setUp(self):
+        self.index = ProductIndex()
+        patcher = mock.patch('catalog.local_search.product_index', return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def saved(self, n, name, site='Amazon', seen=timedelta(hours=1), price=100.0):
+        product = make_product(n, name=name, site=site)
+        if seen is not None:
+            record_prices_at(product, [(timezone.now() - seen, price)])
+        self.index.add(product.id, product.name, product.site)
+        return product
+
+    def result(self, n, site='Amazon'):
+        return {'name': f'Phone {n}', 'price': 100.0, 'site': site, 'url': f'https://example.com/{site}/{n}'}
+
+    def test_fulltext_words_leave_out_short_words_and_stopwords(self):
+        self.assertEqual(fulltext_words('Samsung TV for the 5G-phone'), (['samsung', 'phone'], ['tv', '5g']))
+        with override_settings(FULLTEXT_MIN_TOKEN_SIZE=4):
+            self.assertEqual(fulltext_words('Apple pen'), (['apple'], ['pen']))
+
+    def test_local_results_are_fresh_priced_and_capped_per_site(self):
+        for n in range(7):
+            self.saved(n, f'Galaxy Phone {n}')
+        self.saved(10, 'Galaxy Phone Stale', seen=timedelta(hours=7))
+        self.saved(11, 'Galaxy Phone Unpriced', seen=None)
+        self.saved(12, 'Galaxy Phone Flip', site='Flipkart', price=90.0)
+        results = local_results('galaxy phone')
+        by_site = {}
+        for result in results:
+            by_site.setdefault(result['site'], []).append(result['name'])
+        self.assertEqual(len(by_site['Amazon']), get_adapter('Amazon').search_limit)
+        self.assertEqual(by_site['Flipkart'], ['Galaxy Phone Flip'])
+        self.assertFalse({'Galaxy Phone Stale', 'Galaxy Phone Unpriced'} & {r['name'] for r in results})
+        self.assertIn({'name': 'Galaxy Phone Flip', 'price': 90.0, 'site': 'Flipkart', 'url': 'https://www.amazon.in/dp/TEST12'}, results)
+
+    def test_sites_to_scrape_are_those_short_of_local_results(self):
+        local = [self.result(n) for n in range(3)] + [self.result(n, 'Flipkart') for n in range(2)]
+        self.assertEqual(sites_to_scrape(local), ['Flipkart'])
+        self.assertEqual(sites_to_scrape([]), ['Amazon', 'Flipkart'])
+
+    def test_live_results_replace_local_ones_for_the_same_url(self):
+        local = [self.result(1), self.result(2)]
+        live = [dict(self.result(2), price=80.0), self.result(3)]
+        self.assertEqual(merge_results(local, live), [self.result(1), *live])
+
+    def test_search_with_local_scrapes_only_uncovered_sites(self):
+        for n in range(3):
+            self.saved(n, f'Galaxy Phone {n}')
+        live = [self.result(1, 'Flipkart')]
+        with mock.patch('catalog.local_search.search_all_sites', return_value=(live, ['Flipkart'])) as scrape:
+            results, finished = search_with_local('galaxy phone')
+        scrape.assert_called_once_with('galaxy phone', deadline=None, sites=['Flipkart'])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[-1], live[0])
+        self.assertEqual(finished, ['Amazon', 'Flipkart'])
+
+        self.saved(5, 'Galaxy Phone Flip', site='Flipkart')
+        for n in range(6, 8):
+            self.saved(n, f'Galaxy Phone Flip {n}', site='Flipkart')
+        with mock.patch('catalog.local_search.search_all_sites') as scrape:
+            results, finished = search_with_local('galaxy phone')
+        scrape.assert_not_called()
+        self.assertEqual((len(results), finished), (6, ['Amazon', 'Flipkart']))
+
+    @override_settings(LOCAL_SEARCH=False)
+    def test_search_with_local_can_be_turned_off(self):
+        self.saved(1, 'Galaxy Phone')
+        with mock.patch('catalog.local_search.search_all_sites', return_value=([], [])) as scrape:
+            search_with_local('galaxy phone', deadline=5)
+        scrape.assert_called_once_with('galaxy phone', deadline=5)
+
+
+class SavedProductsPageTests(TestCase):
+
+    def setUp(self):
+        # Saved in the same instant: the id alone orders and splits the pages
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            self.ids = [make_product(n).id for n in range(7)][::-1]
+
+    def test_pages_cover_every_product_once(self):
+        pages = []
+        before = None
+        while True:
+            products, before = saved_products_page(before=before, page_size=3)
+            pages.append([product.id for product in products])
+            if before is None:
+                break
+            self.assertEqual(before, pages[-1][-1])
+        self.assertEqual(pages, [self.ids[:3], self.ids[3:6], self.ids[6:]])
+
+    def test_exact_multiple_of_the_page_size_has_no_empty_last_page(self):
+        products, before = saved_products_page(before=self.ids[0], page_size=3)
+        self.assertEqual([product.id for product in products], self.ids[1:4])
+        products, before = saved_products_page(before=self.ids[3], page_size=3)
+        self.assertEqual(([product.id for product in products], before), (self.ids[4:], None))
+        self.assertEqual(saved_products_page(before=self.ids[-1], page_size=3), ([], None))
+
+    @override_settings(SAVED_PRODUCTS_PAGE_SIZE=3)
+    def test_invalid_before_shows_the_first_page(self):
+        for before in ('abc', '', '1.5'):
+            with self.subTest(before=before):
+                response = self.client.get(reverse('home'), {'before': before})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([product['id'] for product in response.context['products']], self.ids[:3])
+                self.assertTrue(response.context['is_first_page'])
+        response = self.client.get(reverse('home'), {'before': 0})
+        self.assertEqual((response.context['products'], response.context['next_before']), ([], None))
+
+
+class UrlHashTests(TestCase):
+
+    def test_saving_sets_the_hash_and_duplicates_are_rejected(self):
+        product = make_product(1, url='https://www.amazon.in/dp/HASH1/')
+        self.assertEqual(product.url_hash, url_digest('https://www.amazon.in/dp/HASH1'))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_product(2, url='HTTPS://www.amazon.in/dp/HASH1#top')
+
+    def test_migration_merges_products_sharing_a_canonical_url(self):
+        migration = importlib.import_module('catalog.migrations.0002_product_url_hash_and_indexes')
+        urls = ['https://www.amazon.in/dp/DUP1', 'https://WWW.amazon.in/dp/DUP1/', 'https://www.amazon.in/dp/DUP2']
+        # Rows as they were before url_hash existed, each with a placeholder hash
+        Product.objects.bulk_create([
+            Product(name=f'Product {n}', url=url, url_hash=f'placeholder-{n}', site='Amazon')
+            for n, url in enumerate(urls)
+        ])
+        keeper, duplicate, other = Product.objects.order_by('id')
+        user = User.objects.create_user('merge', 'merge@example.com', 'pw')
+        PriceHistory.objects.create(product=keeper, price=100.0)
+        PriceHistory.objects.create(product=duplicate, price=90.0)
+        PriceAlert.objects.create(user=user, product=duplicate, target_price=80.0)
+
+        migration.fill_url_hashes(django_apps, None)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('id', 'url_hash')),
+            [(keeper.id, url_digest(urls[0])), (other.id, url_digest(urls[2]))],
+        )
+        self.assertEqual(sorted(PriceHistory.objects.filter(product=keeper).values_list('price', flat=True)), [90.0, 100.0])
+        self.assertEqual(PriceAlert.objects.get().product_id, keeper.id)
+
+
+class ConditionalRefreshTests(TestCase):
+
+    def setUp(self):
+        health._breakers.pop('Amazon', None)
+        self.addCleanup(health._breakers.pop, 'Amazon', None)
+
+    def test_validators_are_sent_and_304_is_not_modified(self):
+        with StubSiteServer(validators=True) as server:
+            url = server.product_url('Amazon', 1)
+            first = refresh_page(url, 'Amazon')
+            second = refresh_page(url, 'Amazon', first.etag, first.last_modified, first.content_hash)
+        self.assertEqual(first.status, 'updated')
+        self.assertEqual(first.etag, server.etag(load_page('amazon_product')))
+        self.assertEqual(first.last_modified, server.LAST_MODIFIED)
+        self.assertNotIn('If-None-Match', server.request_headers[0])
+        self.assertEqual(server.request_headers[1]['If-None-Match'], first.etag)
+        self.assertEqual(server.request_headers[1]['If-Modified-Since'], server.LAST_MODIFIED)
+        self.assertEqual(second, first._replace(status='not_modified', name='', price=None, image=''))
+
+    def test_matching_fragment_hash_skips_extraction(self):
+        adapter = get_adapter('Amazon')
+        with StubSiteServer() as server, \
+                mock.patch.object(adapter, 'extract_product_document', wraps=adapter.extract_product_document) as extract:
+            url = server.product_url('Amazon', 1)
+            first = refresh_page(url, 'Amazon')
+            second = refresh_page(url, 'Amazon', content_hash=first.content_hash)
+            changed = refresh_page(url, 'Amazon', content_hash='stale')
+        self.assertEqual(extract.call_count, 2)
+        self.assertEqual((second.status, second.content_hash), ('unchanged', first.content_hash))
+        self.assertEqual((changed.status, changed.price), ('updated', first.price))
+
+    def scrape(self, server, **fields):
+        product = make_product(1, url=server.product_url('Amazon', 1), **fields)
+        record_prices_at(product, [(timezone.now() - timedelta(days=1), 999.0)])
+        call_command('scrape_prices', stdout=io.StringIO())
+        product.refresh_from_db()
+        return product
+
+    def assert_only_touched(self, product):
+        row = PriceHistory.objects.get(product=product)
+        self.assertEqual(row.price, 999.0)
+        self.assertGreater(row.last_seen_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(product.name, 'Product 1')
+        self.assertGreater(product.next_check_at, timezone.now())
+
+    def test_not_modified_page_only_touches_the_product(self):
+        with StubSiteServer(validators=True) as server:
+            product = self.scrape(server, etag=server.etag(load_page('amazon_product')), content_hash='old')
+        self.assertEqual(server.requests, 1)
+        self.assert_only_touched(product)
+        self.assertEqual((product.content_hash, product.last_modified), ('old', server.LAST_MODIFIED))
+
+    def test_unchanged_page_only_touches_the_product(self):
+        with StubSiteServer() as server:
+            first = refresh_page(server.product_url('Amazon', 1), 'Amazon')
+            product = self.scrape(server, content_hash=first.content_hash)
+        self.assert_only_touched(product)
+
+
+@override_settings(REFRESH_LEASE=15 * 60)
+class ClaimDueProductsTests(TransactionTestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        for n in range(10):
+            make_product(n, next_check_at=self.now - timedelta(minutes=n))
+
+    def test_owners_claim_disjoint_sets(self):
+        first, first_products = claim_due_products(6, now=self.now)
+        second, second_products = claim_due_products(6, now=self.now)
+        first_ids = {product.id for product in first_products}
+        second_ids = {product.id for product in second_products}
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(first_ids), 6)
+        self.assertEqual(len(second_ids), 4)
+        self.assertFalse(first_ids & second_ids)
+        self.assertEqual(claim_due_products(6, now=self.now)[1], [])
+
+    def test_expired_lease_is_reclaimed(self):
+        crashed, products = claim_due_products(10, now=self.now)
+        self.assertEqual(claim_due_products(10, now=self.now + timedelta(minutes=14))[1], [])
+        owner, reclaimed = claim_due_products(10, now=self.now + timedelta(minutes=16))
+        self.assertEqual({product.id for product in reclaimed}, {product.id for product in products})
+        self.assertEqual(Product.objects.filter(lease_owner=owner).count(), 10)
+
+    def test_full_run_leaves_products_leased_by_due_processes(self):
+        daemon, leased = claim_due_products(4, now=self.now)
+        full, products = claim_all_products(now=self.now)
+        leased_ids = {product.id for product in leased}
+        self.assertEqual(len(products), 6)
+        self.assertFalse(leased_ids & {product.id for product in products})
+        # Nor do --due processes claim what the full run is refreshing
+        self.assertEqual(claim_due_products(10, now=self.now)[1], [])
+
+        schedule_products({product.id: True for product in products}, now=self.now, owner=full)
+        self.assertEqual(set(Product.objects.filter(lease_owner=daemon).values_list('id', flat=True)), leased_ids)
+        # Once the daemon's lease runs out, its products are claimed again
+        later = self.now + timedelta(minutes=16)
+        self.assertEqual(len(claim_all_products(now=later)[1]), 10)
+
+    def test_schedule_leaves_products_leased_to_another_owner(self):
+        stale, products = claim_due_products(10, now=self.now)
+        later = self.now + timedelta(minutes=16)
+        current, _ = claim_due_products(5, now=later)
+        schedule_products({product.id: True for product in products}, now=later, owner=stale)
+        self.assertEqual(Product.objects.filter(lease_owner=current).count(), 5)
+        self.assertEqual(Product.objects.filter(lease_owner='').count(), 5)
+        for product in Product.objects.filter(lease_owner=current):
+            self.assertEqual(product.next_check_at, later + timedelta(minutes=15))
+
+
+def outbox_email(n):
+    return OutboundEmail(
+        dedupe_key=f'test:{n}', subject='Price Drop Alert!', body='Cheaper now',
+        from_email='alerts@example.com', to_email=f'user{n}@example.com',
+    )
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BACKOFF=60,
+)
+class OutboxTests(TestCase):
+
+    def make_due(self):
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+
+    def test_queueing_is_deduplicated(self):
+        queue_emails([outbox_email(1), outbox_email(2)])
+        queue_emails([outbox_email(1)])
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_sent_and_claimed_emails_are_not_resent(self):
+        queue_emails([outbox_email(1)])
+        self.assertEqual(dispatch_outbox(), (1, 0))
+        self.assertEqual(dispatch_outbox(), (0, 0))
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+        queue_emails([outbox_email(2)])
+        # Claimed by another dispatcher: leased until it sends or the lease runs out
+        self.assertEqual(len(claim_due_emails(10)), 1)
+        self.assertEqual(dispatch_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_claim_skips_emails_claimed_since_they_were_selected(self):
+        queue_emails([outbox_email(1), outbox_email(2)])
+        stale_ids = due_email_ids(10, timezone.now())
+        self.assertEqual(len(claim_due_emails(1)), 1)
+        # Another dispatcher selected both before the first claimed one of them
+        with mock.patch('catalog.notifications.due_email_ids', return_value=stale_ids):
+            claimed = claim_due_emails(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(OutboundEmail.objects.filter(lease_owner=claimed[0].lease_owner).count(), 1)
+
+    def test_each_email_is_marked_sent_before_the_next_is_sent(self):
+        queue_emails([outbox_email(1), outbox_email(2)])
+        send = mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=[1, KeyboardInterrupt],
+        )
+        with send, self.assertRaises(KeyboardInterrupt):
+            dispatch_outbox()
+        statuses = dict(OutboundEmail.objects.values_list('dedupe_key', 'status'))
+        self.assertEqual(statuses, {'test:1': OutboundEmail.SENT, 'test:2': OutboundEmail.PENDING})
+
+    def test_failures_back_off_then_give_up(self):
+        queue_emails([outbox_email(1)])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')):
+            before = timezone.now()
+            self.assertEqual(dispatch_outbox(), (0, 1))
+            email = OutboundEmail.objects.get()
+            self.assertEqual((email.status, email.attempts, email.last_error), (OutboundEmail.PENDING, 1, 'refused'))
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=60))
+            self.assertEqual(dispatch_outbox(), (0, 0))
+
+            self.make_due()
+            dispatch_outbox()
+            email.refresh_from_db()
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=120))
+            self.make_due()
+            dispatch_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 3))
+        self.make_due()
+        self.assertEqual(dispatch_outbox(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+
+class RefreshPipelineTests(SimpleTestCase):
+
+    def test_fetched_pages_are_parsed_and_other_results_passed_through(self):
+        products = [
+            mock.Mock(id=i, site='Amazon', etag='', last_modified='', content_hash='')
+            for i in range(6)
+        ]
+        not_modified = RefreshResult('not_modified', '', None, '', '', '', '')
+
+        def fetch(product):
+            if product.id % 2:
+                return not_modified
+            return FetchedPage('Amazon', load_page('amazon_product'), '', '', '')
+
+        # Threads stand in for the process pool; the handoff is the same
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = dict(refresh_pipelined(products, fetch, 3, pool, queue_size=1))
+        self.assertEqual(len(results), 6)
+        for product, result in results.items():
+            self.assertEqual(result.status, 'not_modified' if product.id % 2 else 'updated')
+
+
+class ImageCacheTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(IMAGE_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_prune_evicts_least_recently_used_files_and_their_rows(self):
+        paths = [file_path(f'{i:064x}-160.jpg') for i in range(4)]
+        for i, (age, path) in enumerate(zip((40, 30, 20, 10), paths)):
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(b'x' * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+            CachedImage.objects.create(
+                url_hash=f'{i:064x}', url=f'https://example.com/{i}.jpg', content_hash=f'{i:064x}', content_type='image/jpeg',
+            )
+        self.assertEqual(prune_image_cache(max_bytes=300), (2, 200))
+        self.assertEqual([path.exists() for path in paths], [False, False, True, True])
+        self.assertEqual(sorted(CachedImage.objects.values_list('url', flat=True)), ['https://example.com/2.jpg', 'https://example.com/3.jpg'])
+
+    @mock.patch('catalog.images.download_image', return_value=(b'GIF89a', 'image/gif'))
+    def test_images_are_fetched_on_refresh_not_on_view(self, download_image):
+        products = [make_product(n, image_url=f'https://example.com/{n % 2}.gif') for n in range(3)]
+        response = self.client.get(reverse('product_image', args=[products[0].id]))
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        download_image.assert_not_called()
+
+        self.assertEqual(cache_product_images([product.id for product in products], workers=1), 2)
+        self.assertEqual(download_image.call_count, 2)
+        self.assertEqual(cache_product_images([product.id for product in products], workers=1), 0)
+        # Both URLs have the same content, stored once
+        self.assertEqual(len(set(thumbnail_urls(products).values())), 1)
+        response = self.client.get(reverse('product_image', args=[products[2].id]))
+        self.assertRedirects(response, thumbnail_urls(products)[products[2].id], fetch_redirect_response=False)
@@ -0,0 +1,63 @@
+import threading
+import time
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` requests per second with bursts of up to `burst`
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self):
+        """
+        Take a token if one is available, without waiting
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        Block until a token is available, then take it
+        """
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def site_bucket(site):
+    """
+    Return the shared token bucket for a site, configured from SCRAPE_RATE_LIMITS.
+    Shared between this process's threads only; other processes have their own.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(site)
+        if bucket is None:
+            limits = getattr(settings, 'SCRAPE_RATE_LIMITS', {})
+            default = getattr(settings, 'SCRAPE_DEFAULT_RATE_LIMIT', (1.0, 1))
+            rate, burst = limits.get(site, default)
+            bucket = _buckets[site] = TokenBucket(rate, burst)
+        return bucket
@@ -1,13 +1,20 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("register/", views.register, name="register"),
     path("login/", views.user_login, name="login"),
     path("logout/", views.user_logout, name="logout"),
     path("", views.home, name="home"),
+    path("search/stream/", views.search_stream, name="search_stream"),
+    path("metrics/", views.metrics, name="metrics"),
+    path("images/product/<int:product_id>/", views.product_image, name="product_image"),
+    path("images/<str:name>", views.cached_image, name="cached_image"),
     path("product/<int:product_id>/set_alert/", views.set_alert, name="set_alert"),
     path("save_product/", views.save_product, name="save_product"),
     path("product/<int:product_id>/delete/", views.delete_product, name="delete_product"), 
+    path("api/search/", api.search, name="api_search"),
+    path("api/products/", api.products, name="api_products"),
+    path("api/products/<int:product_id>/matches/", api.product_matches, name="api_product_matches"),
 ]
 
@@ -1,54 +1,133 @@
 from .models import Product, PriceHistory
-from catalog.scraper import scrape_amazon, scrape_flipkart, scrape_myntra, scrape_ajio
+from .canonical import url_digest
+from .stats import record_prices
+from catalog.scraper import scrape_page
+from catalog.sites import get_adapter
+from django.conf import settings
 from django.utils import timezone
 
-def update_product_price(product_url, site):
-    if site == 'Amazon':
-        name, price, image = scrape_amazon(product_url)
-    elif site == 'Flipkart':
-        name, price, image = scrape_flipkart(product_url)
-    elif site == 'Myntra':
-        name, price, image = scrape_myntra(product_url)
-    elif site == 'Ajio':
-        name, price, image = scrape_ajio(product_url)
-    else:
-        return None, None
-
+def scrape_product(product_url, site):
+    """
+    Scrape a product page for its site; returns (name, price, image) or None if it failed
+    """
+    if get_adapter(site) is None:
+        return None
+    name, price, image = scrape_page(product_url, site)
     if price is None:
+        return None
+    return name, price, image
+
+
+def update_product_price(product_url, site):
+    scraped = scrape_product(product_url, site)
+    if scraped is None:
         return None, None
+    name, price, image = scraped
 
-    product, created = Product.objects.get_or_create(url=product_url, defaults={'name': name, 'site': site, 'image_url': image})
-    if not created:
+    product, created = Product.objects.get_or_create(url_hash=url_digest(product_url), defaults={'url': product_url, 'name': name, 'site': site, 'image_url': image})
+    if not created and (product.name != name or product.image_url != image):
         product.name = name
         product.image_url = image
-        product.save()
-    PriceHistory.objects.create(product=product, price=price, checked_at=timezone.now())
+        product.save(update_fields=['name', 'image_url'])
+    record_price(product, price)
     return product, price
 
 
-from django.db.models import Min
-from datetime import timedelta
-
-def get_lowest_price(product):
-    from django.utils import timezone
-    year_ago = timezone.now() - timedelta(days=365)
-    min_price = PriceHistory.objects.filter(product=product, checked_at__gte=year_ago).aggregate(Min('price'))['price__min']
-    return min_price if min_price else 0
-
-
-from django.core.mail import send_mail
-from .models import PriceAlert
-
-def check_price_alert(product, price):
-    min_year_price = get_lowest_price(product)
-    alerts = PriceAlert.objects.filter(product=product, notified=False)
-    for alert in alerts:
-        if price <= min_year_price and price <= alert.target_price:
-            send_mail(
-                'Price Drop Alert!',
-                f'The product {product.name} has dropped to ₹{price}. Visit: {product.url}',
-                'noreply@yourapp.com',
-                [alert.user.email],
-            )
-            alert.notified = True
-            alert.save()
+def store_changes_only():
+    # Same default as the shipped settings
+    return getattr(settings, 'PRICE_HISTORY_MODE', 'changes') == 'changes'
+
+
+def record_price(product, price):
+    """
+    Add a price observation to a product's history.
+
+    In 'changes' mode (PRICE_HISTORY_MODE) an unchanged price only extends
+    last_seen_at on the current row instead of adding a new one.
+    """
+    now = timezone.now()
+    if store_changes_only():
+        latest = PriceHistory.objects.filter(product=product).order_by('-checked_at', '-id').first()
+        if latest is not None and latest.price == price:
+            PriceHistory.objects.filter(id=latest.id).update(last_seen_at=now)
+            latest.last_seen_at = now
+            record_prices({product.id: price}, now=now)
+            return latest
+    row = PriceHistory.objects.create(product=product, price=price, last_seen_at=now)
+    record_prices({product.id: price}, now=now)
+    return row
+
+
+from django.db.models import F
+
+def with_price_summary(queryset):
+    """
+    Annotate products with latest_price and lowest_price (365-day low) from their PriceStats
+    """
+    return queryset.annotate(latest_price=F('price_stats__current_price'), lowest_price=F('price_stats__min_365'))
+
+
+def saved_products_page(before=None, page_size=50):
+    """
+    Return (products, next_before) for one keyset-paginated page of saved products, newest first.
+
+    `before` is the id of the last product on the previous page; next_before
+    is None on the last page.
+    """
+    queryset = Product.objects.order_by('-id')
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    products = list(with_price_summary(queryset)[:page_size + 1])
+    next_before = products[page_size - 1].id if len(products) > page_size else None
+    return products[:page_size], next_before
+
+
+from django.db import transaction
+from .models import PriceAlert, OutboundEmail
+from .notifications import queue_emails
+
+ALERT_FROM_EMAIL = 'noreply@yourapp.com'
+
+
+def price_alert_email(alert, product, price):
+    """
+    Outbox email for a triggered alert; keyed by alert so it's only ever queued once
+    """
+    return OutboundEmail(
+        dedupe_key=f'price-alert:{alert.id}',
+        subject='Price Drop Alert!',
+        body=f'The product {product.name} has dropped to ₹{price}. Visit: {product.url}',
+        from_email=ALERT_FROM_EMAIL,
+        to_email=alert.user.email,
+    )
+
+
+def triggered_price_alerts():
+    """
+    Pending alerts whose product's latest price is at or below both the
+    alert's target and the product's 365-day low, as a single query
+    """
+    return (
+        PriceAlert.objects.filter(notified=False)
+        .annotate(current_price=F('product__price_stats__current_price'), year_low=F('product__price_stats__min_365'))
+        .filter(current_price__lte=F('target_price'))
+        .filter(current_price__lte=F('year_low'))
+        .select_related('user', 'product')
+    )
+
+
+def evaluate_price_alerts():
+    """
+    Queue notifications for every triggered alert in one pass, meant to run
+    once after a refresh cycle rather than per product. The emails are
+    inserted into the outbox and the alerts marked notified in one
+    transaction; dispatch_notifications sends them. Returns the number of
+    alerts triggered.
+    """
+    alerts = list(triggered_price_alerts())
+    if not alerts:
+        return 0
+    with transaction.atomic():
+        queue_emails([price_alert_email(alert, alert.product, alert.current_price) for alert in alerts])
+        PriceAlert.objects.filter(id__in=[alert.id for alert in alerts]).update(notified=True)
+    return len(alerts)
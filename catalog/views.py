@@ -3,14 +3,19 @@ from .forms import RegisterForm
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from .models import Product, PriceHistory, PriceAlert
+from .models import Product, PriceAlert
+from .canonical import url_digest
 from django.contrib.auth.decorators import login_required
-from .utils import update_product_price, get_lowest_price, check_price_alert
-from .scraper import search_and_scrape
-from django.http import JsonResponse
+from .utils import saved_products_page, record_price
+from .search_cache import cached_search, get_search_cache, normalize_query, search_cache_key
+from .live_search import search_events
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from .images import PLACEHOLDER, cached_name, content_type_for, open_cached, thumbnail_urls
+from .metrics import registry
 from django.views.decorators.csrf import csrf_exempt
+import hmac
 import json
-import time
 
 
 def register(request):
@@ -75,34 +80,113 @@ def home(request):
     if search_query:
         # Live search and scrape across all websites
         messages.info(request, f"Searching for '{search_query}' across all websites...")
-        scraped_results = search_and_scrape(search_query)
+        if getattr(settings, 'SEARCH_STREAMING', True):
+            # Render the page straight away; unless the results are cached,
+            # they stream in from search_stream as each site answers
+            scraped_results = get_search_cache().get(search_cache_key(search_query))
+        else:
+            scraped_results = cached_search(search_query)
         return render(request, "catalog/search_results.html", {
-            "products": scraped_results, 
-            "search_query": search_query
+            "products": scraped_results or [],
+            "search_query": search_query,
+            "stream": scraped_results is None,
         })
     
-    # Show saved products from database
-    products = Product.objects.all().order_by('-id')  # Latest first
+    # Show saved products from database, one keyset page at a time
+    try:
+        before = int(request.GET.get('before', ''))
+    except ValueError:
+        before = None
+    page_size = getattr(settings, 'SAVED_PRODUCTS_PAGE_SIZE', 50)
+    products, next_before = saved_products_page(before=before, page_size=page_size)
+    thumbnails = thumbnail_urls(products)
     product_list = []
     for product in products:
-        latest_price_obj = PriceHistory.objects.filter(product=product).order_by('-checked_at').first()
-        latest_price = latest_price_obj.price if latest_price_obj else "-"
-        lowest_price = get_lowest_price(product)
         product_list.append({
             "id": product.id,
             "name": product.name,
             "site": product.site,
-            "latest_price": latest_price,
-            "lowest_price": lowest_price,
+            "latest_price": product.latest_price if product.latest_price is not None else "-",
+            "lowest_price": product.lowest_price or 0,
             "url": product.url,
             "image_url": product.image_url,
+            "thumbnail_url": thumbnails.get(product.id),
         })
     return render(request, "catalog/product_list.html", {
         "products": product_list, 
-        "search_query": search_query
+        "search_query": search_query,
+        "next_before": next_before,
+        "is_first_page": before is None,
     })
 
 
+async def search_stream(request):
+    """
+    Live search results as Server-Sent Events, one event per site as it answers
+    """
+    search_query = normalize_query(request.GET.get('q', ''))
+    if not search_query:
+        return JsonResponse({'status': 'error', 'message': 'Missing search query'}, status=400)
+    response = StreamingHttpResponse(search_events(search_query), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def cached_image(request, name):
+    """
+    A thumbnail from the local image cache. Names are content hashes, so
+    browsers and proxies may keep them for good.
+    """
+    file = open_cached(name)
+    if file is None:
+        raise Http404("Image not cached")
+    response = FileResponse(file, content_type=content_type_for(name))
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'IMAGE_CACHE_MAX_AGE', 365 * 24 * 3600)}, immutable"
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def product_image(request, product_id):
+    """
+    Redirect to a product's cached thumbnail, or show a placeholder until
+    scrape_prices has cached it
+    """
+    product = get_object_or_404(Product, id=product_id)
+    name = cached_name(product.image_url) if product.image_url else None
+    if name is None:
+        response = HttpResponse(PLACEHOLDER, content_type='image/svg+xml')
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+    response = redirect('cached_image', name=name)
+    # Short-lived: the product's image may change
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+def metrics_allowed(request):
+    """
+    Staff users, requests with the METRICS_TOKEN bearer token, and the
+    addresses in METRICS_ALLOWED_IPS
+    """
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+def metrics(request):
+    """
+    Scrape metrics of this process in the Prometheus text format (see metrics_allowed)
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def set_alert(request, product_id):
     """
@@ -156,8 +240,9 @@ def save_product(request):
             
             # Create or update product
             product, created = Product.objects.get_or_create(
-                url=url,
+                url_hash=url_digest(url),
                 defaults={
+                    'url': url,
                     'name': name,
                     'site': site,
                 }
@@ -169,10 +254,7 @@ def save_product(request):
                 product.save()
             
             # Add price history
-            PriceHistory.objects.create(
-                product=product,
-                price=float(price)
-            )
+            record_price(product, float(price))
             
             if created:
                 return JsonResponse({
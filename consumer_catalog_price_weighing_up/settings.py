@@ -133,3 +133,160 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'your_gmail_address'
 EMAIL_HOST_PASSWORD = 'your_gmail_app_password'  # Use "App Password"!
+
+
+# Scraping
+# Overall deadline (seconds) for a live search across all sites; sites that
+# haven't answered by then are left out of the results.
+SEARCH_DEADLINE = 10
+
+# Per-site request rate limits for price refreshes: (requests per second, burst).
+# Each scrape_prices process enforces them on its own, so with several daemons
+# or shards set them to one process's share.
+SCRAPE_RATE_LIMITS = {
+    'Amazon': (2.0, 4),
+    'Flipkart': (2.0, 4),
+    'Myntra': (1.0, 2),
+    'Ajio': (1.0, 2),
+}
+SCRAPE_DEFAULT_RATE_LIMIT = (1.0, 1)
+
+# Pooled scraper HTTP sessions (catalog.http_client): connections kept per
+# site, and retries with exponential backoff for transient errors
+SCRAPE_POOL_SIZE = 10
+SCRAPE_RETRIES = 2
+SCRAPE_RETRY_BACKOFF = 0.5
+
+# Per-site circuit breakers (catalog.health): after THRESHOLD consecutive
+# failures, or one blocked/captcha response, a site is skipped for COOLDOWN
+# seconds, then probed with a single request. Each failed probe doubles the
+# cooldown, up to MAX_COOLDOWN.
+SCRAPE_BREAKER_THRESHOLD = 5
+SCRAPE_BREAKER_COOLDOWN = 60
+SCRAPE_BREAKER_MAX_COOLDOWN = 1800
+
+# Scrape metrics (catalog.metrics): per-site stage latencies, response and
+# outcome counters, served by /metrics/ in the Prometheus text format to
+# staff users, requests with "Authorization: Bearer <METRICS_TOKEN>" and
+# METRICS_ALLOWED_IPS. The IP check uses REMOTE_ADDR: behind a reverse proxy
+# every request comes from the proxy's address, so don't list it (or
+# 127.0.0.1) there; use the token instead. Each process keeps its own
+# metrics; set SCRAPE_METRICS_FILE to have scrape_prices write its metrics
+# there after every pass (for node_exporter's textfile collector).
+SCRAPE_METRICS = True
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = []
+SCRAPE_METRICS_FILE = None
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Live search results are kept in their own cache; local memory evicts the
+# least recently used entries once MAX_ENTRIES is reached. Point 'search' at
+# a shared backend (Redis, Memcached) to share results between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search-results',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+SEARCH_CACHE_ALIAS = 'search'
+SEARCH_CACHE_TTL = 600  # seconds
+SEARCH_CACHE_PARTIAL_TTL = 60  # when a site missed the search deadline
+
+# Stream live search results to the browser (Server-Sent Events from the
+# async catalog.views.search_stream) as each site answers. Needs an ASGI
+# server (e.g. uvicorn) to actually stream; under WSGI the response is
+# buffered. False waits for every site before rendering the page.
+SEARCH_STREAMING = True
+
+# Answer searches from saved products first (catalog.local_search): a
+# product counts if a scrape confirmed its price within LOCAL_SEARCH_MAX_AGE
+# seconds, and a site is only scraped live when it has fewer than
+# LOCAL_SEARCH_MIN_RESULTS such matches. Uses a FULLTEXT index on MySQL.
+LOCAL_SEARCH = True
+LOCAL_SEARCH_MAX_AGE = 6 * 3600  # seconds
+LOCAL_SEARCH_MIN_RESULTS = 3
+LOCAL_SEARCH_LIMIT = 50
+# MySQL's innodb_ft_min_token_size: shorter query words can't use the FULLTEXT index
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+# Saved products shown per page on the home page (keyset paginated)
+SAVED_PRODUCTS_PAGE_SIZE = 50
+# Cross-site product matching (catalog.matching): minimum title similarity
+# (0..1) for two listings to count as the same item, and how often each
+# process rebuilds its index of saved products (in a background thread) to
+# pick up other processes' changes
+MATCH_THRESHOLD = 0.6
+MATCH_INDEX_MAX_AGE = 3600  # seconds
+
+# Product image cache (catalog.images): with IMAGE_CACHE_ON_REFRESH,
+# scrape_prices fetches each new image URL once, stores it by content hash
+# as a thumbnail of at most IMAGE_THUMBNAIL_SIZE pixels (the original image
+# if Pillow isn't installed), and /images/ serves it with long-lived cache
+# headers; pages show a placeholder until then. The least recently served
+# files, and their CachedImage rows, are evicted once the cache passes
+# IMAGE_CACHE_MAX_BYTES.
+IMAGE_CACHE_ON_REFRESH = True
+IMAGE_CACHE_DIR = BASE_DIR / 'image_cache'
+IMAGE_THUMBNAIL_SIZE = 160
+IMAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+IMAGE_MAX_BYTES = 10 * 1024 * 1024  # largest image downloaded
+IMAGE_CACHE_PRUNE_INTERVAL = 300  # seconds between size checks by scrape_prices
+
+# Largest page the JSON API (/api/search/, /api/products/) returns
+API_MAX_PAGE_SIZE = 200
+
+# Scrape results written per transaction by scrape_prices (catalog.ingest)
+INGEST_BATCH_SIZE = 500
+
+# Refresh schedule (catalog.scheduling) for `manage.py scrape_prices --daemon`.
+# A product is checked every REFRESH_INTERVAL seconds, REFRESH_ALERT_FACTOR
+# times as often with an active price alert, and more often the more its
+# price changed over the last REFRESH_VOLATILITY_WINDOW seconds. Failures
+# back off exponentially. All intervals are clamped to MIN..MAX.
+REFRESH_INTERVAL = 24 * 3600
+REFRESH_MIN_INTERVAL = 15 * 60
+REFRESH_MAX_INTERVAL = 7 * 24 * 3600
+REFRESH_ALERT_FACTOR = 8
+REFRESH_VOLATILITY_WINDOW = 7 * 24 * 3600
+REFRESH_BATCH_SIZE = 200  # due products refreshed per pass
+# --due/--daemon processes claim their batch for REFRESH_LEASE seconds, so
+# several can share one database; a crashed process's products are picked
+# up again once it runs out. Keep it well above the time one pass takes.
+REFRESH_LEASE = 15 * 60
+
+# Parse stage of scrape_prices (catalog.pipeline): with PARSE_PROCESSES > 0
+# pages are parsed in that many worker processes (one per core is a good
+# start) while the --workers threads download. At most PARSE_QUEUE_SIZE
+# downloaded pages (default twice PARSE_PROCESSES) wait for a parser before
+# downloads pause. --parse-processes overrides PARSE_PROCESSES.
+PARSE_PROCESSES = 0
+PARSE_QUEUE_SIZE = None
+
+# 'changes' stores a new price history row only when the price moves and
+# otherwise extends last_seen_at on the current row; 'every' stores a row
+# per scrape. Run `manage.py compact_price_history` after switching.
+PRICE_HISTORY_MODE = 'changes'
+
+# Notification outbox (catalog.notifications), sent by `manage.py dispatch_notifications --loop`
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 60  # seconds, doubled after each failed attempt
+OUTBOX_LEASE_SECONDS = 300
+
+# HTML parser for scraped pages (catalog.parsing): 'auto' uses the fastest
+# installed of 'selectolax', 'lxml' and 'html.parser'. With
+# HTML_PARSER_STRAIN, BeautifulSoup backends only build the elements a page's
+# scraper reads. Changing the backend changes every page's fragment hash, so
+# the next scrape_prices run extracts all products again.
+HTML_PARSER = 'auto'
+HTML_PARSER_STRAIN = True